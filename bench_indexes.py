@@ -0,0 +1,96 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+# Бенчмарк индексов схемы: горячие запросы по индексам миграций и те же запросы
+# с NOT INDEXED (полный просмотр таблицы, как до миграции 2) на синтетической базе.
+#
+#   python bench_indexes.py --rows 1000000 --users 20000
+
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+
+import repository  # noqa: E402
+from timeutil import now_epoch  # noqa: E402
+
+# Запросы: (название, SQL с {table} вместо имени таблицы, параметры от now и user_id)
+QUERIES = (
+    ('due scan', '''
+        SELECT id FROM {table} WHERE is_active = 1 AND sent = 0 AND reminder_time <= ?
+    ''', lambda now, user_id: (now,)),
+    ('list page', '''
+        SELECT id, text, reminder_time, sent, is_active, repeat_type FROM {table}
+        WHERE user_id = ? AND is_active = 1 ORDER BY reminder_time, id LIMIT 9
+    ''', lambda now, user_id: (user_id,)),
+    ('list counts', '''
+        SELECT COUNT(*), SUM(CASE WHEN sent = 0 AND reminder_time < ? THEN 1 ELSE 0 END)
+        FROM {table} WHERE user_id = ? AND is_active = 1
+    ''', lambda now, user_id: (now, user_id)),
+    ('linked', '''
+        SELECT id FROM {table} WHERE original_reminder_id = ?
+    ''', lambda now, user_id: (user_id,)),
+    ('archive batch', '''
+        SELECT id, user_id FROM {table}
+        WHERE sent = 1 AND is_active = 0 AND reminder_time < ? ORDER BY reminder_time LIMIT 500
+    ''', lambda now, user_id: (now - 30 * 86400,)),
+)
+
+
+# Заполнение: reminders за год вокруг текущего момента, 80% уже отправлены
+def fill(conn, rows: int, users: int, seed: int):
+    rng = random.Random(seed)
+    now = now_epoch()
+    batch = []
+    for i in range(rows):
+        sent = rng.random() < 0.8
+        is_active = 0 if sent and rng.random() < 0.7 else 1
+        original = rng.randrange(1, i + 1) if i and rng.random() < 0.05 else None
+        batch.append((rng.randrange(users), 'user', 'текст', now + rng.randrange(-300, 60) * 86400 // 10,
+                      now, is_active, int(sent), original))
+    conn.executemany('''
+        INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at, is_active, sent,
+                               original_reminder_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', batch)
+    conn.commit()
+    conn.execute('ANALYZE')
+
+
+def measure(conn, sql: str, params: tuple, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def plan(conn, sql: str, params: tuple) -> str:
+    return ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Горячие запросы с индексами и без")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    repository.init_db()
+    conn = repository.pool.acquire()
+    fill(conn, args.rows, args.users, args.seed)
+
+    now = now_epoch()
+    print(f"{args.rows} строк, {args.users} пользователей; мс на запрос, без индекса -> с индексом")
+    for name, sql, params in QUERIES:
+        params = params(now, args.users // 2)
+        indexed = sql.format(table='reminders')
+        scanned = sql.format(table='reminders NOT INDEXED')
+        print(f"{name:<14}{measure(conn, scanned, params, args.repeat):>9.2f} ->"
+              f"{measure(conn, indexed, params, args.repeat):>8.2f}   {plan(conn, indexed, params)}")
+
+
+if __name__ == '__main__':
+    main()
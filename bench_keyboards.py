@@ -0,0 +1,150 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+# Бенчмарк клавиатур: готовые и закэшированные клавиатуры keyboards.py против сборки
+# новых объектов telegram на каждый вызов, как в прежнем bot.py. Перед замером
+# проверяется, что обе версии дают одинаковую разметку.
+#
+#   python bench_keyboards.py --calls 20000 --reminders 1000
+
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+
+logging.disable(logging.INFO)
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup  # noqa: E402
+
+import keyboards  # noqa: E402
+from render import DAYS_OF_WEEK  # noqa: E402
+
+
+# Прежние построители: новая разметка и новые кнопки на каждый вызов
+def prior_markup(rows):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=data) for text, data in row]
+                                 for row in rows])
+
+
+def prior_main_menu():
+    return ReplyKeyboardMarkup([
+        [KeyboardButton("Создать напоминание"), KeyboardButton("Мои напоминания")],
+        [KeyboardButton("Ближайшие"), KeyboardButton("🔄"), KeyboardButton("Помощь")]
+    ], resize_keyboard=True, input_field_placeholder="Выберите действие...")
+
+
+def prior_reminder(reminder_id):
+    return prior_markup([[("✅ Выполнено", f"done_{reminder_id}"), ("⏰ Отложить", f"snooze_menu_{reminder_id}")]])
+
+
+def prior_control(reminder_id):
+    return prior_markup([
+        [("📝 Изменить текст", f"edit_text_{reminder_id}"), ("⏰ Изменить время", f"edit_time_{reminder_id}")],
+        [("🔄 Изменить повторение", f"edit_repeat_{reminder_id}"), ("❌ Удалить", f"delete_confirm_{reminder_id}")],
+        [("✅ Выполнить сейчас", f"done_now_{reminder_id}"), ("⏰ Отложить", f"snooze_menu_{reminder_id}")],
+        [("К списку", "back_to_list_0"), ("🔙", "back_to_start")],
+    ])
+
+
+def prior_snooze(reminder_id):
+    return prior_markup([
+        [("5 мин", f"snooze_5_{reminder_id}"), ("15 мин", f"snooze_15_{reminder_id}"),
+         ("30 мин", f"snooze_30_{reminder_id}")],
+        [("1 час", f"snooze_60_{reminder_id}"), ("2 часа", f"snooze_120_{reminder_id}"),
+         ("Завтра", f"snooze_tomorrow_{reminder_id}")],
+        [("🔙", f"view_{reminder_id}")],
+    ])
+
+
+def prior_repeat(reminder_id=None):
+    prefix = f"edit_repeat_type_{reminder_id}_" if reminder_id else "repeat_"
+    return prior_markup([
+        [("📌 Один раз", f"{prefix}once"), ("📅 Ежедневно", f"{prefix}daily")],
+        [("🗓️ Еженедельно", f"{prefix}weekly"), ("📆 Выбрать дни", f"{prefix}custom")],
+        [("🔙", f"view_{reminder_id}")] if reminder_id else [("⏭️ Пропустить", "repeat_skip")],
+    ])
+
+
+def prior_daily_interval(reminder_id=None):
+    prefix = f"edit_interval_{reminder_id}_" if reminder_id else "interval_"
+    buttons = [(text, f"{prefix}{interval}") for interval, text in keyboards.DAILY_INTERVALS]
+    back = f"edit_repeat_{reminder_id}" if reminder_id else "interval_back"
+    return prior_markup([buttons[start:start + 2] for start in range(0, len(buttons), 2)] + [[("🔙", back)]])
+
+
+def prior_days(selected_days=None, reminder_id=None):
+    selected_days = selected_days or []
+    buttons = [(f"{'✅' if day_num in selected_days else '◻️'} {day_name[:3]}",
+                f"edit_day_{reminder_id}_{day_num}" if reminder_id else f"day_{day_num}")
+               for day_num, day_name in DAYS_OF_WEEK.items()]
+    footer = [("✅ Готово", f"edit_days_done_{reminder_id}" if reminder_id else "days_done"),
+              ("❌ Отмена", f"edit_repeat_{reminder_id}" if reminder_id else "days_cancel")]
+    return prior_markup([buttons[start:start + 2] for start in range(0, len(buttons), 2)] + [footer])
+
+
+def days_of(mask):
+    return [day_num for day_num in range(7) if mask >> day_num & 1]
+
+
+# Сценарии: (название, вызов прежнего построителя, вызов keyboards.py) для id напоминания из нагрузки
+CASES = (
+    ('главное меню', lambda i: prior_main_menu(), lambda i: keyboards.create_main_menu()),
+    ('уведомление', prior_reminder, keyboards.create_reminder_keyboard),
+    ('карточка', prior_control, keyboards.create_reminder_control_keyboard),
+    ('отложить', prior_snooze, keyboards.create_snooze_options_keyboard),
+    ('повторение', prior_repeat, keyboards.create_repeat_keyboard),
+    ('интервал', lambda i: prior_daily_interval(), lambda i: keyboards.create_daily_interval_keyboard()),
+    ('дни (создание)', lambda i: prior_days(days_of(i)), lambda i: keyboards.create_days_keyboard(days_of(i))),
+    ('дни (изменение)', lambda i: prior_days(days_of(i * 7), i),
+     lambda i: keyboards.create_days_keyboard(days_of(i * 7), i)),
+)
+
+
+def check_equal(reminder_ids):
+    for name, prior, current in CASES:
+        for reminder_id in reminder_ids:
+            if prior(reminder_id).to_dict() != current(reminder_id).to_dict():
+                raise SystemExit(f"{name}: разметка отличается для напоминания {reminder_id}")
+
+
+# Время на вызов (мкс) и пик выделенной памяти на вызов (байт) для вызовов build по ids
+def measure(build, ids):
+    for reminder_id in ids:
+        build(reminder_id)
+    started = time.perf_counter()
+    for reminder_id in ids:
+        build(reminder_id)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    built = [build(reminder_id) for reminder_id in ids]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    return elapsed / len(ids) * 1e6, peak / len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Клавиатуры: кэш и шаблоны против сборки на каждый вызов")
+    parser.add_argument('--calls', type=int, default=20_000)
+    parser.add_argument('--reminders', type=int, default=1000, help="напоминаний, к которым обращаются повторно")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ids = [rng.randint(1, args.reminders) for _ in range(args.calls)]
+    check_equal(range(1, 200))
+
+    print(f"{args.calls} вызовов по {args.reminders} напоминаниям; мкс и байт на вызов, прежде -> сейчас")
+    for name, prior, current in CASES:
+        prior_time, prior_memory = measure(prior, ids)
+        current_time, current_memory = measure(current, ids)
+        print(f"{name:<18}{prior_time:>7.1f} ->{current_time:>5.1f} мкс   "
+              f"{prior_memory:>7.0f} ->{current_memory:>5.0f} байт")
+    print(keyboards.keyboard_cache.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import timeit
+from typing import Optional
+
+# Бенчмарк текста уведомлений: render.reminder_message (шаблон, экранирование Markdown,
+# кэш форматированного времени) против прежнего build_reminder_message из bot.py.
+# Кроме времени считается, в скольких уведомлениях прежний код ломал разметку Markdown
+# (Telegram отвечает на такие сообщения "can't parse entities").
+#
+#   python bench_render.py --count 100000
+
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+
+logging.disable(logging.INFO)
+
+import render  # noqa: E402
+from timeutil import format_epoch  # noqa: E402
+
+# Часовые пояса пользователей нагрузки (None - часовой пояс по умолчанию)
+ZONES = ('Europe/Moscow', 'Asia/Yekaterinburg', 'Europe/Kaliningrad', 'Asia/Novosibirsk', None)
+
+
+# Прежний текст уведомления: время форматируется на каждый вызов, текст не экранируется
+def prior_reminder_message(text: str, reminder_ts: int, postponed_count: int, repeat_type: str,
+                           tz: Optional[str] = None) -> str:
+    time_formatted = format_epoch(reminder_ts, tz=tz)
+    postponed = f"\n⏰ Откладывалось: {postponed_count} раз" if postponed_count > 0 else ""
+    repeat_info = "\n🔄 *Повторяющееся напоминание*" if repeat_type != 'once' else ""
+    return f"""
+💭 *напоминание*{repeat_info}
+
+📝 {text}
+⏰ {time_formatted}{postponed}
+
+Выберите действие:
+    """
+
+
+# Разбор Markdown первой версии, как у Telegram: вне сущности '\' экранирует _*`[,
+# сущность _ * ` ``` длится до своего закрывающего символа, [текст](url) - ссылка.
+# Возвращает False, если Telegram не принял бы сообщение.
+def parses(message: str) -> bool:
+    i, n = 0, len(message)
+    while i < n:
+        char = message[i]
+        if char == '\\' and i + 1 < n and message[i + 1] in '_*`[':
+            i += 2
+        elif char in '_*`':
+            if message.startswith('```', i):
+                end = message.find('```', i + 3)
+                i = end + 3
+            else:
+                end = message.find(char, i + 1)
+                i = end + 1
+            if end < 0:
+                return False
+        elif char == '[':
+            end = message.find(']', i + 1)
+            if end < 0:
+                return False
+            i = end + 1
+            if i < n and message[i] == '(':
+                end = message.find(')', i)
+                if end < 0:
+                    return False
+                i = end + 1
+        else:
+            i += 1
+    return True
+
+
+# Уведомления нагрузки: сроки с точностью до минуты в пределах часа, тексты отчасти
+# с символами Markdown, как в именах файлов и формулах
+def notifications(count: int, seed: int):
+    rng = random.Random(seed)
+    base = 1_800_000_000 // 60 * 60
+    texts = ("купить молоко", "позвонить маме", "отчёт_за_квартал", "2*3=6", "запустить `make`", "[срочно] оплата")
+    return [(f"{rng.choice(texts)} {i}", base + rng.randrange(60) * 60, rng.choice((0, 0, 0, 1, 3)),
+             rng.choice(('once', 'daily', 'custom')), rng.choice(ZONES)) for i in range(count)]
+
+
+def best_of(build, rows, repeat: int) -> float:
+    return min(timeit.repeat(lambda: [build(*row) for row in rows], number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Текст уведомлений: render.py против прежнего построителя")
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rows = notifications(args.count, args.seed)
+    prior_broken = sum(not parses(prior_reminder_message(*row)) for row in rows)
+    current_broken = sum(not parses(render.reminder_message(*row)) for row in rows)
+
+    prior = best_of(prior_reminder_message, rows, args.repeat)
+    render.format_time.cache_clear()
+    cold = timeit.timeit(lambda: [render.reminder_message(*row) for row in rows], number=1)
+    current = best_of(render.reminder_message, rows, args.repeat)
+
+    print(f"{args.count} уведомлений, мкс на уведомление")
+    print(f"прежний построитель   {prior / args.count * 1e6:6.2f}   сломанная разметка: {prior_broken}")
+    print(f"render.py             {current / args.count * 1e6:6.2f}   сломанная разметка: {current_broken}")
+    print(f"render.py, первый проход с пустым кэшем времени {cold / args.count * 1e6:6.2f}")
+    print(f"format_time: {render.format_time.cache_info()}")
+
+
+if __name__ == '__main__':
+    main()
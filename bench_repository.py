@@ -0,0 +1,75 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import timeit
+from datetime import timedelta
+
+# Бенчмарк слоя доступа к данным: пул долгоживущих соединений repository.py против
+# отдельного соединения на каждый вызов (так работал бот до repository.py).
+# База - временный файл, REMINDERS_DB задаётся до импорта repository.
+#
+#   python bench_repository.py --ops 2000
+
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+
+import repository  # noqa: E402
+from timeutil import now_in  # noqa: E402
+
+USERS = 50
+
+
+# Соединение на каждый вызов без настроек пула - как до repository.py
+class ConnectPerCall:
+    def __init__(self, path: str):
+        self.path = path
+
+    def acquire(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def release(self, conn: sqlite3.Connection):
+        conn.close()
+
+
+# Микросекунд на операцию для каждой функции репозитория
+def run(ops: int) -> dict:
+    when = now_in() + timedelta(days=1)
+    ids = []
+    steps = {
+        'save_reminder_to_db': lambda i: ids.append(
+            repository.save_reminder_to_db(i % USERS, 'user', 'текст напоминания', when)),
+        # Чтение из БД, кэш карточек (user-010) не участвует
+        'get_reminder_info': lambda i: repository._load_reminder_info(ids[i]),
+        'postpone_reminder': lambda i: repository.postpone_reminder(ids[i], 5),
+        'mark_as_done': lambda i: repository.mark_as_done(ids[i]),
+    }
+
+    result = {}
+    for name, step in steps.items():
+        counter = iter(range(ops))
+        seconds = timeit.timeit(lambda: step(next(counter)), number=ops)
+        result[name] = seconds / ops * 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пул соединений против соединения на вызов")
+    parser.add_argument('--ops', type=int, default=2000, help="операций каждого вида")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    repository.init_db()
+
+    pooled = run(args.ops)
+    repository.pool.close()
+    repository.pool = ConnectPerCall(repository.DB_PATH)
+    per_call = run(args.ops)
+
+    print(f"{'операция':<22}{'соединение на вызов':>22}{'пул':>12}")
+    for name in pooled:
+        print(f"{name:<22}{per_call[name]:>19.1f} мкс{pooled[name]:>8.1f} мкс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import timeit
+
+# Бенчмарк разбора callback_data: маршрутизатор бота (router.py) против цепочки
+# if/elif по startswith в порядке прежнего handle_callback_query.
+#
+#   python bench_router.py --count 100000
+
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+os.environ.setdefault('BOT_TOKEN_REMINDER', '123456:BENCH')
+
+logging.disable(logging.INFO)
+
+from bot import callback_router  # noqa: E402
+
+# Префиксы прежней цепочки в порядке проверки и разбор их аргументов (с кнопками страниц списка)
+CHAIN = (
+    ('back_to_list_', lambda args: (int(args[-1]),)),
+    ('list_page_', lambda args: (int(args[-1]),)),
+    ('list_next_', lambda args: tuple(map(int, args))),
+    ('list_prev_', lambda args: tuple(map(int, args))),
+    ('view_', lambda args: (int(args[-1]),)),
+    ('delete_confirm_', lambda args: (int(args[-1]),)),
+    ('delete_yes_', lambda args: (int(args[-1]),)),
+    ('done_now_', lambda args: (int(args[-1]),)),
+    ('edit_text_', lambda args: (int(args[-1]),)),
+    ('edit_time_', lambda args: (int(args[-1]),)),
+    ('edit_repeat_', lambda args: (int(args[-1]),)),
+    ('edit_repeat_type_', lambda args: (int(args[0]), args[1])),
+    ('edit_interval_', lambda args: (int(args[0]), int(args[1]))),
+    ('edit_day_', lambda args: (int(args[0]), int(args[1]))),
+    ('edit_days_done_', lambda args: (int(args[-1]),)),
+    ('repeat_', lambda args: (args[-1],)),
+    ('interval_', lambda args: (int(args[-1]),)),
+    ('day_', lambda args: (int(args[-1]),)),
+    ('done_', lambda args: (int(args[-1]),)),
+    ('snooze_menu_', lambda args: (int(args[-1]),)),
+    ('snooze_', lambda args: (args[0], int(args[1]))),
+)
+EXACT = ('back_to_start', 'create_new', 'list_page_current', 'interval_back', 'days_done', 'days_cancel')
+
+
+def chain_resolve(data: str):
+    if data in EXACT:
+        return data, ()
+    for prefix, parse in CHAIN:
+        if data.startswith(prefix):
+            try:
+                return prefix, parse(data[len(prefix):].split('_'))
+            except (ValueError, IndexError):
+                return None
+    return None
+
+
+# Наборы кнопок: все виды поровну и кнопки под уведомлениями (самые частые в работе бота)
+def button_mixes(count: int, seed: int):
+    rng = random.Random(seed)
+
+    def reminder_id():
+        return rng.randrange(1, 10 ** 6)
+
+    every_kind = [
+        lambda: 'back_to_start', lambda: 'create_new', lambda: 'list_page_current',
+        lambda: f"back_to_list_{rng.randrange(5)}", lambda: f"view_{reminder_id()}",
+        lambda: f"list_next_{rng.randrange(5)}_{rng.randrange(10 ** 9)}_{reminder_id()}",
+        lambda: f"delete_confirm_{reminder_id()}", lambda: f"delete_yes_{reminder_id()}",
+        lambda: f"done_now_{reminder_id()}", lambda: f"edit_text_{reminder_id()}",
+        lambda: f"edit_repeat_{reminder_id()}", lambda: f"edit_repeat_type_{reminder_id()}_daily",
+        lambda: f"edit_day_{reminder_id()}_{rng.randrange(7)}", lambda: 'repeat_once',
+        lambda: f"interval_{rng.choice((1, 2, 7))}", lambda: f"day_{rng.randrange(7)}",
+        lambda: f"done_{reminder_id()}", lambda: f"snooze_menu_{reminder_id()}",
+        lambda: f"snooze_{rng.choice((5, 15, 30, 60))}_{reminder_id()}",
+    ]
+    notification = [
+        lambda: f"done_{reminder_id()}", lambda: f"snooze_menu_{reminder_id()}",
+        lambda: f"snooze_{rng.choice((5, 15, 30, 60))}_{reminder_id()}",
+        lambda: f"snooze_tomorrow_{reminder_id()}",
+    ]
+    return {
+        'все виды кнопок': [rng.choice(every_kind)() for _ in range(count)],
+        'кнопки уведомлений': [rng.choice(notification)() for _ in range(count)],
+    }
+
+
+def best_of(resolve, buttons, repeat: int) -> float:
+    return min(timeit.repeat(lambda: [resolve(data) for data in buttons], number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Разбор callback_data: маршрутизатор против цепочки if/elif")
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.count} кнопок, лучшее из {args.repeat}, мс")
+    for name, buttons in button_mixes(args.count, args.seed).items():
+        chain_failed = sum(chain_resolve(data) is None for data in buttons)
+        router_failed = sum(callback_router.resolve(data) is None for data in buttons)
+        print(f"{name:<20} цепочка {best_of(chain_resolve, buttons, args.repeat) * 1000:7.1f}"
+              f"   маршрутизатор {best_of(callback_router.resolve, buttons, args.repeat) * 1000:7.1f}"
+              f"   не разобрано: цепочкой {chain_failed}, маршрутизатором {router_failed}")
+
+
+if __name__ == '__main__':
+    main()
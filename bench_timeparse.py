@@ -0,0 +1,77 @@
+import argparse
+import re
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+# Бенчмарк разбора времени: timeparse.parse_datetime против прежнего разбора в bot.py
+# (цепочка startswith и strptime). Холодный прогон очищает кэш разбора перед каждой строкой.
+#
+#   python bench_timeparse.py --count 20000
+
+import timeparse
+
+TEXTS = ('сегодня 20:30', 'завтра 10:00', '25.12.2026 15:45', '15:30', 'через 2 часа', 'через 30 минут',
+         'через 1 день', 'абракадабра')
+
+
+# Прежний разбор из bot.py (без поясов и без сообщения об ошибке)
+def legacy_parse(text: str) -> datetime:
+    current_time = datetime.now()
+    text = text.lower().strip()
+    if text.startswith('сегодня'):
+        time_str = text.replace('сегодня', '').strip()
+        if ':' in time_str:
+            result = datetime.combine(current_time.date(), datetime.strptime(time_str, '%H:%M').time())
+            return result + timedelta(days=1) if result < current_time else result
+    elif text.startswith('завтра'):
+        time_str = text.replace('завтра', '').strip()
+        return datetime.combine(current_time.date() + timedelta(days=1), datetime.strptime(time_str, '%H:%M').time())
+    elif re.match(r'\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}', text):
+        return datetime.strptime(text, '%d.%m.%Y %H:%M')
+    elif re.match(r'^\d{1,2}:\d{2}$', text):
+        result = datetime.combine(current_time.date(), datetime.strptime(text, '%H:%M').time())
+        return result + timedelta(days=1) if result < current_time else result
+    elif 'через' in text:
+        units = (('час', 'hours'), ('минут', 'minutes'), ('д', 'days'))
+        for stem, unit in units:
+            matches = re.findall(r'\d+', text)
+            if stem in text and matches:
+                return current_time + timedelta(**{unit: int(matches[0])})
+    raise ValueError(text)
+
+
+def run(parse, texts):
+    for text in texts:
+        try:
+            parse(text)
+        except ValueError:
+            pass
+
+
+def cold_parse(text, tz='Europe/Moscow'):
+    timeparse._resolve.cache_clear()
+    return timeparse.parse_datetime(text, tz)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Разбор времени: timeparse против прежнего разбора")
+    parser.add_argument('--count', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    texts = [TEXTS[i % len(TEXTS)] for i in range(args.count)]
+    print(f"{args.count} строк, лучшее из {args.repeat}, разборов в секунду")
+    # Перевод в пояс пользователя (pytz) дороже самого разбора, поэтому UTC показан отдельно
+    for name, parse in (('прежний разбор', legacy_parse),
+                        ('timeparse, холодный', cold_parse),
+                        ('timeparse, с кэшем', lambda text: timeparse.parse_datetime(text, 'Europe/Moscow')),
+                        ('timeparse, UTC, холодный', lambda text: cold_parse(text, 'UTC')),
+                        ('timeparse, UTC, с кэшем', lambda text: timeparse.parse_datetime(text, 'UTC'))):
+        best = min(timeit.repeat(lambda: run(parse, texts), number=1, repeat=args.repeat))
+        print(f"{name:<26}{args.count / best:>12,.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
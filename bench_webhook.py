@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# Бенчмарк вебхука: записанные обновления Telegram (JSON, по одному в строке) отправляются
+# POST-запросами в ingress.WebhookServer, обработчики bot.py отвечают тестовому Bot API
+# (fake_bot_api.py, отдельный процесс) с задержкой --latency на вызов. Всё работает
+# на 127.0.0.1, без сети.
+# Результат для каждого --concurrency: обновлений в секунду, p50/p99 времени обработчика
+# и времени от POST до конца обработки, наибольшее число одновременно работавших обработчиков
+# и число нарушений порядка (обновление пользователя начато до конца его предыдущего).
+#
+#   python bench_webhook.py --users 500 --per-user 4 --concurrency 1 32 128
+#   python bench_webhook.py --save updates.jsonl            # записать сгенерированные обновления
+#   python bench_webhook.py --updates updates.jsonl         # прогнать записанные
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Бот читает адрес Bot API при импорте: тестовый API поднимается на заранее выбранном порту
+API_PORT = _free_port()
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+os.environ['TELEGRAM_API_URL'] = f"http://127.0.0.1:{API_PORT}"
+os.environ.setdefault('BOT_TOKEN_REMINDER', '123456:BENCH')
+# Приложение без Updater, как в режиме вебхука; сам вебхук в Telegram не регистрируется
+os.environ['WEBHOOK_URL'] = 'https://bench.invalid'
+
+logging.disable(logging.WARNING)
+
+import bot  # noqa: E402
+from fake_bot_api import FakeBotApi  # noqa: E402
+from ingress import SECRET_HEADER, PerUserUpdateProcessor, WebhookServer  # noqa: E402
+from userstate import UserStateStore  # noqa: E402
+
+SECRET = 'bench-secret'
+FIRST_USER_ID = 100000
+
+# Сообщения пользователей: команды и кнопки главного меню
+ACTIONS = ('/start', 'Мои напоминания', 'Ближайшие', 'Помощь')
+
+
+# Процессор обновлений бота, который запоминает время обработки каждого обновления
+class RecordingProcessor(PerUserUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # update_id -> (начало, конец обработки)
+        self.handled: Dict[int, tuple] = {}
+
+    async def do_process_update(self, update, coroutine):
+        async def timed():
+            started = time.perf_counter()
+            try:
+                await coroutine
+            finally:
+                self.handled[update.update_id] = (started, time.perf_counter())
+
+        await super().do_process_update(update, timed())
+
+
+# Обновления: per_user сообщений от каждого из users пользователей вперемешку
+def generate(users: int, per_user: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    senders = [FIRST_USER_ID + user for user in range(users) for _ in range(per_user)]
+    rng.shuffle(senders)
+
+    updates = []
+    for update_id, user_id in enumerate(senders, 1):
+        text = rng.choice(ACTIONS)
+        message = {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        updates.append({'update_id': update_id, 'message': message})
+    return updates
+
+
+async def _read_status(reader: asyncio.StreamReader) -> int:
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+# Отправка обновлений по connections соединениям keep-alive, как это делает Telegram
+async def post_all(port: int, updates: List[Dict], connections: int) -> Dict[int, float]:
+    posted: Dict[int, float] = {}
+    pending = iter(updates)
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            for update in pending:
+                body = json.dumps(update, ensure_ascii=False).encode()
+                writer.write(
+                    f"POST {bot.WEBHOOK_PATH} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                    f"Content-Type: application/json\r\n{SECRET_HEADER}: {SECRET}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                posted[update['update_id']] = time.perf_counter()
+                status = await _read_status(reader)
+                if status != 200:
+                    raise RuntimeError(f"вебхук ответил {status} на обновление {update['update_id']}")
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return posted
+
+
+# Прогон всех обновлений через вебхук при concurrency одновременно обрабатываемых обновлений
+async def run(updates: List[Dict], concurrency: int, connections: int, timeout: float):
+    bot.CONCURRENT_UPDATES = concurrency
+    bot.PerUserUpdateProcessor = RecordingProcessor
+    # Свежее хранилище состояния: пользователи прошлого прогона не считаются загруженными
+    bot.user_state = UserStateStore(load=bot.storage.load_user_state, save=bot.storage.save_user_states)
+    application = bot.build_application()
+    processor = application.update_processor
+    server = WebhookServer(application, host='127.0.0.1', port=0, webhook_path=bot.WEBHOOK_PATH,
+                           secret_token=SECRET)
+
+    async with application:
+        await application.start()
+        bot.user_state.start()
+        await server.start()
+        try:
+            started = time.perf_counter()
+            posted = await post_all(server.port, updates, connections)
+            deadline = time.monotonic() + timeout
+            while len(processor.handled) < len(updates):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"обработано {len(processor.handled)} из {len(updates)} за {timeout} с")
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+        finally:
+            await server.stop()
+            await application.stop()
+            await bot.user_state.stop()
+    return elapsed, posted, processor.handled
+
+
+# Отправитель обновления (сообщение, нажатие кнопки и т.п.), None - без пользователя
+def sender(update: Dict):
+    for payload in update.values():
+        if isinstance(payload, dict) and 'from' in payload:
+            return payload['from']['id']
+    return None
+
+
+# Нарушения порядка: обновление пользователя начато раньше, чем закончилось его предыдущее
+def order_violations(updates: List[Dict], handled: Dict[int, tuple]) -> int:
+    finished_by_user: Dict[int, float] = {}
+    violations = 0
+    for update in sorted(updates, key=lambda update: update['update_id']):
+        user_id = sender(update)
+        if user_id is None:
+            continue
+        started, finished = handled[update['update_id']]
+        if started < finished_by_user.get(user_id, started):
+            violations += 1
+        finished_by_user[user_id] = finished
+    return violations
+
+
+# Наибольшее число одновременно работавших обработчиков
+def peak_parallel(handled: Dict[int, tuple]) -> int:
+    events = sorted([(started, 1) for started, _ in handled.values()] +
+                    [(finished, -1) for _, finished in handled.values()])
+    running = peak = 0
+    for _, step in events:
+        running += step
+        peak = max(peak, running)
+    return peak
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# Тестовый Bot API в отдельном процессе, чтобы его работа не отнимала время у цикла событий бота
+async def serve_api(port: int, latency: float):
+    api = FakeBotApi(port=port, latency=latency)
+    await api.start()
+    await asyncio.Event().wait()
+
+
+def spawn_api(latency: float) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-api', str(API_PORT),
+                                '--latency', str(latency)])
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', API_PORT), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("тестовый Bot API не запустился")
+            time.sleep(0.1)
+
+
+async def main_async(args):
+    if args.updates:
+        with open(args.updates, encoding='utf-8') as file:
+            updates = [json.loads(line) for line in file if line.strip()]
+    else:
+        updates = generate(args.users, args.per_user, args.seed)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(update, ensure_ascii=False) + '\n' for update in updates)
+
+    api = spawn_api(args.latency)
+    await bot.storage.initialize()
+    try:
+        users = len({sender(update) for update in updates} - {None})
+        print(f"{len(updates)} обновлений от {users} пользователей, {args.connections} соединений, "
+              f"задержка Bot API {args.latency * 1000:.0f} мс")
+        print(f"{'слотов':>7}{'обн/с':>9}   обработчик p50/p99, мс   от POST p50/p99, мс"
+              f"   параллельно   нарушений порядка")
+        for concurrency in args.concurrency:
+            elapsed, posted, handled = await run(updates, concurrency, args.connections, args.timeout)
+            handler = [finished - started for started, finished in handled.values()]
+            total = [handled[update_id][1] - posted[update_id] for update_id in handled]
+            print(f"{concurrency:>7}{len(updates) / elapsed:>9.0f}"
+                  f"   {percentile(handler, 0.5) * 1000:8.1f} /{percentile(handler, 0.99) * 1000:8.1f}"
+                  f"   {percentile(total, 0.5) * 1000:8.1f} /{percentile(total, 0.99) * 1000:8.1f}"
+                  f"{peak_parallel(handled):>14}{order_violations(updates, handled):>20}")
+    finally:
+        await bot.storage.close()
+        api.terminate()
+        api.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность и задержка обработки вебхука")
+    parser.add_argument('--updates', help="файл с записанными обновлениями (JSON по одному в строке)")
+    parser.add_argument('--save', help="записать прогоняемые обновления в файл")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--per-user', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[bot.CONCURRENT_UPDATES])
+    parser.add_argument('--connections', type=int, default=40, help="соединений, как max_connections вебхука")
+    parser.add_argument('--latency', type=float, default=0.02, help="задержка Bot API на вызов, секунды")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve-api', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_api:
+        asyncio.run(serve_api(args.serve_api, args.latency))
+    else:
+        asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,32 @@
 import logging
 import os
-import sqlite3
 import asyncio
 import time
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from datetime import datetime, timedelta
-import re
 from typing import Dict, List, Tuple, Optional
-from flask import Flask
-from threading import Thread
+import signal
+import secrets
+from scheduler import reminder_scheduler
+from repository import ALL_USERS, Shard
+from storage import create_storage
+from delivery import CatchUpBacklog, Delivery, DeliveryJournal, DeliveryPipeline, SENT
+from metrics import Gauge, maintenance_rows, monitor_loop_lag, queue_depth
+from ingress import PerUserUpdateProcessor, WebhookServer
+from timeutil import from_epoch, format_epoch, now_epoch, now_in, resolve_timezone
+from router import CallbackRouter
+from timeparse import parse_datetime
+from userstate import UserStateStore
+from render import (
+    HOUR_FORMS, MINUTE_FORMS, WEEKDAY_EVERY, bold, created_message, details_message, digest_message,
+    escape_markdown, interval_text, plural, reminder_message, repeat_text, repeating_item, upcoming_item
+)
+from keyboards import (
+    AFTER_ACTION_KEYBOARD, EMPTY_LIST_KEYBOARD, FULL_LIST_KEYBOARD, LIST_PAGE_SIZE, TO_LIST_KEYBOARD,
+    create_daily_interval_keyboard, create_days_keyboard, create_days_saved_keyboard, create_delete_confirm_keyboard,
+    create_details_keyboard, create_digest_keyboard, create_main_menu, create_reminder_control_keyboard,
+    create_reminder_keyboard, create_reminders_list_keyboard, create_repeat_keyboard, create_snooze_options_keyboard
+)
 
 # Настройка логирования для Railway
 logging.basicConfig(
@@ -24,272 +41,41 @@ logger = logging.getLogger(__name__)
 # Токен бота - будет установлен через Railway Variables
 BOT_TOKEN = os.environ.get('BOT_TOKEN_REMINDER')
 
-# Дни недели для повторения
-DAYS_OF_WEEK = {
-    0: "Понедельник",
-    1: "Вторник", 
-    2: "Среда",
-    3: "Четверг",
-    4: "Пятница",
-    5: "Саббота",
-    6: "Воскресенье"
-}
-
-# Инициализация базы данных
-def init_db():
-    # Проверяем, существует ли файл БД
-    db_path = 'reminders.db'
-    logger.info(f"Инициализация базы данных: {db_path}")
-    
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS reminders (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        user_name TEXT,
-        text TEXT NOT NULL,
-        reminder_time DATETIME NOT NULL,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        is_active BOOLEAN DEFAULT 1,
-        sent BOOLEAN DEFAULT 0,
-        postponed_count INTEGER DEFAULT 0,
-        repeat_type TEXT DEFAULT 'once',
-        repeat_days TEXT DEFAULT '',
-        repeat_interval INTEGER DEFAULT 1,
-        next_reminder_time DATETIME,
-        original_reminder_id INTEGER DEFAULT NULL
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    logger.info("База данных инициализирована")
-
-init_db()
-
-# Создание основного меню
-def create_main_menu():
-    keyboard = [
-        [KeyboardButton("Создать напоминание"), KeyboardButton("Мои напоминания")],
-        [KeyboardButton("Ближайшие"), KeyboardButton("🔄"), KeyboardButton("Помощь")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, input_field_placeholder="Выберите действие...")
-
-# Создание клавиатуры списка напоминаний
-def create_reminders_list_keyboard(reminders: List[Dict], page: int = 0, page_size: int = 8):
-    keyboard = []
-    
-    # Рассчитываем, какие напоминания показывать на текущей странице
-    start_idx = page * page_size
-    end_idx = start_idx + page_size
-    page_reminders = reminders[start_idx:end_idx]
-    
-    for reminder in page_reminders:
-        time_str = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m %H:%M')
-        text_preview = reminder['text'][:15] + "..." if len(reminder['text']) > 15 else reminder['text']
-        
-        # Добавляем эмодзи для статуса
-        if reminder['sent']:
-            status = "✅"
-        elif reminder['is_active']:
-            current_time = datetime.now()
-            reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-            if reminder_time < current_time:
-                status = "⚠️"
-            else:
-                status = "⏳"
-        else:
-            status = "❌"
-        
-        # Добавляем эмодзи для повторения
-        if reminder['repeat_type'] != 'once':
-            repeat_emoji = "🔄"
-        else:
-            repeat_emoji = ""
-        
-        button_text = f"{status} {time_str} {text_preview} {repeat_emoji}"
-        callback_data = f"view_{reminder['id']}"
-        keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
-    
-    # Добавляем кнопки навигации
-    nav_buttons = []
-    total_pages = (len(reminders) + page_size - 1) // page_size
-    
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"list_page_{page-1}"))
-    
-    nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data="list_page_current"))
-    
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"list_page_{page+1}"))
-    
-    if nav_buttons:
-        keyboard.append(nav_buttons)
-    
-    # Кнопка возврата
-    keyboard.append([InlineKeyboardButton("🔙", callback_data="back_to_start")])
-    
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для управления напоминанием
-def create_reminder_control_keyboard(reminder_id: int):
-    keyboard = [
-        [
-            InlineKeyboardButton("📝 Изменить текст", callback_data=f"edit_text_{reminder_id}"),
-            InlineKeyboardButton("⏰ Изменить время", callback_data=f"edit_time_{reminder_id}")
-        ],
-        [
-            InlineKeyboardButton("🔄 Изменить повторение", callback_data=f"edit_repeat_{reminder_id}"),
-            InlineKeyboardButton("❌ Удалить", callback_data=f"delete_confirm_{reminder_id}")
-        ],
-        [
-            InlineKeyboardButton("✅ Выполнить сейчас", callback_data=f"done_now_{reminder_id}"),
-            InlineKeyboardButton("⏰ Отложить", callback_data=f"snooze_menu_{reminder_id}")
-        ],
-        [
-            InlineKeyboardButton("К списку", callback_data="back_to_list_0"),
-            InlineKeyboardButton("🔙", callback_data="back_to_start")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для подтверждения удаления
-def create_delete_confirm_keyboard(reminder_id: int):
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Да, удалить", callback_data=f"delete_yes_{reminder_id}"),
-            InlineKeyboardButton("❌ Нет, отмена", callback_data=f"view_{reminder_id}")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для выбора типа повторения
-def create_repeat_keyboard(reminder_id: int = None):
-    callback_prefix = f"edit_repeat_type_{reminder_id}_" if reminder_id else "repeat_"
-    
-    keyboard = [
-        [
-            InlineKeyboardButton("📌 Один раз", callback_data=f"{callback_prefix}once"),
-            InlineKeyboardButton("📅 Ежедневно", callback_data=f"{callback_prefix}daily")
-        ],
-        [
-            InlineKeyboardButton("🗓️ Еженедельно", callback_data=f"{callback_prefix}weekly"),
-            InlineKeyboardButton("📆 Выбрать дни", callback_data=f"{callback_prefix}custom")
-        ]
-    ]
-    
-    if reminder_id:
-        keyboard.append([
-            InlineKeyboardButton("🔙", callback_data=f"view_{reminder_id}")
-        ])
-    else:
-        keyboard.append([
-            InlineKeyboardButton("⏭️ Пропустить", callback_data="repeat_skip")
-        ])
-    
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для ежедневного интервала
-def create_daily_interval_keyboard(reminder_id: int = None):
-    callback_prefix = f"edit_interval_{reminder_id}_" if reminder_id else "interval_"
-    
-    keyboard = []
-    row = []
-    
-    intervals = [1, 2, 3, 7, 14, 30]
-    
-    for interval in intervals:
-        if interval == 1:
-            text = "Каждый день"
-        elif interval == 7:
-            text = "Раз в неделю"
-        elif interval == 14:
-            text = "Раз в 2 недели"
-        elif interval == 30:
-            text = "Раз в месяц"
-        else:
-            text = f"Каждые {interval} дня"
-        
-        row.append(InlineKeyboardButton(text, callback_data=f"{callback_prefix}{interval}"))
-        
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    
-    if row:
-        keyboard.append(row)
-    
-    back_callback = f"edit_repeat_{reminder_id}" if reminder_id else "interval_back"
-    keyboard.append([
-        InlineKeyboardButton("🔙", callback_data=back_callback)
-    ])
-    
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для выбора дней недели
-def create_days_keyboard(selected_days: List[int] = None, reminder_id: int = None):
-    if selected_days is None:
-        selected_days = []
-    
-    keyboard = []
-    row = []
-    
-    for day_num, day_name in DAYS_OF_WEEK.items():
-        if day_num in selected_days:
-            emoji = "✅"
-        else:
-            emoji = "◻️"
-        
-        callback_data = f"edit_day_{reminder_id}_{day_num}" if reminder_id else f"day_{day_num}"
-        row.append(InlineKeyboardButton(f"{emoji} {day_name[:3]}", callback_data=callback_data))
-        
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    
-    if row:
-        keyboard.append(row)
-    
-    done_callback = f"edit_days_done_{reminder_id}" if reminder_id else "days_done"
-    cancel_callback = f"edit_repeat_{reminder_id}" if reminder_id else "days_cancel"
-    
-    keyboard.append([
-        InlineKeyboardButton("✅ Готово", callback_data=done_callback),
-        InlineKeyboardButton("❌ Отмена", callback_data=cancel_callback)
-    ])
-    
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для напоминания (для уведомлений)
-def create_reminder_keyboard(reminder_id: int):
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Выполнено", callback_data=f"done_{reminder_id}"),
-            InlineKeyboardButton("⏰ Отложить", callback_data=f"snooze_menu_{reminder_id}")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-# Создание клавиатуры для выбора времени откладывания
-def create_snooze_options_keyboard(reminder_id: int):
-    keyboard = [
-        [
-            InlineKeyboardButton("5 мин", callback_data=f"snooze_5_{reminder_id}"),
-            InlineKeyboardButton("15 мин", callback_data=f"snooze_15_{reminder_id}"),
-            InlineKeyboardButton("30 мин", callback_data=f"snooze_30_{reminder_id}")
-        ],
-        [
-            InlineKeyboardButton("1 час", callback_data=f"snooze_60_{reminder_id}"),
-            InlineKeyboardButton("2 часа", callback_data=f"snooze_120_{reminder_id}"),
-            InlineKeyboardButton("Завтра", callback_data=f"snooze_tomorrow_{reminder_id}")
-        ],
-        [
-            InlineKeyboardButton("🔙", callback_data=f"view_{reminder_id}")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+# Адрес Bot API. Для нагрузочных тестов - локальная замена (fake_bot_api.py, loadtest.py)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+BOT_API_BASE_URL = f"{TELEGRAM_API_URL}/bot"
+BOT_API_FILE_URL = f"{TELEGRAM_API_URL}/file/bot"
+
+# Публичный адрес сервиса (например, https://bot.up.railway.app). Если задан - бот работает через вебхук,
+# иначе получает обновления опросом. HTTP-сервер с /health и /metrics работает в обоих режимах.
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+# Секрет, который Telegram передаёт в заголовке вебхука. Без WEBHOOK_SECRET при запуске
+# создаётся случайный и регистрируется в set_webhook
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+PORT = int(os.environ.get('PORT', 8080))
+
+# Сколько обновлений разных пользователей обрабатывается одновременно;
+# обновления одного пользователя всегда обрабатываются по порядку
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', 32))
+
+# Как часто (в секундах) изменённые состояния диалогов записываются в БД
+USER_STATE_FLUSH_INTERVAL = float(os.environ.get('USER_STATE_FLUSH_INTERVAL', 5))
+
+# Сколько пользователей держать в памяти с загруженным состоянием диалога
+USER_STATE_CACHE_SIZE = int(os.environ.get('USER_STATE_CACHE_SIZE', 10000))
+
+# Хранилище данных: SQLite или PostgreSQL по DATABASE_URL.
+# Схема создаётся/обновляется в storage.initialize() при запуске.
+storage = create_storage()
+
+# Состояние диалогов пользователей переживает перезапуск бота
+user_state = UserStateStore(
+    load=storage.load_user_state,
+    save=storage.save_user_states,
+    flush_interval=USER_STATE_FLUSH_INTERVAL,
+    max_users=USER_STATE_CACHE_SIZE
+)
 
 # Команда /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -314,37 +100,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(welcome_text, reply_markup=keyboard)
 
 # Показать список напоминаний с кнопками
-async def show_reminders_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+async def show_reminders_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0,
+                              cursor: Optional[Tuple[int, int]] = None, direction: str = 'next'):
     user_id = update.message.from_user.id if update.message else update.callback_query.from_user.id
     
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    # Получаем все активные напоминания пользователя
-    cursor.execute('''
-        SELECT * FROM reminders 
-        WHERE user_id = ? 
-        AND is_active = 1
-        ORDER BY reminder_time
-    ''', (user_id,))
+    # Счётчики одним агрегатным запросом, строки - только текущей страницы
+    total_count, overdue_count, upcoming_count = await storage.get_reminder_counts(user_id)
     
-    columns = [column[0] for column in cursor.description]
-    reminders = []
-    for row in cursor.fetchall():
-        reminder_dict = dict(zip(columns, row))
-        reminders.append(reminder_dict)
-    
-    conn.close()
-    
-    if not reminders:
+    if total_count == 0:
         if update.callback_query:
             await update.callback_query.answer()
             await update.callback_query.edit_message_text(
                 "💭 У вас пока нет активных напоминаний.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Создать напоминание", callback_data="create_new")],
-                    [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-                ])
+                reply_markup=EMPTY_LIST_KEYBOARD
             )
         else:
             await update.message.reply_text(
@@ -353,19 +121,24 @@ async def show_reminders_list(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
         return
     
-    # Создаем клавиатуру со списком
-    keyboard = create_reminders_list_keyboard(reminders, page)
+    reminders, has_more = await storage.get_reminders_page(user_id, cursor, direction, LIST_PAGE_SIZE)
+    
+    # Страница опустела (напоминания удалены) - начинаем с первой
+    if not reminders and cursor is not None:
+        page, cursor, direction = 0, None, 'next'
+        reminders, has_more = await storage.get_reminders_page(user_id, None, 'next', LIST_PAGE_SIZE)
     
-    current_time = datetime.now()
-    upcoming_count = 0
-    overdue_count = 0
+    if direction == 'next':
+        has_next = has_more
+    else:
+        # Листали назад: следующая страница есть, а первая ли это - видно по has_more
+        has_next = True
+        if not has_more:
+            page = 0
     
-    for reminder in reminders:
-        reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-        if reminder_time >= current_time and not reminder['sent']:
-            upcoming_count += 1
-        elif reminder_time < current_time and not reminder['sent']:
-            overdue_count += 1
+    # Создаем клавиатуру со списком
+    tz = await storage.user_timezone(user_id)
+    keyboard = create_reminders_list_keyboard(reminders, page, total_count, has_next, tz=tz)
     
     status_text = ""
     if overdue_count > 0:
@@ -377,7 +150,7 @@ async def show_reminders_list(update: Update, context: ContextTypes.DEFAULT_TYPE
 💭 *Список всех напоминаний*
 
 {status_text}
-Всего: {len(reminders)} напоминаний
+Всего: {total_count} напоминаний
 
 ✨Выберите напоминание для изменения:
     """
@@ -393,15 +166,12 @@ async def show_reminder_details(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    reminder = get_reminder_info(reminder_id)
+    reminder = await storage.get_reminder_info(reminder_id)
     
     if not reminder:
         await query.edit_message_text(
             "❌ Напоминание не найдено или было удалено.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("К списку", callback_data="back_to_list_0")],
-                [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-            ])
+            reply_markup=TO_LIST_KEYBOARD
         )
         return
     
@@ -409,77 +179,12 @@ async def show_reminder_details(update: Update, context: ContextTypes.DEFAULT_TY
     if query.from_user.id != reminder['user_id']:
         await query.edit_message_text(
             "❌ У вас нет доступа к этому напоминанию.",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("К списку", callback_data="back_to_list_0")],
-                [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-            ])
+            reply_markup=TO_LIST_KEYBOARD
         )
         return
     
-    reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-    time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
-    created_str = datetime.strptime(reminder['created_at'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-    
-    current_time = datetime.now()
-    time_diff = reminder_time - current_time
-    
-    # Статус напоминания
-    if reminder['sent']:
-        status = "✅ *Выполнено*"
-    elif not reminder['is_active']:
-        status = "❌ *Неактивно*"
-    elif reminder_time < current_time:
-        status = "⚠️ *Просрочено*"
-    else:
-        status = "⏳ *Ожидает*"
-        
-        days = time_diff.days
-        hours = time_diff.seconds // 3600
-        minutes = (time_diff.seconds % 3600) // 60
-        
-        time_left_parts = []
-        if days > 0:
-            time_left_parts.append(f"{days} д.")
-        if hours > 0:
-            time_left_parts.append(f"{hours} ч.")
-        if minutes > 0:
-            time_left_parts.append(f"{minutes} мин.")
-        
-        time_left = " ".join(time_left_parts) if time_left_parts else "менее минуты"
-        status += f"\n⏱️ *Через:* {time_left}"
-    
-    # Информация о повторении
-    repeat_info = ""
-    if reminder['repeat_type'] != 'once':
-        repeat_info = "\n\n🔄 *Повторение:* "
-        if reminder['repeat_type'] == 'daily':
-            if reminder['repeat_interval'] == 1:
-                repeat_info += "Каждый день"
-            else:
-                repeat_info += f"Каждые {reminder['repeat_interval']} дня"
-        elif reminder['repeat_type'] == 'weekly':
-            day_name = DAYS_OF_WEEK[reminder_time.weekday()]
-            repeat_info += f"Каждый {day_name}"
-        elif reminder['repeat_type'] == 'custom':
-            days_list = [DAYS_OF_WEEK[int(d)] for d in reminder['repeat_days'].split(',') if d]
-            days_str = ', '.join([d for d in days_list])
-            repeat_info += f"По {days_str}"
-    
-    if reminder['postponed_count'] > 0:
-        postponed = f"\n⏰ *Откладывалось:* {reminder['postponed_count']} раз"
-    else:
-        postponed = ""
-    
-    response = f"""
-💭 *Детали напоминания*
-
-{status}
-
-📝 *Текст:* {reminder['text']}
-⏰ *Время:* {time_str}
-
-🌟*Выберите действие:*
-    """
+    tz = await storage.user_timezone(reminder['user_id'])
+    response = details_message(reminder, from_epoch(reminder['reminder_time'], tz), now_in(tz))
     
     keyboard = create_reminder_control_keyboard(reminder_id)
     await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
@@ -488,26 +193,8 @@ async def show_reminder_details(update: Update, context: ContextTypes.DEFAULT_TY
 async def show_repeating_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
     # Ищем оригинальные повторяющиеся напоминания
-    cursor.execute('''
-        SELECT * FROM reminders 
-        WHERE user_id = ? 
-        AND is_active = 1 
-        AND repeat_type != 'once'
-        AND original_reminder_id IS NULL
-        ORDER BY created_at DESC
-    ''', (user_id,))
-    
-    repeating_reminders = []
-    columns = [column[0] for column in cursor.description]
-    for row in cursor.fetchall():
-        reminder_dict = dict(zip(columns, row))
-        repeating_reminders.append(reminder_dict)
-    
-    conn.close()
+    repeating_reminders = await storage.get_repeating_reminders(user_id)
     
     if not repeating_reminders:
         await update.message.reply_text(
@@ -517,347 +204,44 @@ async def show_repeating_reminders(update: Update, context: ContextTypes.DEFAULT
         return
     
     response = "🔄 *Повторяющиеся напоминания:*\n\n"
+    tz = await storage.user_timezone(user_id)
     
     for i, reminder in enumerate(repeating_reminders, 1):
-        time_str = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S').strftime('%H:%M')
-        
-        response += f"{i}. *{reminder['text']}*\n"
-        response += f"   🕐 Время: {time_str}\n"
-        
-        if reminder['repeat_type'] == 'daily':
-            if reminder['repeat_interval'] == 1:
-                response += f"   🔄 Повтор: Каждый день\n"
-            else:
-                response += f"   🔄 Повтор: Каждые {reminder['repeat_interval']} дня\n"
-        
-        elif reminder['repeat_type'] == 'weekly':
-            days_list = [DAYS_OF_WEEK[int(d)] for d in reminder['repeat_days'].split(',') if d]
-            days_str = ', '.join([d[:3] for d in days_list])
-            response += f"   🔄 Повтор: По {days_str}\n"
-        
-        elif reminder['repeat_type'] == 'custom':
-            days_list = [DAYS_OF_WEEK[int(d)] for d in reminder['repeat_days'].split(',') if d]
-            days_str = ', '.join([d[:3] for d in days_list])
-            response += f"   🔄 Повтор: По {days_str}\n"
-        
-        response += f"   🆔 ID: {reminder['id']}\n\n"
+        response += repeating_item(i, reminder, tz)
     
     response += f"📊 *Всего повторяющихся:* {len(repeating_reminders)}"
     
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("Весь список", callback_data="back_to_list_0")],
-        [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-    ])
-    
-    await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
+    await update.message.reply_text(response, parse_mode='Markdown', reply_markup=FULL_LIST_KEYBOARD)
 
 # Показать 3 БЛИЖАЙШИХ напоминания
 async def show_three_upcoming_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM reminders 
-        WHERE user_id = ? 
-        AND is_active = 1 
-        AND sent = 0
-        ORDER BY reminder_time
-    ''', (user_id,))
-    
-    columns = [column[0] for column in cursor.description]
-    all_reminders = []
-    for row in cursor.fetchall():
-        reminder_dict = dict(zip(columns, row))
-        all_reminders.append(reminder_dict)
+    # Счётчики одним агрегатным запросом, строки - только трёх ближайших
+    _, overdue_count, upcoming_count = await storage.get_reminder_counts(user_id)
     
-    conn.close()
-    
-    if not all_reminders:
+    if overdue_count + upcoming_count == 0:
         await update.message.reply_text("💭 У вас пока нет активных напоминаний.")
         return
     
-    current_time = datetime.now()
-    upcoming = []
-    
-    for reminder in all_reminders:
-        reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-        if reminder_time >= current_time:
-            upcoming.append(reminder)
+    nearest = await storage.get_upcoming_reminders(user_id, 3)
     
-    if not upcoming:
+    if not nearest:
         await update.message.reply_text("⏰ Нет предстоящих напоминаний.")
         return
     
-    upcoming.sort(key=lambda x: datetime.strptime(x['reminder_time'], '%Y-%m-%d %H:%M:%S'))
-    nearest = upcoming[:3]
+    tz = await storage.user_timezone(user_id)
+    current_time = now_in(tz)
     
     response = "✨ *Три ближайших напоминания:*\n\n"
     
     for i, reminder in enumerate(nearest, 1):
-        reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-        time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
-        time_diff = reminder_time - current_time
-        
-        days = time_diff.days
-        hours = time_diff.seconds // 3600
-        minutes = (time_diff.seconds % 3600) // 60
-        
-        time_left_parts = []
-        if days > 0:
-            time_left_parts.append(f"{days} д.")
-        if hours > 0:
-            time_left_parts.append(f"{hours} ч.")
-        if minutes > 0:
-            time_left_parts.append(f"{minutes} мин.")
-        
-        time_left = " ".join(time_left_parts) if time_left_parts else "менее минуты"
-        
-        if days == 0 and hours < 1:
-            urgency = "🔴"
-        elif days == 0 and hours < 3:
-            urgency = "🟠"
-        else:
-            urgency = "🟢"
-        
-        if reminder['postponed_count'] > 0:
-            postponed = f" (отложено {reminder['postponed_count']} раз)"
-        else:
-            postponed = ""
-        
-        response += f"{urgency} *{i}. {reminder['text']}*{postponed}\n"
-        response += f"   🕐 {time_str}\n"
-        response += f"   ⏱️ Через: {time_left}\n\n"
-    
-    if len(upcoming) > 3:
-        response += f"💭 И ещё {len(upcoming) - 3} напоминаний..."
-    
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("Весь список", callback_data="back_to_list_0")],
-        [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-    ])
-    
-    await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
-
-# Парсинг даты и времени
-def parse_datetime(text: str) -> datetime:
-    current_time = datetime.now()
-    text = text.lower().strip()
-    
-    try:
-        if text.startswith('сегодня'):
-            time_str = text.replace('сегодня', '').strip()
-            if ':' in time_str:
-                time_obj = datetime.strptime(time_str, '%H:%M').time()
-                result = datetime.combine(current_time.date(), time_obj)
-                if result < current_time:
-                    result += timedelta(days=1)
-                return result
-        
-        elif text.startswith('завтра'):
-            time_str = text.replace('завтра', '').strip()
-            time_obj = datetime.strptime(time_str, '%H:%M').time()
-            result = datetime.combine(current_time.date() + timedelta(days=1), time_obj)
-            return result
-        
-        elif re.match(r'\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}', text):
-            return datetime.strptime(text, '%d.%m.%Y %H:%M')
-        
-        elif re.match(r'^\d{1,2}:\d{2}$', text):
-            time_obj = datetime.strptime(text, '%H:%M').time()
-            result = datetime.combine(current_time.date(), time_obj)
-            if result < current_time:
-                result += timedelta(days=1)
-            return result
-        
-        elif 'через' in text:
-            if 'час' in text or 'часа' in text or 'часов' in text:
-                matches = re.findall(r'\d+', text)
-                if matches:
-                    hours = int(matches[0])
-                    return current_time + timedelta(hours=hours)
-            elif 'минут' in text:
-                matches = re.findall(r'\d+', text)
-                if matches:
-                    minutes = int(matches[0])
-                    return current_time + timedelta(minutes=minutes)
-            elif 'день' in text or 'дня' in text or 'дней' in text:
-                matches = re.findall(r'\d+', text)
-                if matches:
-                    days = int(matches[0])
-                    return current_time + timedelta(days=days)
-        
-        # Попробуем распознать относительное время
-        time_patterns = {
-            'через час': timedelta(hours=1),
-            'через 30 минут': timedelta(minutes=30),
-            'через 15 минут': timedelta(minutes=15),
-            'через 5 минут': timedelta(minutes=5),
-        }
-        
-        for pattern, delta in time_patterns.items():
-            if pattern in text:
-                return current_time + delta
-        
-    except Exception as e:
-        logger.error(f"Ошибка парсинга времени '{text}': {e}")
-    
-    raise ValueError(f"Не удалось распознать время: '{text}'. Используйте форматы: 'сегодня 20:30', 'завтра 10:00', '25.12.2024 15:45', '15:30', 'через 2 часа', 'через 30 минут'")
-
-# Сохранение напоминания
-def save_reminder_to_db(user_id: int, user_name: str, text: str, reminder_time: datetime, 
-                        repeat_type: str = 'once', repeat_days: str = '', 
-                        repeat_interval: int = 1, original_reminder_id: int = None) -> int:
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    time_str = reminder_time.strftime('%Y-%m-%d %H:%M:%S')
-    
-    cursor.execute('''
-    INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at,
-                          repeat_type, repeat_days, repeat_interval, original_reminder_id)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, user_name, text, time_str, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-          repeat_type, repeat_days, repeat_interval, original_reminder_id))
-    
-    reminder_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
-    logger.info(f"Создано напоминание {reminder_id} для пользователя {user_id}, тип: {repeat_type}")
-    return reminder_id
-
-# Обновление напоминания
-def update_reminder(reminder_id: int, **kwargs):
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    if 'reminder_time' in kwargs and isinstance(kwargs['reminder_time'], datetime):
-        kwargs['reminder_time'] = kwargs['reminder_time'].strftime('%Y-%m-%d %H:%M:%S')
-    
-    set_clause = ', '.join([f"{key} = ?" for key in kwargs.keys()])
-    values = list(kwargs.values())
-    values.append(reminder_id)
-    
-    cursor.execute(f'''
-        UPDATE reminders 
-        SET {set_clause}
-        WHERE id = ?
-    ''', values)
-    
-    conn.commit()
-    conn.close()
-    
-    logger.info(f"Обновлено напоминание {reminder_id}")
-
-# Удаление напоминания
-def delete_reminder(reminder_id: int):
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    # Сначала получаем информацию о напоминании
-    cursor.execute('SELECT repeat_type, original_reminder_id FROM reminders WHERE id = ?', (reminder_id,))
-    result = cursor.fetchone()
-    
-    if result:
-        repeat_type, original_id = result
-        
-        # Если это повторяющееся напоминание и оригинальное, удаляем все связанные
-        if repeat_type != 'once' and original_id is None:
-            cursor.execute('DELETE FROM reminders WHERE original_reminder_id = ?', (reminder_id,))
-        
-        # Удаляем само напоминание
-        cursor.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
+        response += upcoming_item(i, reminder, from_epoch(reminder['reminder_time'], tz), current_time)
     
-    conn.commit()
-    conn.close()
+    if upcoming_count > len(nearest):
+        response += f"💭 И ещё {upcoming_count - len(nearest)} напоминаний..."
     
-    logger.info(f"Удалено напоминание {reminder_id}")
-    return True
-
-# Обновление времени напоминания (откладывание)
-def postpone_reminder(reminder_id: int, minutes: int):
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT reminder_time FROM reminders WHERE id = ?', (reminder_id,))
-    result = cursor.fetchone()
-    
-    if result:
-        old_time = datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S')
-        new_time = old_time + timedelta(minutes=minutes)
-        new_time_str = new_time.strftime('%Y-%m-%d %H:%M:%S')
-        
-        cursor.execute('''
-            UPDATE reminders 
-            SET reminder_time = ?, sent = 0, postponed_count = postponed_count + 1 
-            WHERE id = ?
-        ''', (new_time_str, reminder_id))
-        
-        conn.commit()
-        conn.close()
-        return new_time
-    
-    conn.close()
-    return None
-
-# Отложить на завтра
-def postpone_to_tomorrow(reminder_id: int):
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT reminder_time FROM reminders WHERE id = ?', (reminder_id,))
-    result = cursor.fetchone()
-    
-    if result:
-        old_time = datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S')
-        new_time = old_time + timedelta(days=1)
-        new_time_str = new_time.strftime('%Y-%m-%d %H:%M:%S')
-        
-        cursor.execute('''
-            UPDATE reminders 
-            SET reminder_time = ?, sent = 0, postponed_count = postponed_count + 1 
-            WHERE id = ?
-        ''', (new_time_str, reminder_id))
-        
-        conn.commit()
-        conn.close()
-        return new_time
-    
-    conn.close()
-    return None
-
-# Пометить как выполненное
-def mark_as_done(reminder_id: int):
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE reminders 
-        SET sent = 1, is_active = 0 
-        WHERE id = ?
-    ''', (reminder_id,))
-    
-    conn.commit()
-    conn.close()
-    
-    logger.info(f"Напоминание {reminder_id} помечено как выполненное")
-
-# Получить информацию о напоминании
-def get_reminder_info(reminder_id: int):
-    conn = sqlite3.connect('reminders.db', check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM reminders WHERE id = ?', (reminder_id,))
-    reminder = cursor.fetchone()
-    
-    conn.close()
-    
-    if reminder:
-        return dict(reminder)
-    return None
+    await update.message.reply_text(response, parse_mode='Markdown', reply_markup=FULL_LIST_KEYBOARD)
 
 # Создание напоминания
 async def create_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -884,17 +268,17 @@ async def handle_reminder_text(update: Update, context: ContextTypes.DEFAULT_TYP
         context.user_data['reminder_step'] = 'waiting_date'
         
         response = f"""
-💭 Текст: *{text}*
+💭 Текст: {bold(text)}
 
 Теперь введите дату и время напоминания:
 
 🌟 *Форматы даты:*
 • Сегодня 20:30
-• Завтра 10:00
+• Завтра 10:00, послезавтра в 9 утра
+• В пятницу 18:00
 • 25.12.2024 15:45
 • 15:30 (если время уже прошло, будет на завтра)
-• через 2 часа
-• через 30 минут
+• через 2 часа 30 минут
 • через 1 день
         """
         
@@ -905,9 +289,9 @@ async def handle_reminder_datetime(update: Update, context: ContextTypes.DEFAULT
     if context.user_data.get('reminder_step') == 'waiting_date':
         try:
             time_text = update.message.text.strip()
-            reminder_time = parse_datetime(time_text)
+            reminder_time = parse_datetime(time_text, await storage.user_timezone(update.message.from_user.id))
             
-            current_time = datetime.now()
+            current_time = now_in()
             if reminder_time <= current_time:
                 await update.message.reply_text("❌ Время должно быть в будущем! Пожалуйста, укажите будущее время.")
                 return
@@ -918,7 +302,7 @@ async def handle_reminder_datetime(update: Update, context: ContextTypes.DEFAULT
             time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
             
             response = f"""
-💭 Текст: *{context.user_data['reminder_text']}*
+💭 Текст: {bold(context.user_data['reminder_text'])}
 🌟 Время: *{time_str}*
 
 Теперь выберите тип повторения:
@@ -961,13 +345,17 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *Форматы времени:*
 • Сегодня 20:30
-• Завтра 10:00
+• Завтра 10:00, послезавтра в 9 утра
+• В пятницу 18:00
 • 25.12.2024 15:45
 • 15:30 (автоматически на завтра если время прошло)
-• через 2 часа
-• через 30 минут
+• через 2 часа 30 минут
 • через 1 день
 
+*Часовой пояс:*
+/timezone - показать текущий
+/timezone Europe/Berlin или /timezone UTC+3 - изменить
+
 *Важно:*
 🌟 Бот работает 24/7
 🌟 Уведомления приходят автоматически
@@ -976,563 +364,532 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
-# Обработка callback-кнопок
-async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
+# Команда /timezone: показать или изменить часовой пояс пользователя
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.message.from_user.id
     
-    callback_data = query.data
-    user_id = query.from_user.id
+    if not context.args:
+        tz = await storage.user_timezone(user_id)
+        await update.message.reply_text(
+            f"🌍 Ваш часовой пояс: `{tz}`\n"
+            f"Сейчас у вас: {now_in(tz).strftime('%d.%m.%Y %H:%M')}\n\n"
+            f"Изменить: /timezone Europe/Berlin или /timezone UTC+3",
+            parse_mode='Markdown'
+        )
+        return
     
-    # Обработка возврата в начало
-    if callback_data == 'back_to_start':
-        welcome_text = f"""
-💭 Возвращаемся в главное меню...
-
-Используйте кнопки ниже для навигации:
-        """
-        
-        keyboard = create_main_menu()
-        
-        # Нельзя редактировать сообщение с reply_markup (обычной клавиатурой) в inline-сообщении
-        # Поэтому просто отправляем новое сообщение
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=welcome_text,
-            reply_markup=keyboard
+    tz = resolve_timezone(' '.join(context.args))
+    if tz is None:
+        await update.message.reply_text(
+            "❌ Не удалось распознать часовой пояс. Примеры: `Europe/Moscow`, `Asia/Almaty`, `UTC+3`",
+            parse_mode='Markdown'
         )
         return
     
-    # Обработка создания нового напоминания
-    elif callback_data == 'create_new':
-        context.user_data['reminder_step'] = 'waiting_text'
-        
-        text = """
+    await storage.set_user_timezone(user_id, tz)
+    await update.message.reply_text(
+        f"✅ Часовой пояс изменён на `{tz}`\nСейчас у вас: {now_in(tz).strftime('%d.%m.%Y %H:%M')}",
+        parse_mode='Markdown',
+        reply_markup=create_main_menu()
+    )
+
+callback_router = CallbackRouter()
+
+# Обработка callback-кнопок
+async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    await callback_router.dispatch(update, context)
+
+# Обработка возврата в начало
+@callback_router.route('back_to_start')
+async def on_back_to_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    welcome_text = f"""
+💭 Возвращаемся в главное меню...
+
+Используйте кнопки ниже для навигации:
+    """
+
+    keyboard = create_main_menu()
+
+    # Нельзя редактировать сообщение с reply_markup (обычной клавиатурой) в inline-сообщении
+    # Поэтому просто отправляем новое сообщение
+    await context.bot.send_message(
+        chat_id=update.callback_query.from_user.id,
+        text=welcome_text,
+        reply_markup=keyboard
+    )
+
+# Обработка создания нового напоминания
+@callback_router.route('create_new')
+async def on_create_new(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['reminder_step'] = 'waiting_text'
+
+    text = """
 💭 *Создание напоминания*
 
 Введите текст напоминания:
-        """
-        
-        await query.edit_message_text(text, parse_mode='Markdown')
-        return
-    
-    # Обработка возврата к списку
-    elif callback_data.startswith('back_to_list_'):
-        page = int(callback_data.split('_')[-1])
-        await show_reminders_list(update, context, page)
-        return
-    
-    # Обработка навигации по страницам списка
-    elif callback_data.startswith('list_page_'):
-        if callback_data == 'list_page_current':
-            await query.answer(f"Текущая страница", show_alert=False)
-            return
-        
-        page = int(callback_data.split('_')[-1])
-        await show_reminders_list(update, context, page)
-        return
-    
-    # Обработка просмотра напоминания
-    elif callback_data.startswith('view_'):
-        reminder_id = int(callback_data.split('_')[1])
-        await show_reminder_details(update, context, reminder_id)
-        return
-    
-    # Обработка удаления напоминания (подтверждение)
-    elif callback_data.startswith('delete_confirm_'):
-        reminder_id = int(callback_data.split('_')[2])
-        
-        response = """
+    """
+
+    await update.callback_query.edit_message_text(text, parse_mode='Markdown')
+
+# Обработка возврата к списку (кнопки старого формата list_page_N открывают первую страницу)
+@callback_router.route('back_to_list_', int)
+@callback_router.route('list_page_', int)
+async def on_back_to_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
+    await show_reminders_list(update, context)
+
+# Обработка навигации по страницам списка: list_next_/list_prev_{страница}_{время}_{id}
+@callback_router.route('list_next_', int, int, int, direction='next')
+@callback_router.route('list_prev_', int, int, int, direction='prev')
+async def on_list_page(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                       page: int, reminder_ts: int, reminder_id: int, direction: str):
+    await show_reminders_list(update, context, page, (reminder_ts, reminder_id), direction)
+
+@callback_router.route('list_page_current')
+async def on_list_page_current(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    pass
+
+# Обработка просмотра напоминания
+@callback_router.route('view_', int)
+async def on_view(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    await show_reminder_details(update, context, reminder_id)
+
+# Обработка удаления напоминания (подтверждение)
+@callback_router.route('delete_confirm_', int)
+async def on_delete_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    response = """
 💭 *Подтверждение удаления*
 
 Вы уверены, что хотите удалить это напоминание?
 
 ❌ Это действие нельзя отменить!
-        """
-        
-        keyboard = create_delete_confirm_keyboard(reminder_id)
-        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка подтверждения удаления
-    elif callback_data.startswith('delete_yes_'):
-        reminder_id = int(callback_data.split('_')[2])
-        reminder = get_reminder_info(reminder_id)
-        
-        if reminder and reminder['user_id'] == user_id:
-            delete_reminder(reminder_id)
-            
-            response = f"""
+    """
+
+    keyboard = create_delete_confirm_keyboard(reminder_id)
+    await update.callback_query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка подтверждения удаления
+@callback_router.route('delete_yes_', int)
+async def on_delete_yes(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    query = update.callback_query
+    reminder = await storage.get_reminder_info(reminder_id)
+
+    if reminder and reminder['user_id'] == query.from_user.id:
+        await storage.delete_reminder(reminder_id)
+
+        response = f"""
 💭 *Напоминание удалено!*
 
-📝 {reminder['text']}
-⏰ {datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}
-            """
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📋 К списку", callback_data="back_to_list_0")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="back_to_start")]
-            ])
-            
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка "Выполнить сейчас"
-    elif callback_data.startswith('done_now_'):
-        reminder_id = int(callback_data.split('_')[2])
-        reminder = get_reminder_info(reminder_id)
-        
-        if reminder and reminder['user_id'] == user_id:
-            mark_as_done(reminder_id)
-            
-            response = f"""
-💭 *Напоминание выполнено!*
+📝 {escape_markdown(reminder['text'])}
+⏰ {format_epoch(reminder['reminder_time'], tz=await storage.user_timezone(reminder['user_id']))}
+        """
 
-📝 {reminder['text']}
-⏰ {datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}
-            """
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📋 К списку", callback_data="back_to_list_0")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="back_to_start")]
-            ])
-            
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка изменения текста
-    elif callback_data.startswith('edit_text_'):
-        reminder_id = int(callback_data.split('_')[2])
-        context.user_data['edit_reminder_id'] = reminder_id
-        context.user_data['edit_step'] = 'waiting_new_text'
-        
-        response = """
-💭 *Изменение текста напоминания*
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=AFTER_ACTION_KEYBOARD)
 
-Введите новый текст напоминания:
+# Обработка "Выполнить сейчас"
+@callback_router.route('done_now_', int)
+async def on_done_now(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    query = update.callback_query
+    reminder = await storage.get_reminder_info(reminder_id)
+
+    if reminder and reminder['user_id'] == query.from_user.id:
+        await storage.mark_as_done(reminder_id)
+
+        response = f"""
+💭 *Напоминание выполнено!*
+
+📝 {escape_markdown(reminder['text'])}
+⏰ {format_epoch(reminder['reminder_time'], tz=await storage.user_timezone(reminder['user_id']))}
         """
-        
-        await query.edit_message_text(response, parse_mode='Markdown')
-        return
-    
-    # Обработка изменения времени
-    elif callback_data.startswith('edit_time_'):
-        reminder_id = int(callback_data.split('_')[2])
-        context.user_data['edit_reminder_id'] = reminder_id
-        context.user_data['edit_step'] = 'waiting_new_time'
-        
-        response = """
-💭 *Изменение времени напоминания*
 
-Введите новое время напоминания:
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=AFTER_ACTION_KEYBOARD)
 
-💫 *Форматы даты:*
+# Обработка изменения текста
+@callback_router.route('edit_text_', int)
+async def on_edit_text(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    context.user_data['edit_reminder_id'] = reminder_id
+    context.user_data['edit_step'] = 'waiting_new_text'
+
+    response = """
+💭 *Изменение текста напоминания*
+
+Введите новый текст напоминания:
+    """
+
+    await update.callback_query.edit_message_text(response, parse_mode='Markdown')
+
+# Обработка изменения времени
+@callback_router.route('edit_time_', int)
+async def on_edit_time(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    context.user_data['edit_reminder_id'] = reminder_id
+    context.user_data['edit_step'] = 'waiting_new_time'
+
+    response = """
+💭 *Изменение времени напоминания*
+
+Введите новое время напоминания:
+
+💫 *Форматы даты:*
 • Сегодня 20:30
 • Завтра 10:00
+• В пятницу 18:00
 • 25.12.2024 15:45
 • 15:30
-• через 2 часа
-• через 30 минут
-        """
-        
-        await query.edit_message_text(response, parse_mode='Markdown')
-        return
-    
-    # Обработка изменения повторения
-    elif callback_data.startswith('edit_repeat_'):
-        reminder_id = int(callback_data.split('_')[2])
-        context.user_data['edit_reminder_id'] = reminder_id
-        
-        response = """
+• через 2 часа 30 минут
+    """
+
+    await update.callback_query.edit_message_text(response, parse_mode='Markdown')
+
+# Обработка изменения повторения
+@callback_router.route('edit_repeat_', int)
+async def on_edit_repeat(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    context.user_data['edit_reminder_id'] = reminder_id
+
+    response = """
 🔄 *Изменение повторения напоминания*
 
 Выберите новый тип повторения:
-        """
-        
-        keyboard = create_repeat_keyboard(reminder_id)
-        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка выбора типа повторения при редактировании
-    elif callback_data.startswith('edit_repeat_type_'):
-        parts = callback_data.split('_')
-        reminder_id = int(parts[3])
-        repeat_type = parts[4]
-        
-        context.user_data['edit_reminder_id'] = reminder_id
-        context.user_data['edit_repeat_type'] = repeat_type
-        
-        if repeat_type == 'once':
-            # Просто обновляем напоминание
-            update_reminder(reminder_id, repeat_type='once', repeat_days='', repeat_interval=1)
-            
-            response = f"""
+    """
+
+    keyboard = create_repeat_keyboard(reminder_id)
+    await update.callback_query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка выбора типа повторения при редактировании
+@callback_router.route('edit_repeat_type_', int, str)
+async def on_edit_repeat_type(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int, repeat_type: str):
+    query = update.callback_query
+    context.user_data['edit_reminder_id'] = reminder_id
+    context.user_data['edit_repeat_type'] = repeat_type
+
+    if repeat_type == 'once':
+        # Просто обновляем напоминание
+        await storage.update_reminder(reminder_id, repeat_type='once', repeat_days='', repeat_interval=1)
+
+        response = f"""
 💭 *Повторение изменено!*
 
 Теперь это разовое напоминание.
-            """
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("К деталям", callback_data=f"view_{reminder_id}")],
-                [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-            ])
-            
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        
-        elif repeat_type == 'daily':
-            # Показываем выбор интервала
-            response = """
+        """
+
+        keyboard = create_details_keyboard(reminder_id)
+
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+    elif repeat_type == 'daily':
+        # Показываем выбор интервала
+        response = """
 💭 *Ежедневное повторение*
 
 Выберите интервал повторения:
-            """
-            
-            keyboard = create_daily_interval_keyboard(reminder_id)
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        
-        elif repeat_type == 'weekly':
-            # Устанавливаем повторение на тот же день недели
-            reminder = get_reminder_info(reminder_id)
-            if reminder:
-                reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-                weekday = reminder_time.weekday()
-                update_reminder(reminder_id, repeat_type='weekly', repeat_days=str(weekday), repeat_interval=1)
-                
-                response = f"""
+        """
+
+        keyboard = create_daily_interval_keyboard(reminder_id)
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+    elif repeat_type == 'weekly':
+        # Устанавливаем повторение на тот же день недели
+        reminder = await storage.get_reminder_info(reminder_id)
+        if reminder:
+            reminder_time = from_epoch(reminder['reminder_time'], await storage.user_timezone(reminder['user_id']))
+            weekday = reminder_time.weekday()
+            await storage.update_reminder(reminder_id, repeat_type='weekly', repeat_days=str(weekday), repeat_interval=1)
+
+            response = f"""
 💭 *Повторение изменено!*
 
 Теперь это еженедельное напоминание.
-Повторяется каждый {DAYS_OF_WEEK[weekday]}.
-                """
-                
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("К деталям", callback_data=f"view_{reminder_id}")],
-                    [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-                ])
-                
-                await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        
-        elif repeat_type == 'custom':
-            # Показываем выбор дней
-            context.user_data['edit_selected_days'] = []
-            
-            response = """
+Повторяется {WEEKDAY_EVERY[weekday]}.
+            """
+
+            keyboard = create_details_keyboard(reminder_id)
+
+            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+    elif repeat_type == 'custom':
+        # Показываем выбор дней
+        context.user_data['edit_selected_days'] = []
+
+        response = """
 💭 *Выбор дней недели*
 
 Выберите дни недели для напоминания:
 Нажмите на день, чтобы выбрать/отменить.
 Когда закончите, нажмите "✅ Готово"
-            """
-            
-            keyboard = create_days_keyboard([], reminder_id)
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка выбора интервала при редактировании
-    elif callback_data.startswith('edit_interval_'):
-        parts = callback_data.split('_')
-        reminder_id = int(parts[2])
-        interval = int(parts[3])
-        
-        update_reminder(reminder_id, repeat_type='daily', repeat_interval=interval)
-        
-        if interval == 1:
-            interval_text = "каждый день"
-        elif interval == 7:
-            interval_text = "раз в неделю"
-        elif interval == 14:
-            interval_text = "раз в 2 недели"
-        elif interval == 30:
-            interval_text = "раз в месяц"
-        else:
-            interval_text = f"каждые {interval} дня"
-        
-        response = f"""
+        """
+
+        keyboard = create_days_keyboard([], reminder_id)
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка выбора интервала при редактировании
+@callback_router.route('edit_interval_', int, int)
+async def on_edit_interval(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int, interval: int):
+    await storage.update_reminder(reminder_id, repeat_type='daily', repeat_interval=interval)
+
+    response = f"""
 💭 *Повторение изменено!*
 
 Теперь это ежедневное напоминание.
-Повторяется {interval_text}.
-        """
-        
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("К деталям", callback_data=f"view_{reminder_id}")],
-            [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-        ])
-        
-        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка выбора дней при редактировании
-    elif callback_data.startswith('edit_day_'):
-        parts = callback_data.split('_')
-        reminder_id = int(parts[2])
-        day_num = int(parts[3])
-        
-        selected_days = context.user_data.get('edit_selected_days', [])
-        
-        if day_num in selected_days:
-            selected_days.remove(day_num)
-        else:
-            selected_days.append(day_num)
-        
-        context.user_data['edit_selected_days'] = selected_days
-        
-        # Обновляем клавиатуру
-        keyboard = create_days_keyboard(selected_days, reminder_id)
-        await query.edit_message_text(query.message.text, parse_mode='Markdown', reply_markup=keyboard)
+Повторяется {interval_text(interval)}.
+    """
+
+    keyboard = create_details_keyboard(reminder_id)
+
+    await update.callback_query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка выбора дней при редактировании
+@callback_router.route('edit_day_', int, int)
+async def on_edit_day(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int, day_num: int):
+    query = update.callback_query
+    selected_days = context.user_data.get('edit_selected_days', [])
+
+    if day_num in selected_days:
+        selected_days.remove(day_num)
+    else:
+        selected_days.append(day_num)
+
+    context.user_data['edit_selected_days'] = selected_days
+
+    # Обновляем клавиатуру
+    keyboard = create_days_keyboard(selected_days, reminder_id)
+    await query.edit_message_text(query.message.text, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка завершения выбора дней при редактировании
+@callback_router.route('edit_days_done_', int)
+async def on_edit_days_done(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    query = update.callback_query
+    selected_days = context.user_data.get('edit_selected_days', [])
+
+    if not selected_days:
+        await query.answer("❌ Нужно выбрать хотя бы один день!", show_alert=True)
         return
-    
-    # Обработка завершения выбора дней при редактировании
-    elif callback_data.startswith('edit_days_done_'):
-        reminder_id = int(callback_data.split('_')[3])
-        selected_days = context.user_data.get('edit_selected_days', [])
-        
-        if not selected_days:
-            await query.answer("❌ Нужно выбрать хотя бы один день!", show_alert=True)
-            return
-        
-        # Сортируем дни
-        selected_days.sort()
-        repeat_days = ','.join(map(str, selected_days))
-        
-        update_reminder(reminder_id, repeat_type='custom', repeat_days=repeat_days, repeat_interval=1)
-        
-        days_list = [DAYS_OF_WEEK[d] for d in selected_days]
-        days_str = ', '.join([d for d in days_list])
-        
-        response = f"""
+
+    # Сортируем дни
+    selected_days.sort()
+    repeat_days = ','.join(map(str, selected_days))
+
+    await storage.update_reminder(reminder_id, repeat_type='custom', repeat_days=repeat_days, repeat_interval=1)
+
+    response = f"""
 💭 *Повторение изменено!*
 
 Теперь напоминание повторяется по выбранным дням:
-{days_str}
-        """
-        
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📋 К деталям", callback_data=f"view_{reminder_id}")],
-            [InlineKeyboardButton("🔙 Назад", callback_data="back_to_start")]
-        ])
-        
-        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+{repeat_text('custom', 1, repeat_days)}
+    """
+
+    keyboard = create_days_saved_keyboard(reminder_id)
+
+    await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка выбора типа повторения (создание нового)
+@callback_router.route('repeat_', str)
+async def on_repeat(update: Update, context: ContextTypes.DEFAULT_TYPE, repeat_type: str):
+    query = update.callback_query
+    user_id = query.from_user.id
+
+    if context.user_data.get('reminder_step') != 'waiting_repeat':
         return
-    
-    # Обработка выбора типа повторения (создание нового)
-    elif callback_data.startswith('repeat_'):
-        if context.user_data.get('reminder_step') == 'waiting_repeat':
-            repeat_type = callback_data.split('_')[1]
-            
-            if repeat_type == 'skip':
-                # Пропускаем выбор повторения
-                await complete_reminder_creation(query, context, user_id)
-            
-            elif repeat_type == 'once':
-                context.user_data['repeat_type'] = 'once'
-                await complete_reminder_creation(query, context, user_id)
-            
-            elif repeat_type == 'daily':
-                context.user_data['repeat_type'] = 'daily'
-                context.user_data['reminder_step'] = 'waiting_interval'
-                
-                response = """
+
+    if repeat_type == 'skip':
+        # Пропускаем выбор повторения
+        await complete_reminder_creation(query, context, user_id)
+
+    elif repeat_type == 'once':
+        context.user_data['repeat_type'] = 'once'
+        await complete_reminder_creation(query, context, user_id)
+
+    elif repeat_type == 'daily':
+        context.user_data['repeat_type'] = 'daily'
+        context.user_data['reminder_step'] = 'waiting_interval'
+
+        response = """
 💭 *Ежедневное напоминание*
 
 Выберите интервал повторения:
-                """
-                
-                keyboard = create_daily_interval_keyboard()
-                await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-            
-            elif repeat_type == 'weekly':
-                context.user_data['repeat_type'] = 'weekly'
-                context.user_data['repeat_days'] = str(context.user_data['reminder_time'].weekday())
-                await complete_reminder_creation(query, context, user_id)
-            
-            elif repeat_type == 'custom':
-                context.user_data['repeat_type'] = 'custom'
-                context.user_data['selected_days'] = []
-                context.user_data['reminder_step'] = 'waiting_days'
-                
-                response = """
+        """
+
+        keyboard = create_daily_interval_keyboard()
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+    elif repeat_type == 'weekly':
+        context.user_data['repeat_type'] = 'weekly'
+        context.user_data['repeat_days'] = str(context.user_data['reminder_time'].weekday())
+        await complete_reminder_creation(query, context, user_id)
+
+    elif repeat_type == 'custom':
+        context.user_data['repeat_type'] = 'custom'
+        context.user_data['selected_days'] = []
+        context.user_data['reminder_step'] = 'waiting_days'
+
+        response = """
 💭 *Выбор дней недели*
 
 Выберите дни недели для напоминания:
 Нажмите на день, чтобы выбрать/отменить.
 Когда закончите, нажмите "✅ Готово"
-                """
-                
-                keyboard = create_days_keyboard([])
-                await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        return
-    
-    # Обработка выбора интервала (создание нового)
-    elif callback_data.startswith('interval_'):
-        if callback_data == 'interval_back':
-            # Возвращаемся к выбору типа повторения
-            context.user_data['reminder_step'] = 'waiting_repeat'
-            
-            time_str = context.user_data['reminder_time'].strftime('%d.%m.%Y %H:%M')
-            
-            response = f"""
-📝 Текст: *{context.user_data['reminder_text']}*
+        """
+
+        keyboard = create_days_keyboard([])
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Возврат к выбору типа повторения (создание нового)
+@callback_router.route('interval_back')
+@callback_router.route('days_cancel')
+async def on_back_to_repeat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data['reminder_step'] = 'waiting_repeat'
+    context.user_data.pop('selected_days', None)
+
+    time_str = context.user_data['reminder_time'].strftime('%d.%m.%Y %H:%M')
+
+    response = f"""
+📝 Текст: {bold(context.user_data['reminder_text'])}
 ⏰ Время: *{time_str}*
 
 Теперь выберите тип повторения:
-            """
-            
-            keyboard = create_repeat_keyboard()
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        
-        else:
-            interval = int(callback_data.split('_')[1])
-            context.user_data['repeat_interval'] = interval
-            await complete_reminder_creation(query, context, user_id)
-        return
-    
-    # Обработка выбора дней (создание нового)
-    elif callback_data.startswith('day_'):
-        if context.user_data.get('reminder_step') == 'waiting_days':
-            day_num = int(callback_data.split('_')[1])
-            selected_days = context.user_data.get('selected_days', [])
-            
-            if day_num in selected_days:
-                selected_days.remove(day_num)
-            else:
-                selected_days.append(day_num)
-            
-            context.user_data['selected_days'] = selected_days
-            
-            # Обновляем клавиатуру
-            keyboard = create_days_keyboard(selected_days)
-            await query.edit_message_text(query.message.text, parse_mode='Markdown', reply_markup=keyboard)
+    """
+
+    keyboard = create_repeat_keyboard()
+    await update.callback_query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка выбора интервала (создание нового)
+@callback_router.route('interval_', int)
+async def on_interval(update: Update, context: ContextTypes.DEFAULT_TYPE, interval: int):
+    query = update.callback_query
+    context.user_data['repeat_interval'] = interval
+    await complete_reminder_creation(query, context, query.from_user.id)
+
+# Обработка выбора дней (создание нового)
+@callback_router.route('day_', int)
+async def on_day(update: Update, context: ContextTypes.DEFAULT_TYPE, day_num: int):
+    query = update.callback_query
+    if context.user_data.get('reminder_step') != 'waiting_days':
         return
-    
-    # Обработка завершения выбора дней (создание нового)
-    elif callback_data in ['days_done', 'days_cancel']:
-        if callback_data == 'days_done':
-            selected_days = context.user_data.get('selected_days', [])
-            if not selected_days:
-                await query.answer("❌ Нужно выбрать хотя бы один день!", show_alert=True)
-                return
-            
-            # Сортируем дни
-            selected_days.sort()
-            context.user_data['repeat_days'] = ','.join(map(str, selected_days))
-            await complete_reminder_creation(query, context, user_id)
-        
-        else:  # days_cancel
-            # Возвращаемся к выбору типа повторения
-            context.user_data['reminder_step'] = 'waiting_repeat'
-            context.user_data.pop('selected_days', None)
-            
-            time_str = context.user_data['reminder_time'].strftime('%d.%m.%Y %H:%M')
-            
-            response = f"""
-📝 Текст: *{context.user_data['reminder_text']}*
-⏰ Время: *{time_str}*
 
-Теперь выберите тип повторения:
-            """
-            
-            keyboard = create_repeat_keyboard()
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+    selected_days = context.user_data.get('selected_days', [])
+
+    if day_num in selected_days:
+        selected_days.remove(day_num)
+    else:
+        selected_days.append(day_num)
+
+    context.user_data['selected_days'] = selected_days
+
+    # Обновляем клавиатуру
+    keyboard = create_days_keyboard(selected_days)
+    await query.edit_message_text(query.message.text, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка завершения выбора дней (создание нового)
+@callback_router.route('days_done')
+async def on_days_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    selected_days = context.user_data.get('selected_days', [])
+    if not selected_days:
+        await query.answer("❌ Нужно выбрать хотя бы один день!", show_alert=True)
         return
-    
-    # Обработка кнопки "Выполнено" в уведомлении
-    elif callback_data.startswith('done_'):
-        reminder_id = int(callback_data.split('_')[1])
-        reminder = get_reminder_info(reminder_id)
-        
-        if reminder and reminder['user_id'] == user_id:
-            mark_as_done(reminder_id)
-            
-            reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-            time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
-            
-            response = f"""
+
+    # Сортируем дни
+    selected_days.sort()
+    context.user_data['repeat_days'] = ','.join(map(str, selected_days))
+    await complete_reminder_creation(query, context, query.from_user.id)
+
+# Обработка кнопки "Выполнено" в уведомлении
+@callback_router.route('done_', int)
+async def on_done(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    query = update.callback_query
+    user_id = query.from_user.id
+    reminder = await storage.get_reminder_info(reminder_id)
+
+    if reminder and reminder['user_id'] == user_id:
+        time_str = format_epoch(reminder['reminder_time'], tz=await storage.user_timezone(user_id))
+
+        # Повторяющееся напоминание при отправке уже перешло к следующему срабатыванию
+        if reminder['repeat_type'] == 'once':
+            await storage.mark_as_done(reminder_id)
+            done_info = "🌟 Напоминание выполнено и архивировано."
+        else:
+            done_info = f"🔄 Следующее напоминание: {time_str}"
+
+        response = f"""
 💭 *выполнено!*
 
-📝 {reminder['text']}
-⏰ {time_str}
+📝 {escape_markdown(reminder['text'])}
 
-🌟 Напоминание выполнено и архивировано.
-            """
-            
-            await query.edit_message_text(response, parse_mode='Markdown')
-            
-            # Отправляем подтверждение
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"✅ Напоминание «{reminder['text']}» отмечено как выполненное!",
-                reply_markup=create_main_menu()
-            )
-        return
-    
-    # Обработка кнопки "Отложить" (меню)
-    elif callback_data.startswith('snooze_menu_'):
-        reminder_id = int(callback_data.split('_')[2])
-        reminder = get_reminder_info(reminder_id)
-        
-        if reminder and reminder['user_id'] == user_id:
-            reminder_time = datetime.strptime(reminder['reminder_time'], '%Y-%m-%d %H:%M:%S')
-            time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
-            
-            response = f"""
+{done_info}
+        """
+
+        await query.edit_message_text(response, parse_mode='Markdown')
+
+        # Отправляем подтверждение
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=f"✅ Напоминание «{reminder['text']}» отмечено как выполненное!",
+            reply_markup=create_main_menu()
+        )
+
+# Обработка кнопки "Отложить" (меню)
+@callback_router.route('snooze_menu_', int)
+async def on_snooze_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, reminder_id: int):
+    query = update.callback_query
+    reminder = await storage.get_reminder_info(reminder_id)
+
+    if reminder and reminder['user_id'] == query.from_user.id:
+        time_str = format_epoch(reminder['reminder_time'], tz=await storage.user_timezone(reminder['user_id']))
+
+        response = f"""
 ⏰ *ОТЛОЖИТЬ НАПОМИНАНИЕ*
 
-📝 {reminder['text']}
+📝 {escape_markdown(reminder['text'])}
 💫 Текущее время: {time_str}
 
 Выберите, на сколько отложить:
-            """
-            
-            keyboard = create_snooze_options_keyboard(reminder_id)
-            await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+        """
+
+        keyboard = create_snooze_options_keyboard(reminder_id)
+        await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+
+# Обработка выбора времени откладывания: snooze_{минуты|tomorrow}_{id}
+@callback_router.route('snooze_', str, int)
+async def on_snooze(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str: str, reminder_id: int):
+    query = update.callback_query
+    user_id = query.from_user.id
+    reminder = await storage.get_reminder_info(reminder_id)
+
+    if not reminder or reminder['user_id'] != user_id:
         return
-    
-    # Обработка выбора времени откладывания
-    elif callback_data.startswith('snooze_'):
-        parts = callback_data.split('_')
-        if len(parts) == 3:
-            time_str = parts[1]
-            reminder_id = int(parts[2])
-            
-            reminder = get_reminder_info(reminder_id)
-            
-            if reminder and reminder['user_id'] == user_id:
-                if time_str == 'tomorrow':
-                    new_time = postpone_to_tomorrow(reminder_id)
-                    time_delta = "завтра"
-                else:
-                    minutes = int(time_str)
-                    new_time = postpone_reminder(reminder_id, minutes)
-                    
-                    if minutes >= 60:
-                        hours = minutes // 60
-                        time_delta = f"{hours} час{'а' if 2 <= hours % 10 <= 4 and (hours % 100 < 10 or hours % 100 > 20) else '' if hours % 10 == 1 else 'ов'}"
-                    else:
-                        time_delta = f"{minutes} минут{'у' if minutes % 10 == 1 and minutes % 100 != 11 else 'ы' if 2 <= minutes % 10 <= 4 and (minutes % 100 < 10 or minutes % 100 > 20) else ''}"
-                
-                if new_time:
-                    new_time_str = new_time.strftime('%d.%m.%Y %H:%M')
-                    
-                    response = f"""
+
+    if time_str == 'tomorrow':
+        new_time = await storage.postpone_to_tomorrow(reminder_id)
+        time_delta = "завтра"
+    else:
+        minutes = int(time_str)
+        new_time = await storage.postpone_reminder(reminder_id, minutes)
+
+        if minutes >= 60:
+            hours = minutes // 60
+            time_delta = f"{hours} {plural(hours, HOUR_FORMS)}"
+        else:
+            time_delta = f"{minutes} {plural(minutes, MINUTE_FORMS)}"
+
+    if new_time:
+        new_time_str = new_time.strftime('%d.%m.%Y %H:%M')
+
+        response = f"""
 💭 *напоминание отложено*
 
-📝 {reminder['text']}
+📝 {escape_markdown(reminder['text'])}
 ⏰ Новое время: {new_time_str}
 ⏱️ Отложено на: {time_delta}
 
 Бот напомнит в новое время! 🌟
-                    """
-                    
-                    await query.edit_message_text(response, parse_mode='Markdown')
-                    
-                    # Отправляем подтверждение
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=f"⏰ Напоминание «{reminder['text']}» отложено на {time_delta}!\nНовое время: {new_time_str}",
-                        reply_markup=create_main_menu()
-                    )
-        return
+        """
+
+        await query.edit_message_text(response, parse_mode='Markdown')
+
+        # Отправляем подтверждение
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=f"⏰ Напоминание «{reminder['text']}» отложено на {time_delta}!\nНовое время: {new_time_str}",
+            reply_markup=create_main_menu()
+        )
 
 # Завершение создания напоминания
 async def complete_reminder_creation(query, context, user_id):
@@ -1544,64 +901,19 @@ async def complete_reminder_creation(query, context, user_id):
     repeat_days = context.user_data.get('repeat_days', '')
     repeat_interval = context.user_data.get('repeat_interval', 1)
     
-    reminder_id = save_reminder_to_db(
+    reminder_id = await storage.save_reminder_to_db(
         user.id, user.first_name, text, reminder_time,
         repeat_type, repeat_days, repeat_interval
     )
     
-    time_str = reminder_time.strftime('%d.%m.%Y %H:%M')
-    time_diff = reminder_time - datetime.now()
-    
-    days = time_diff.days
-    hours = time_diff.seconds // 3600
-    minutes = (time_diff.seconds % 3600) // 60
-    
-    time_left_parts = []
-    if days > 0:
-        time_left_parts.append(f"{days} д.")
-    if hours > 0:
-        time_left_parts.append(f"{hours} ч.")
-    if minutes > 0:
-        time_left_parts.append(f"{minutes} мин.")
-    
-    time_left = " ".join(time_left_parts) if time_left_parts else "менее минуты"
-    
-    # Добавляем информацию о повторении
-    repeat_info = ""
-    if repeat_type == 'daily':
-        if repeat_interval == 1:
-            repeat_info = "\n🔄 *Повторение:* Каждый день"
-        else:
-            repeat_info = f"\n🔄 *Повторение:* Каждые {repeat_interval} дня"
-    
-    elif repeat_type == 'weekly':
-        day_name = DAYS_OF_WEEK[reminder_time.weekday()]
-        repeat_info = f"\n🔄 *Повторение:* Каждый {day_name}"
-    
-    elif repeat_type == 'custom':
-        days_list = [DAYS_OF_WEEK[int(d)] for d in repeat_days.split(',') if d]
-        days_str = ', '.join([d for d in days_list])
-        repeat_info = f"\n🔄 *Повторение:* По {days_str}"
-    
-    response = f"""
-💭 *напоминание создано успешно!*
-
-📝 *Текст:* {text}
-⏰ *Время:* {time_str}
-⏱️ *Через:* {time_left}{repeat_info} 
-    """
+    response = created_message(text, reminder_time, now_in(), repeat_type, repeat_days, repeat_interval)
     
     # Очищаем временные данные
     for key in ['reminder_step', 'reminder_text', 'reminder_time', 
                 'repeat_type', 'repeat_days', 'repeat_interval', 'selected_days']:
         context.user_data.pop(key, None)
     
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("К списку", callback_data="back_to_list_0")],
-        [InlineKeyboardButton("🔙", callback_data="back_to_start")]
-    ])
-    
-    await query.edit_message_text(response, parse_mode='Markdown', reply_markup=keyboard)
+    await query.edit_message_text(response, parse_mode='Markdown', reply_markup=TO_LIST_KEYBOARD)
 
 # Обработка редактирования текста
 async def handle_edit_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1613,7 +925,7 @@ async def handle_edit_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Текст слишком длинный. Максимум 500 символов.")
             return
         
-        update_reminder(reminder_id, text=new_text)
+        await storage.update_reminder(reminder_id, text=new_text)
         
         # Очищаем временные данные
         context.user_data.pop('edit_step', None)
@@ -1629,15 +941,15 @@ async def handle_edit_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('edit_step') == 'waiting_new_time':
         try:
             time_text = update.message.text.strip()
-            new_time = parse_datetime(time_text)
+            new_time = parse_datetime(time_text, await storage.user_timezone(update.message.from_user.id))
             
-            current_time = datetime.now()
+            current_time = now_in()
             if new_time <= current_time:
                 await update.message.reply_text("❌ Время должно быть в будущем! Пожалуйста, укажите будущее время.")
                 return
             
             reminder_id = context.user_data.get('edit_reminder_id')
-            update_reminder(reminder_id, reminder_time=new_time)
+            await storage.update_reminder(reminder_id, reminder_time=new_time)
             
             time_str = new_time.strftime('%d.%m.%Y %H:%M')
             
@@ -1656,107 +968,279 @@ async def handle_edit_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error(f"Ошибка изменения времени: {e}")
             await update.message.reply_text(f"❌ Произошла ошибка: {str(e)}")
 
-# Функция проверки и отправки напоминаний
-async def async_reminder_checker(bot_token: str):
-    """Асинхронная проверка напоминаний"""
-    from telegram import Bot
+# Где отправляются напоминания: 'bot' - в процессе бота, 'workers' - в отдельных
+# процессах worker.py, каждый для своей части пользователей
+DELIVERY_MODE = os.environ.get('DELIVERY_MODE', 'bot')
+
+# Как часто (в секундах) процесс бота в режиме 'workers' проверяет, не изменили ли БД процессы отправки
+CACHE_WATCH_INTERVAL = float(os.environ.get('CACHE_WATCH_INTERVAL', 0.5))
+
+# Размер пула воркеров доставки
+DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', 8))
+
+# Цель по опозданию доставки (секунды): отправки сверх неё считаются в delivery_lag_slo_total
+DELIVERY_LAG_SLO = float(os.environ.get('DELIVERY_LAG_SLO', 60))
+
+# Режим догоняния: напоминания, опоздавшие больше чем на CATCH_UP_THRESHOLD секунд
+# (например, после простоя бота), отправляются порциями по CATCH_UP_CHUNK от самых старых,
+# а несколько напоминаний одного пользователя объединяются в одно сообщение
+CATCH_UP_THRESHOLD = int(os.environ.get('CATCH_UP_THRESHOLD', 300))
+CATCH_UP_CHUNK = int(os.environ.get('CATCH_UP_CHUNK', 200))
+
+# Сколько напоминаний помещается в одну сводку (ограничение длины сообщения)
+DIGEST_MAX_ITEMS = 20
+
+# Сообщение с одним наступившим напоминанием
+def build_delivery(row: Tuple, catch_up: bool = False) -> Delivery:
+    reminder_id, user_id, text, reminder_ts, user_name, postponed_count, repeat_type, tz = row
+    return Delivery(
+        reminder_id=reminder_id,
+        chat_id=user_id,
+        text=reminder_message(text, reminder_ts, postponed_count, repeat_type, tz),
+        kwargs={'parse_mode': 'Markdown', 'reply_markup': create_reminder_keyboard(reminder_id)},
+        due=reminder_ts,
+        catch_up=catch_up
+    )
+
+# Сообщения для порции просроченных напоминаний: одиночное напоминание пользователя
+# отправляется обычным сообщением с кнопками, несколько - сводками
+def build_catch_up_deliveries(rows: List[Tuple]) -> List[Delivery]:
+    by_user: Dict[int, List[Tuple]] = {}
+    for row in sorted(rows, key=lambda row: row[3]):
+        by_user.setdefault(row[1], []).append(row)
+
+    deliveries = []
+    for user_id, user_rows in by_user.items():
+        if len(user_rows) == 1:
+            deliveries.append(build_delivery(user_rows[0], catch_up=True))
+            continue
+        for start in range(0, len(user_rows), DIGEST_MAX_ITEMS):
+            part = user_rows[start:start + DIGEST_MAX_ITEMS]
+            deliveries.append(Delivery(
+                reminder_id=part[0][0],
+                chat_id=user_id,
+                text=digest_message(part, part[0][7]),
+                kwargs={'reply_markup': create_digest_keyboard()},
+                due=part[0][3],
+                digest=tuple((row[0], row[3]) for row in part[1:]),
+                catch_up=True
+            ))
+    return deliveries
+
+# Журнал результатов доставки: записывает их в БД пачками
+delivery_journal = DeliveryJournal(
+    storage.record_delivery_outcomes,
+    max_batch=int(os.environ.get('DELIVERY_JOURNAL_BATCH', 100))
+)
+
+# Опоздание самого старого напоминания, ждущего отправки в режиме догоняния
+catch_up_oldest = Gauge('catch_up_oldest_lag_seconds', 'Опоздание самого старого напоминания в режиме догоняния')
+
+# Глубина очередей для /metrics
+queue_depth.set_function(lambda: len(reminder_scheduler), 'scheduled')
+queue_depth.set_function(delivery_journal.pending, 'journal')
+queue_depth.set_function(user_state.pending, 'user_state')
+
+# Обработка результата доставки. Повтор после временной ошибки ставится в расписание
+# при записи результата в БД - на время, до которого там отложен захват.
+async def record_delivery_result(delivery: Delivery, status: str):
+    if status == SENT:
+        logger.info(f"Отправлено напоминание {delivery.reminder_id} пользователю {delivery.chat_id}")
+    
+    await delivery_journal.record(delivery, status)
+
+# Отметка начала отправки в outbox: после неё повтор срабатывания считается неподтверждённым
+async def begin_delivery(delivery: Delivery) -> bool:
+    return await storage.mark_sending(delivery.covered())
+
+# Функция проверки и отправки напоминаний.
+# shard - часть пользователей этого процесса. watch_interval - как часто проверять изменения БД
+# другими процессами (для worker.py: напоминания создаёт процесс бота); None - не проверять.
+async def async_reminder_checker(bot_token: str, bot=None, shard: Shard = ALL_USERS,
+                                 watch_interval: Optional[float] = None):
+    """Асинхронная отправка напоминаний по расписанию"""
+    if bot is None:
+        from telegram import Bot
+        bot = Bot(token=bot_token, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_FILE_URL)
+    
+    pipeline = DeliveryPipeline(bot, record_delivery_result, workers=DELIVERY_WORKERS, lag_slo=DELIVERY_LAG_SLO,
+                                on_attempt=begin_delivery)
+    pipeline.start()
+    delivery_journal.start()
+    backlog = CatchUpBacklog()
+    tasks = [asyncio.create_task(_catch_up_overdue(pipeline, backlog, shard), name="catch-up")]
+    queue_depth.set_function(pipeline.depth, 'delivery')
+    queue_depth.set_function(backlog.__len__, 'catch_up')
+    catch_up_oldest.set_function(backlog.oldest_lag)
+    
+    # Сверка отправок, прерванных предыдущим запуском
+    try:
+        cancelled, in_doubt = await storage.recover_outbox(shard)
+        if cancelled or in_doubt:
+            logger.warning(f"Сверка outbox: отменено {cancelled}, с неизвестным результатом {in_doubt}")
+    except Exception as e:
+        logger.error(f"Ошибка сверки outbox: {e}")
     
-    bot = Bot(token=bot_token)
+    # Загружаем ожидающие напоминания один раз, дальше планировщик обновляется при изменениях
+    reminder_scheduler.attach(asyncio.get_running_loop())
+    reminder_scheduler.load(await storage.load_pending_reminders(shard))
+    logger.info(f"В планировщик загружено {len(reminder_scheduler)} напоминаний, часть {shard[0] + 1} из {shard[1]}")
+    if watch_interval is not None:
+        tasks.append(asyncio.create_task(_watch_changes(shard, watch_interval), name="watch-changes"))
     
+    try:
+        await _deliver_due_reminders(pipeline, backlog, shard)
+    finally:
+        # При остановке дописываем накопленные результаты доставки и отпускаем захваченное
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await pipeline.stop()
+        await delivery_journal.stop()
+        try:
+            released = await storage.release_claims()
+            if released:
+                logger.info(f"Снят захват с {released} неотправленных напоминаний")
+        except Exception as e:
+            logger.error(f"Ошибка снятия захвата напоминаний: {e}")
+
+# Перезагрузка расписания, когда БД изменил другой процесс (PRAGMA data_version)
+async def _watch_changes(shard: Shard, interval: float):
+    version = await storage.data_version()
     while True:
+        await asyncio.sleep(interval)
         try:
-            conn = sqlite3.connect('reminders.db', check_same_thread=False)
-            cursor = conn.cursor()
-            
-            current_time = datetime.now()
-            time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
-            
-            cursor.execute('''
-                SELECT id, user_id, text, reminder_time, user_name, postponed_count, repeat_type
-                FROM reminders 
-                WHERE reminder_time <= ? 
-                AND is_active = 1 
-                AND sent = 0
-            ''', (time_str,))
-            
-            reminders = cursor.fetchall()
-            
-            sent_count = 0
-            
-            for reminder_id, user_id, text, reminder_time_str, user_name, postponed_count, repeat_type in reminders:
-                try:
-                    reminder_time = datetime.strptime(reminder_time_str, '%Y-%m-%d %H:%M:%S')
-                    time_formatted = reminder_time.strftime('%d.%m.%Y %H:%M')
-                    
-                    if postponed_count > 0:
-                        postponed = f"\n⏰ Откладывалось: {postponed_count} раз"
-                    else:
-                        postponed = ""
-                    
-                    repeat_info = ""
-                    if repeat_type != 'once':
-                        repeat_info = "\n🔄 *Повторяющееся напоминание*"
-                    
-                    message = f"""
-💭 *напоминание*{repeat_info}
-
-📝 {text}
-⏰ {time_formatted}{postponed}
-
-Выберите действие:
-                    """
-                    
-                    keyboard = create_reminder_keyboard(reminder_id)
-                    
-                    await bot.send_message(
-                        chat_id=user_id, 
-                        text=message, 
-                        parse_mode='Markdown',
-                        reply_markup=keyboard
-                    )
-                    
-                    cursor.execute(
-                        'UPDATE reminders SET sent = 1 WHERE id = ?',
-                        (reminder_id,)
-                    )
-                    
-                    sent_count += 1
-                    logger.info(f"Отправлено напоминание {reminder_id} пользователю {user_id}")
-                    
-                    await asyncio.sleep(0.1)  # Короткая задержка
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка отправки напоминания {reminder_id}: {e}")
-                    
-                    if "Forbidden" in str(e) or "blocked" in str(e).lower():
-                        cursor.execute(
-                            'UPDATE reminders SET is_active = 0 WHERE id = ?',
-                            (reminder_id,)
-                        )
-            
-            conn.commit()
+            current = await storage.data_version()
+            if current != version:
+                version = current
+                reminder_scheduler.load(await storage.load_pending_reminders(shard))
+        except Exception as e:
+            logger.error(f"Ошибка перезагрузки расписания: {e}")
+
+# Сброс кэшей чтения в процессе бота, когда БД изменили процессы отправки. Они переводят
+# повторяющиеся напоминания к следующему сроку и отмечают отправленные, без сброса карточки
+# и списки показывали бы прежнее состояние до истечения ttl кэша. Версия данных меняется
+# и от записей самого бота, поэтому сбрасываются только напоминания и пользователи из строк
+# outbox, изменённых с прошлой проверки (с запасом FOREIGN_WRITE_MARGIN на долгие транзакции).
+FOREIGN_WRITE_MARGIN = 10
+
+async def _watch_foreign_writes(interval: float):
+    version = await storage.data_version()
+    checked = now_epoch()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = await storage.data_version()
+            if current != version:
+                started = now_epoch()
+                await storage.invalidate_outbox_changes(checked - FOREIGN_WRITE_MARGIN)
+                version, checked = current, started
+        except Exception as e:
+            logger.error(f"Ошибка проверки изменений БД: {e}")
+
+# Цикл постановки наступивших напоминаний в очередь отправки.
+# Сильно опоздавшие напоминания уходят в режим догоняния и не задерживают текущие.
+async def _deliver_due_reminders(pipeline: DeliveryPipeline, backlog: CatchUpBacklog, shard: Shard):
+    while True:
+        try:
+            due = await reminder_scheduler.wait_due()
             
-            # Очищаем старые выполненные напоминания
-            month_ago = (current_time - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('DELETE FROM reminders WHERE sent = 1 AND is_active = 0 AND reminder_time < ?', (month_ago,))
-            deleted_count = cursor.rowcount
+            cutoff = time.time() - CATCH_UP_THRESHOLD
+            overdue = [item for item in due if item[1] < cutoff]
+            if overdue:
+                backlog.add(overdue)
+                logger.info(f"Режим догоняния: {len(overdue)} просроченных напоминаний, в очереди {len(backlog)}")
             
-            if deleted_count > 0:
-                logger.info(f"Удалено {deleted_count} старых напоминаний")
-                conn.commit()
+            due_ids = [reminder_id for reminder_id, due_ts in due if due_ts >= cutoff]
+            if not due_ids:
+                continue
             
-            conn.close()
+            reminders = await storage.claim_due_reminders(due_ids, shard)
             
-            if sent_count > 0:
-                logger.info(f"Отправлено {sent_count} напоминаний")
+            for row in reminders:
+                pipeline.submit(build_delivery(row))
             
-            # Интервал проверки (10 секунд)
-            await asyncio.sleep(10)
+            if reminders:
+                logger.info(f"В очередь отправки поставлено {len(reminders)} напоминаний")
             
         except Exception as e:
             logger.error(f"Ошибка в reminder_checker_loop: {e}")
-            # При ошибке ждем дольше
+            # При ошибке ждем дольше и перечитываем расписание из БД
+            await asyncio.sleep(60)
+            try:
+                reminder_scheduler.load(await storage.load_pending_reminders(shard))
+            except Exception as e:
+                logger.error(f"Ошибка загрузки расписания: {e}")
+
+# Отправка просроченных напоминаний порциями от самых старых.
+# Вместе с порцией читаются остальные просроченные напоминания тех же пользователей,
+# чтобы каждый получил одну сводку. Следующая порция читается из БД, только когда
+# очередь отправки почти разобрана, поэтому текущие напоминания не ждут за всей очередью.
+async def _catch_up_overdue(pipeline: DeliveryPipeline, backlog: CatchUpBacklog, shard: Shard):
+    while True:
+        await backlog.wait()
+        chunk = backlog.take(CATCH_UP_CHUNK)
+        if not chunk:
+            continue
+        try:
+            reminders = await storage.claim_overdue_reminders([reminder_id for reminder_id, _ in chunk],
+                                                             int(time.time()) - CATCH_UP_THRESHOLD, shard)
+        except Exception as e:
+            logger.error(f"Ошибка чтения просроченных напоминаний: {e}")
+            backlog.add(chunk)
             await asyncio.sleep(60)
+            continue
+        backlog.discard([row[0] for row in reminders])
+        
+        deliveries = build_catch_up_deliveries(reminders)
+        for delivery in deliveries:
+            pipeline.submit(delivery)
+        logger.info(f"Догоняние: {len(reminders)} напоминаний в {len(deliveries)} сообщениях, "
+                    f"осталось {len(backlog)}, самое старое опоздание {backlog.oldest_lag():.0f}с")
+        
+        while pipeline.depth() > CATCH_UP_CHUNK // 2:
+            await asyncio.sleep(0.5)
+
+# Обслуживание БД: выполненные напоминания старше ARCHIVE_AFTER_DAYS дней переносятся
+# в reminders_archive, закрытые записи outbox удаляются, освободившиеся страницы возвращаются
+# файлу базы. Всё - порциями по MAINTENANCE_BATCH строк / VACUUM_PAGES страниц с паузой
+# MAINTENANCE_PAUSE между ними, чтобы запросы бота и отправка не ждали обслуживания.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+MAINTENANCE_INTERVAL = int(os.environ.get('MAINTENANCE_INTERVAL', 600))
+MAINTENANCE_BATCH = int(os.environ.get('MAINTENANCE_BATCH', 500))
+MAINTENANCE_PAUSE = float(os.environ.get('MAINTENANCE_PAUSE', 0.5))
+VACUUM_PAGES = int(os.environ.get('VACUUM_PAGES', 256))
+
+# Повторять шаг обслуживания, пока он обрабатывает полные порции. Возвращает сумму.
+async def _in_slices(step, *args, full: int) -> int:
+    total = 0
+    while True:
+        done = await step(*args)
+        total += done
+        if done < full:
+            return total
+        await asyncio.sleep(MAINTENANCE_PAUSE)
+
+async def maintenance_loop(interval: int = MAINTENANCE_INTERVAL):
+    while True:
+        try:
+            archived = await _in_slices(storage.archive_done_reminders, ARCHIVE_AFTER_DAYS, MAINTENANCE_BATCH,
+                                        full=MAINTENANCE_BATCH)
+            maintenance_rows.inc('archived', amount=archived)
+            pruned = await _in_slices(storage.prune_outbox, ARCHIVE_AFTER_DAYS, MAINTENANCE_BATCH,
+                                      full=MAINTENANCE_BATCH)
+            maintenance_rows.inc('outbox_pruned', amount=pruned)
+            pages = await _in_slices(storage.incremental_vacuum, VACUUM_PAGES, full=VACUUM_PAGES)
+            maintenance_rows.inc('vacuum_pages', amount=pages)
+
+            if archived or pruned or pages:
+                logger.info(f"Обслуживание БД: в архив {archived} напоминаний, из outbox удалено {pruned}, "
+                            f"освобождено страниц {pages}")
+
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания БД: {e}")
+
+        await asyncio.sleep(interval)
 
 # Обработка текстовых сообщений
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1794,52 +1278,122 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             reply_markup=create_main_menu()
         )
 
+# Сборка приложения с обработчиками
+def build_application() -> Application:
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(BOT_API_BASE_URL)
+        .base_file_url(BOT_API_FILE_URL)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    )
+    if WEBHOOK_URL:
+        builder = builder.updater(None)
+    application = builder.build()
+    
+    # Загрузка сохранённого состояния пользователя перед остальными обработчиками
+    user_state.attach(application)
+    
+    # Добавляем обработчики команд
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("list", show_reminders_list))
+    application.add_handler(CommandHandler("reminders", show_reminders_list))
+    application.add_handler(CommandHandler("upcoming", show_three_upcoming_reminders))
+    application.add_handler(CommandHandler("repeating", show_repeating_reminders))
+    application.add_handler(CommandHandler("timezone", timezone_command))
+    
+    # Добавляем обработчик callback-кнопок
+    application.add_handler(CallbackQueryHandler(handle_callback_query))
+    
+    # Обработчик текстовых сообщений
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    
+    return application
+
 # Основная функция запуска бота
 async def main_async():
-    """Асинхронный запуск бота"""
+    """Асинхронный запуск бота: обновления, HTTP-сервер и фоновые задачи в одном цикле событий"""
+    # Проверяем токен
+    if not BOT_TOKEN or BOT_TOKEN == '8543266583:AAFMsPSWjMW1ZqMwE_B2VqvJsyWUi35T1vM':
+        logger.error("❌ Не установлен токен бота!")
+        logger.error("Установите переменную окружения BOT_TOKEN_REMINDER в Railway")
+        return
+    
+    await storage.initialize()
+    application = build_application()
+    queue_depth.set_function(application.update_queue.qsize, 'updates')
+    queue_depth.set_function(application.update_processor.active_queues, 'users_in_progress')
+    webhook_secret = (WEBHOOK_SECRET or secrets.token_urlsafe(32)) if WEBHOOK_URL else None
+    server = WebhookServer(application, port=PORT, webhook_path=WEBHOOK_PATH, secret_token=webhook_secret)
+    
+    # Railway останавливает контейнер сигналом SIGTERM
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    background = []
     try:
-        # Проверяем токен
-        if not BOT_TOKEN or BOT_TOKEN == '8543266583:AAFMsPSWjMW1ZqMwE_B2VqvJsyWUi35T1vM':
-            logger.error("❌ Не установлен токен бота!")
-            logger.error("Установите переменную окружения BOT_TOKEN_REMINDER в Railway")
-            return
-        
-        application = Application.builder().token(BOT_TOKEN).build()
-        
-        # Добавляем обработчики команд
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("list", show_reminders_list))
-        application.add_handler(CommandHandler("reminders", show_reminders_list))
-        application.add_handler(CommandHandler("upcoming", show_three_upcoming_reminders))
-        application.add_handler(CommandHandler("repeating", show_repeating_reminders))
-        
-        # Добавляем обработчик callback-кнопок
-        application.add_handler(CallbackQueryHandler(handle_callback_query))
-        
-        # Обработчик текстовых сообщений
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
-        
-        # Запускаем фоновую проверку напоминаний как асинхронную задачу
-        asyncio.create_task(async_reminder_checker(BOT_TOKEN))
-        
-        logger.info("=" * 50)
-        logger.info("🤖 Бот-напоминалка запущен!")
-        logger.info(f"✅ Токен: {BOT_TOKEN[:10]}...")
-        logger.info("✅ Система с интерактивным списком активна")
-        logger.info("📋 Управление напоминаниями через кнопки")
-        logger.info("🔔 Уведомления будут приходить автоматически")
-        logger.info("⏰ Проверка каждые 10 секунд")
-        logger.info("=" * 50)
-        
-        await application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
-        
+        async with application:
+            await application.start()
+            user_state.start()
+            try:
+                await server.start()
+                
+                if WEBHOOK_URL:
+                    await application.bot.set_webhook(
+                        url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                        secret_token=webhook_secret,
+                        allowed_updates=Update.ALL_TYPES,
+                        drop_pending_updates=True,
+                        max_connections=max(40, CONCURRENT_UPDATES)
+                    )
+                else:
+                    await application.updater.start_polling(
+                        drop_pending_updates=True,
+                        allowed_updates=Update.ALL_TYPES
+                    )
+                
+                # Фоновые задачи: отправка напоминаний, обслуживание БД и мониторинг
+                background = [
+                    asyncio.create_task(maintenance_loop()),
+                    asyncio.create_task(monitor_loop_lag()),
+                ]
+                if DELIVERY_MODE == 'bot':
+                    background.append(asyncio.create_task(async_reminder_checker(BOT_TOKEN, application.bot)))
+                else:
+                    background.append(asyncio.create_task(_watch_foreign_writes(CACHE_WATCH_INTERVAL)))
+                
+                logger.info("=" * 50)
+                logger.info("🤖 Бот-напоминалка запущен!")
+                logger.info(f"✅ Токен: {BOT_TOKEN[:10]}...")
+                logger.info(f"✅ Режим: {'вебхук ' + WEBHOOK_URL if WEBHOOK_URL else 'опрос'}, порт {server.port}")
+                logger.info(f"✅ Одновременно обрабатывается обновлений: {CONCURRENT_UPDATES}")
+                if DELIVERY_MODE == 'bot':
+                    logger.info("🔔 Уведомления будут приходить автоматически")
+                else:
+                    logger.info("🔔 Уведомления отправляют процессы worker.py")
+                logger.info("=" * 50)
+                
+                await stop_event.wait()
+                logger.info("Остановка бота...")
+            
+            finally:
+                for task in background:
+                    task.cancel()
+                await asyncio.gather(*background, return_exceptions=True)
+                
+                await server.stop()
+                if application.updater and application.updater.running:
+                    await application.updater.stop()
+                await application.stop()
+                await user_state.stop()
+    
     except Exception as e:
-        logger.error(f"Ошибка запуска бота: {e}")
         logger.error(f"❌ Критическая ошибка: {e}")
+    finally:
+        await storage.close()
 
 def main():
     """Точка входа для Railway"""
@@ -1847,25 +1401,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "🤖 Telegram Reminder Bot is running!"
-
-@app.route('/health')
-def health():
-    return "OK", 200
-
-def run_flask():
-    port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port)
-
-if __name__ == '__main__':
-    # Запускаем Flask в отдельном потоке
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    
-    # Запускаем бота
-    asyncio.run(main_async())
\ No newline at end of file
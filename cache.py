@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, List
+
+_MISSING = object()
+
+# Все созданные кэши - для метрик cache_hits_total/cache_misses_total/cache_entries
+CACHES: List['LRUCache'] = []
+
+
+# LRU-кэш с временем жизни записей и счётчиками попаданий.
+# Потокобезопасен: к нему обращаются потоки БД.
+class LRUCache:
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._generation = 0
+        CACHES.append(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Значение из кэша или результат loader(), сохранённый в кэш.
+    # Если во время загрузки был сброс, результат не кэшируется - он мог устареть.
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self._generation
+            value = loader()
+            if generation == self._generation:
+                self.set(key, value)
+        return value
+
+    # То же для асинхронного loader (хранилище PostgreSQL)
+    async def aget_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self._generation
+            value = await loader()
+            if generation == self._generation:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._generation += 1
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    # Сброс всего кэша; начатые до него загрузки тоже не кэшируются
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hit_rate(),
+        }
+
+    def summary(self) -> str:
+        return (f"кэш {self.name}: {len(self._data)}/{self.maxsize} записей, "
+                f"попаданий {self.hit_rate() * 100:.1f}% ({self.hits}/{self.hits + self.misses}), "
+                f"сбросов {self.invalidations}")
@@ -0,0 +1,374 @@
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from telegram.error import Forbidden, RetryAfter
+
+from metrics import deliveries_total, delivery_failures, delivery_lag, delivery_lag_slo
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду всего и 1 в секунду на чат
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+
+# Цель по опозданию доставки по умолчанию (секунды)
+DEFAULT_LAG_SLO = 60.0
+
+# Результаты доставки
+SENT = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+# Сообщение не отправлялось (процесс останавливается): напоминание отпускается другим процессам
+RELEASED = 'released'
+
+# Сколько секунд при остановке ждать отправок, которые уже начались
+STOP_TIMEOUT = 10.0
+
+
+# Ведро токенов: rate токенов в секунду, не больше capacity в запасе
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Сколько секунд ждать до свободного токена (0 - токен взят)
+    def try_acquire(self) -> float:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            delay = self.try_acquire()
+            if delay == 0:
+                return
+            await asyncio.sleep(delay)
+
+    # Пауза после RetryAfter от Telegram
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return now >= self.paused_until and self.tokens >= self.capacity
+
+
+@dataclass
+class Delivery:
+    reminder_id: int
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    # Время напоминания (UTC epoch) для подсчёта опоздания отправки
+    due: Optional[float] = None
+    # Остальные напоминания сводки (id, время), отправленные этим же сообщением
+    digest: Tuple[Tuple[int, Optional[float]], ...] = ()
+    catch_up: bool = False
+
+    # Все напоминания, которые закрывает это сообщение: (id, время)
+    def covered(self) -> List[Tuple[int, Optional[float]]]:
+        return [(self.reminder_id, self.due), *self.digest]
+
+
+# Конвейер доставки: ограниченный пул воркеров с учётом лимитов Telegram
+class DeliveryPipeline:
+    """Параллельная отправка сообщений с ограничением скорости"""
+
+    def __init__(self, bot, on_result: Callable[[Delivery, str], Awaitable[None]],
+                 workers: int = 8, global_rate: float = GLOBAL_RATE,
+                 per_chat_rate: float = PER_CHAT_RATE, lag_slo: float = DEFAULT_LAG_SLO,
+                 on_attempt: Optional[Callable[[Delivery], Awaitable[bool]]] = None):
+        self.bot = bot
+        self.on_result = on_result
+        # Вызывается перед каждой отправкой: False - сообщение уже не наше и отбрасывается,
+        # ошибка - сообщение не отправляется (FAILED)
+        self.on_attempt = on_attempt
+        self.workers = workers
+        self.lag_slo = lag_slo
+        self.per_chat_rate = per_chat_rate
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._tasks = []
+        # Сообщения, ждущие повторной постановки в очередь: таймер -> сообщение
+        self._delayed: Dict[asyncio.TimerHandle, Delivery] = {}
+        # Сообщения, взятые воркером, но не начавшие отправляться к моменту остановки
+        self._interrupted: List[Delivery] = []
+        # Воркеры, которые сейчас отправляют сообщение, и признак остановки
+        self._sending: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"delivery-worker-{i}"))
+
+    # Остановка воркеров. Начавшиеся отправки доводятся до конца (не дольше timeout секунд):
+    # прерванная посреди отправки осталась бы с неизвестным результатом и ушла бы повторно.
+    # Сообщения, которые ещё не начинали отправляться, возвращаются как RELEASED.
+    async def stop(self, timeout: float = STOP_TIMEOUT):
+        self._stopping = True
+        for task in self._tasks:
+            if task not in self._sending:
+                task.cancel()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        unsent, self._interrupted = self._interrupted, []
+        for handle, delivery in self._delayed.items():
+            handle.cancel()
+            unsent.append(delivery)
+        self._delayed.clear()
+        while not self.queue.empty():
+            unsent.append(self.queue.get_nowait())
+            self.queue.task_done()
+        for delivery in unsent:
+            await self.on_result(delivery, RELEASED)
+
+    def submit(self, delivery: Delivery):
+        self.queue.put_nowait(delivery)
+
+    # Ждать, пока все поставленные сообщения не будут обработаны
+    async def join(self):
+        while True:
+            await self.queue.join()
+            if not self._delayed:
+                return
+            await asyncio.sleep(0.05)
+
+    def depth(self) -> int:
+        return self.queue.qsize() + len(self._delayed)
+
+    # Вернуть сообщение в очередь через delay секунд, не занимая воркер
+    def _requeue_later(self, delivery: Delivery, delay: float):
+        def put():
+            del self._delayed[handle]
+            self.queue.put_nowait(delivery)
+
+        handle = asyncio.get_running_loop().call_later(delay, put)
+        self._delayed[handle] = delivery
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_idle()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _worker(self):
+        while not self._stopping:
+            delivery = await self.queue.get()
+            attempts = delivery.attempts
+            try:
+                await self._process(delivery)
+            except asyncio.CancelledError:
+                if delivery.attempts == attempts:
+                    self._interrupted.append(delivery)
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера доставки для напоминания {delivery.reminder_id}: {e}")
+                # Без результата захват остался бы за этим процессом, а свои захваты он не повторяет
+                await self._report_failure(delivery)
+            finally:
+                self.queue.task_done()
+
+    async def _report_failure(self, delivery: Delivery):
+        try:
+            await self.on_result(delivery, FAILED)
+        except Exception as e:
+            logger.error(f"Не удалось записать ошибку доставки напоминания {delivery.reminder_id}: {e}")
+
+    async def _process(self, delivery: Delivery):
+        chat_bucket = self._chat_bucket(delivery.chat_id)
+        delay = chat_bucket.try_acquire()
+        if delay > 0:
+            self._requeue_later(delivery, delay)
+            return
+
+        await self.global_bucket.acquire()
+
+        if self.on_attempt is not None:
+            try:
+                owned = await self.on_attempt(delivery)
+            except Exception as e:
+                logger.error(f"Не удалось отметить начало отправки напоминания {delivery.reminder_id}: {e}")
+                delivery_failures.inc('outbox')
+                await self.on_result(delivery, FAILED)
+                return
+            if not owned:
+                logger.warning(f"Напоминание {delivery.reminder_id} уже не захвачено этим процессом "
+                               f"или изменилось, отправка отменена")
+                delivery_failures.inc('claim_lost')
+                return
+
+        task = asyncio.current_task()
+        self._sending.add(task)
+        try:
+            await self._send(delivery, chat_bucket)
+        finally:
+            self._sending.discard(task)
+
+    # Отправка и запись её результата
+    async def _send(self, delivery: Delivery, chat_bucket: TokenBucket):
+        delivery.attempts += 1
+        try:
+            await self.bot.send_message(chat_id=delivery.chat_id, text=delivery.text, **delivery.kwargs)
+        except RetryAfter as e:
+            retry_after = float(e.retry_after)
+            logger.warning(f"RetryAfter {retry_after}с для чата {delivery.chat_id}")
+            delivery_failures.inc('retry_after')
+            chat_bucket.pause(retry_after)
+            self._requeue_later(delivery, retry_after)
+            return
+        except Forbidden as e:
+            logger.error(f"Пользователь {delivery.chat_id} заблокировал бота: {e}")
+            delivery_failures.inc(BLOCKED)
+            await self.on_result(delivery, BLOCKED)
+            return
+        except Exception as e:
+            logger.error(f"Ошибка отправки напоминания {delivery.reminder_id}: {e}")
+            if "blocked" in str(e).lower():
+                delivery_failures.inc(BLOCKED)
+                await self.on_result(delivery, BLOCKED)
+            else:
+                delivery_failures.inc(type(e).__name__)
+                await self.on_result(delivery, FAILED)
+            return
+
+        deliveries_total.inc()
+        self._observe_lag(delivery)
+        await self.on_result(delivery, SENT)
+
+    # Опоздание каждого напоминания сообщения и его сравнение с целью
+    def _observe_lag(self, delivery: Delivery):
+        now = time.time()
+        histogram = delivery_lag.labels('catch_up' if delivery.catch_up else 'on_time')
+        for _, due in delivery.covered():
+            if due is None:
+                continue
+            lag = max(0.0, now - due)
+            histogram.observe(lag)
+            delivery_lag_slo.inc('ok' if lag <= self.lag_slo else 'breach')
+
+
+# Журнал доставки: результаты (id, срок срабатывания, статус) копятся в памяти и записываются пачками.
+# После сбоя повторно отправятся не больше max_batch сообщений из незаписанной пачки,
+# и каждая такая повторная отправка учитывается в outbox как неподтверждённая.
+class DeliveryJournal:
+    def __init__(self, flush: Callable[[List[Tuple[int, Optional[float], str]]], Awaitable[None]],
+                 max_batch: int = 100, flush_interval: float = 0.5):
+        self.flush_func = flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[int, Optional[float], str]] = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._periodic_flush(), name="delivery-journal")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def record(self, delivery: Delivery, status: str):
+        self._pending.extend((reminder_id, due, status) for reminder_id, due in delivery.covered())
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await self.flush_func(batch)
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала доставки ({len(batch)} записей): {e}")
+                self._pending = batch + self._pending
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+# Очередь просроченных напоминаний для режима догоняния: (id, срок), от самых старых.
+# Напоминания выдаются порциями, чтобы не ставить в очередь отправки всё сразу.
+# Как и в планировщике, удалённые записи кучи пропускаются при извлечении.
+class CatchUpBacklog:
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._pending: Dict[int, float] = {}
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, items: List[Tuple[int, float]]):
+        for reminder_id, due in items:
+            self._pending[reminder_id] = due
+            heapq.heappush(self._heap, (due, reminder_id))
+        if self._pending:
+            self._ready.set()
+
+    # Убрать напоминания, отправленные в составе чужой порции
+    def discard(self, reminder_ids: List[int]):
+        for reminder_id in reminder_ids:
+            self._pending.pop(reminder_id, None)
+        self._drop_stale()
+
+    # Следующая порция: не больше limit самых старых напоминаний
+    def take(self, limit: int) -> List[Tuple[int, float]]:
+        chunk = []
+        self._drop_stale()
+        while self._heap and len(chunk) < limit:
+            due, reminder_id = heapq.heappop(self._heap)
+            if self._pending.get(reminder_id) == due:
+                del self._pending[reminder_id]
+                chunk.append((reminder_id, due))
+            self._drop_stale()
+        return chunk
+
+    async def wait(self):
+        await self._ready.wait()
+
+    # Опоздание самого старого ожидающего напоминания (секунды)
+    def oldest_lag(self) -> float:
+        return max(0.0, time.time() - self._heap[0][0]) if self._heap else 0.0
+
+    def _drop_stale(self):
+        while self._heap and self._pending.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._pending:
+            self._heap.clear()
+            self._ready.clear()
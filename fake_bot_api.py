@@ -0,0 +1,252 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, TextIO
+from urllib.parse import parse_qsl
+
+from ingress import Response, WebhookServer
+
+logger = logging.getLogger(__name__)
+
+# Локальная замена Telegram Bot API для нагрузочных тестов (loadtest.py).
+# Бот подключается к ней через TELEGRAM_API_URL=http://127.0.0.1:<порт>.
+# Поддерживаются getMe, getUpdates (длинный опрос), deleteWebhook, sendMessage,
+# editMessageText и answerCallbackQuery; остальные методы отвечают true.
+# Задержка ответа и ответы 429 настраиваются, все вызовы записываются.
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Reminder', 'username': 'reminder_load_bot'}
+
+# Параметры, которые передаются строками; остальные приходят в JSON (числа, разметка)
+STRING_PARAMS = {'text', 'parse_mode', 'callback_query_id', 'inline_message_id', 'url', 'secret_token'}
+
+# Методы, на которые можно отвечать 429
+RATE_LIMITED_METHODS = ('sendMessage', 'editMessageText')
+
+
+# Вызов метода API: параметры, код ответа и время (time.time) начала и ответа
+@dataclass
+class ApiCall:
+    method: str
+    params: Dict[str, Any]
+    status: int = 200
+    started: float = 0.0
+    finished: float = 0.0
+    result: Any = None
+
+
+# Сообщение бота в чате; at - время получения (time.time), loadtest нажимает кнопки из reply_markup
+@dataclass
+class ChatMessage:
+    message_id: int
+    chat_id: int
+    text: str
+    reply_markup: Optional[Dict] = None
+    edited: bool = False
+    at: float = field(default_factory=time.time)
+
+    def callbacks(self) -> List[str]:
+        if not self.reply_markup:
+            return []
+        return [button.get('callback_data') for row in self.reply_markup.get('inline_keyboard', ())
+                for button in row if button.get('callback_data')]
+
+    def to_dict(self) -> Dict:
+        message = {'message_id': self.message_id, 'date': int(time.time()), 'from': BOT_USER,
+                   'chat': {'id': self.chat_id, 'type': 'private'}, 'text': self.text}
+        if self.reply_markup and 'inline_keyboard' in self.reply_markup:
+            message['reply_markup'] = self.reply_markup
+        return message
+
+
+class FakeBotApi(WebhookServer):
+    """HTTP-сервер с методами Bot API; обновления добавляет тест через push_message/push_callback"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: float = 0.0, retry_after: int = 1,
+                 rate_limited_methods=RATE_LIMITED_METHODS, record_path: Optional[str] = None, seed: int = 0):
+        super().__init__(None, host, port)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rate_limited_methods = set(rate_limited_methods)
+        self.record_path = record_path
+        self.calls: List[ApiCall] = []
+        self._random = random.Random(seed)
+        self._record: Optional[TextIO] = None
+
+        self._updates: List[Dict] = []
+        self._update_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self._closing = False
+        self._message_ids: Dict[int, itertools.count] = {}
+        self._callback_ids = itertools.count(1)
+        self.messages: Dict[int, Dict[int, ChatMessage]] = {}
+        # Ожидающие сообщений бота: (chat_id, условие, future)
+        self._waiters: Set[tuple] = set()
+
+    async def start(self):
+        if self.record_path:
+            self._record = open(self.record_path, 'w', encoding='utf-8')
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Тестовый Bot API слушает {self.host}:{self.port}")
+
+    # Ожидающие getUpdates отвечают пустым списком, чтобы их соединения закрылись до остановки
+    async def stop(self):
+        self._closing = True
+        self._new_updates.set()
+        await asyncio.sleep(0.1)
+        await super().stop()
+        if self._record is not None:
+            self._record.close()
+            self._record = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # Обновления от пользователей
+
+    def _push(self, update: Dict) -> int:
+        update['update_id'] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_updates.set()
+        return update['update_id']
+
+    def _next_message_id(self, chat_id: int) -> int:
+        return next(self._message_ids.setdefault(chat_id, itertools.count(1)))
+
+    # Текстовое сообщение пользователя
+    def push_message(self, user_id: int, text: str) -> int:
+        user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+        return self._push({'message': {
+            'message_id': self._next_message_id(user_id), 'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user, 'text': text
+        }})
+
+    # Нажатие кнопки под сообщением бота
+    def push_callback(self, user_id: int, message: ChatMessage, data: str) -> int:
+        user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+        return self._push({'callback_query': {
+            'id': str(next(self._callback_ids)), 'from': user, 'message': message.to_dict(),
+            'chat_instance': str(user_id), 'data': data
+        }})
+
+    # Ожидание сообщения бота в чате (нового или изменённого), для которого condition(message) истинно
+    async def wait_for(self, chat_id: int, condition: Callable[[ChatMessage], bool],
+                       timeout: float) -> Optional[ChatMessage]:
+        future = asyncio.get_running_loop().create_future()
+        waiter = (chat_id, condition, future)
+        self._waiters.add(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.discard(waiter)
+
+    def _notify(self, message: ChatMessage):
+        for waiter in list(self._waiters):
+            chat_id, condition, future = waiter
+            if chat_id == message.chat_id and not future.done() and condition(message):
+                future.set_result(message)
+                self._waiters.discard(waiter)
+
+    # HTTP
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Response:
+        # /bot<токен>/<метод>
+        parts = path.strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            return 404, 'application/json', b'{"ok":false,"error_code":404,"description":"Not Found"}'
+
+        call = ApiCall(parts[1], self._parse_params(headers, body), started=time.time())
+        delay = self.latency + self._random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+        if delay:
+            await asyncio.sleep(delay)
+
+        if call.method in self.rate_limited_methods and self.rate_limit and self._random.random() < self.rate_limit:
+            call.status = 429
+            payload = {'ok': False, 'error_code': 429,
+                       'description': f"Too Many Requests: retry after {self.retry_after}",
+                       'parameters': {'retry_after': self.retry_after}}
+        else:
+            handler = getattr(self, f"_api_{call.method}", None)
+            call.result = await handler(call.params) if handler else True
+            payload = {'ok': True, 'result': call.result}
+
+        call.finished = time.time()
+        self.calls.append(call)
+        if self._record is not None:
+            self._record.write(json.dumps({'method': call.method, 'params': call.params, 'status': call.status,
+                                           'started': call.started, 'finished': call.finished,
+                                           'result': call.result}, ensure_ascii=False) + '\n')
+        return call.status, 'application/json', json.dumps(payload, ensure_ascii=False).encode()
+
+    # Параметры запроса python-telegram-bot: форма, значения кроме строковых - JSON
+    @staticmethod
+    def _parse_params(headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        if not body:
+            return {}
+        if headers.get('content-type', '').startswith('application/json'):
+            return json.loads(body)
+
+        params = {}
+        for name, value in parse_qsl(body.decode(), keep_blank_values=True):
+            if name in STRING_PARAMS:
+                params[name] = value
+                continue
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                params[name] = value
+        return params
+
+    # Методы Bot API
+
+    async def _api_getMe(self, params):
+        return BOT_USER
+
+    async def _api_deleteWebhook(self, params):
+        if params.get('drop_pending_updates'):
+            self._updates.clear()
+        return True
+
+    async def _api_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+
+        while True:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            if self._updates or self._closing or time.monotonic() >= deadline:
+                return self._updates[:limit]
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        message = ChatMessage(self._next_message_id(chat_id), chat_id, params.get('text', ''),
+                              params.get('reply_markup'))
+        self.messages.setdefault(chat_id, {})[message.message_id] = message
+        self._notify(message)
+        return message.to_dict()
+
+    async def _api_editMessageText(self, params):
+        chat_id = int(params['chat_id'])
+        message_id = int(params['message_id'])
+        message = ChatMessage(message_id, chat_id, params.get('text', ''), params.get('reply_markup'), edited=True)
+        self.messages.setdefault(chat_id, {})[message_id] = message
+        self._notify(message)
+        return message.to_dict()
+
+    async def _api_answerCallbackQuery(self, params):
+        return True
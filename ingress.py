@@ -0,0 +1,219 @@
+import asyncio
+import hmac
+import json
+import logging
+import time
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+from metrics import render_metrics, update_latency
+
+logger = logging.getLogger(__name__)
+
+# Ограничения входящих запросов
+MAX_BODY_SIZE = 1 << 20
+MAX_HEADERS = 100
+IDLE_TIMEOUT = 75
+# Сколько ждать заголовков и тела после строки запроса
+REQUEST_TIMEOUT = 30
+
+# Заголовок с секретом, который Telegram передаёт при вызове вебхука
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 429: 'Too Many Requests', 503: 'Service Unavailable',
+}
+
+Response = Tuple[int, str, bytes]
+
+
+# Верхняя граница обновлений, ожидающих своей очереди внутри процессора
+MAX_PENDING_UPDATES = 100000
+
+
+# Параллельная обработка обновлений разных пользователей при строгом порядке для одного пользователя.
+# У каждого пользователя своя очередь: обновление ждёт завершения предыдущего обновления этого же
+# пользователя и только потом занимает один из max_concurrent_updates слотов обработки.
+# Поэтому ожидающие своей очереди обновления не занимают слоты и не задерживают других пользователей.
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обновления одного пользователя - последовательно, разных пользователей - параллельно"""
+
+    def __init__(self, max_concurrent_updates: int):
+        # Семафор базового класса берётся до очереди пользователя, поэтому он только ограничивает
+        # число ожидающих; реальный предел параллельности - свой семафор после очереди
+        super().__init__(MAX_PENDING_UPDATES)
+        self.concurrency = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+
+    # Ключ очереди: пользователь, для обновлений без пользователя - чат
+    @staticmethod
+    def _queue_key(update) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return ('chat', update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._queue_key(update)
+        previous = self._tails.get(key) if key is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._tails[key] = done
+
+        started = None
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            async with self._slots:
+                started = time.monotonic()
+                await coroutine
+        finally:
+            if started is None:
+                coroutine.close()
+            else:
+                update_latency.observe(time.monotonic() - started)
+            done.set_result(None)
+            if key is not None and self._tails.get(key) is done:
+                del self._tails[key]
+
+    # Сколько пользователей сейчас имеют необработанные обновления
+    def active_queues(self) -> int:
+        return len(self._tails)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+# Минимальный HTTP/1.1 сервер на asyncio в цикле событий бота:
+# вебхук Telegram, '/', '/health' и '/metrics'. Соединения keep-alive переиспользуются.
+class WebhookServer:
+    """HTTP-вход бота: обновления из вебхука сразу кладутся в update_queue приложения"""
+
+    def __init__(self, application: Application, host: str = '0.0.0.0', port: int = 8080,
+                 webhook_path: str = '/telegram', secret_token: Optional[str] = None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        # При port=0 система выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP-сервер слушает {self.host}:{self.port}, вебхук: {self.webhook_path}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, version, headers, body = request
+
+                if body is None:
+                    status, content_type, payload = 413, 'text/plain', b'Payload Too Large'
+                    keep_alive = False
+                else:
+                    status, content_type, payload = await self._route(method, path, headers, body)
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+                # На HEAD - только заголовки, с длиной тела, которое вернул бы GET
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                    + (payload if method != 'HEAD' else b'')
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    # Чтение запроса: (метод, путь, версия, заголовки, тело); None - соединение закрыто.
+    # Тело None - превышен MAX_BODY_SIZE. Заголовки и тело должны прийти за REQUEST_TIMEOUT.
+    async def _read_request(self, reader: asyncio.StreamReader):
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+        if not line:
+            return None
+        method, target, version = line.decode('latin-1').split()
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), deadline - time.monotonic())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ValueError('too many headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_SIZE:
+            return method, target, version, headers, None
+        body = await asyncio.wait_for(reader.readexactly(length), deadline - time.monotonic()) if length else b''
+        return method, target.split('?', 1)[0], version, headers, body
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Response:
+        if path == self.webhook_path:
+            if method != 'POST':
+                return 405, 'text/plain', b'Method Not Allowed'
+            return await self._handle_update(headers, body)
+
+        if method not in ('GET', 'HEAD'):
+            return 405, 'text/plain', b'Method Not Allowed'
+        if path == '/':
+            return 200, 'text/plain; charset=utf-8', "🤖 Telegram Reminder Bot is running!".encode()
+        if path == '/health':
+            if self.application.running:
+                return 200, 'text/plain', b'OK'
+            return 503, 'text/plain', b'Starting'
+        if path == '/metrics':
+            return 200, 'text/plain; version=0.0.4; charset=utf-8', render_metrics().encode()
+        return 404, 'text/plain', b'Not Found'
+
+    # Без секрета (режим опроса) вебхук не принимает обновлений
+    async def _handle_update(self, headers: Dict[str, str], body: bytes) -> Response:
+        received = headers.get(SECRET_HEADER, '').encode()
+        if not self.secret_token or not hmac.compare_digest(received, self.secret_token.encode()):
+            logger.warning("Запрос к вебхуку с неверным секретом")
+            return 403, 'text/plain', b'Forbidden'
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Некорректное обновление в вебхуке: {e}")
+            return 400, 'text/plain', b'Bad Request'
+
+        # Отвечаем сразу: обработка идёт в приложении, Telegram не ждёт её окончания
+        await self.application.update_queue.put(update)
+        return 200, 'text/plain', b'OK'
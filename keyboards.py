@@ -0,0 +1,295 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+from cache import LRUCache
+from metrics import register_report
+from render import DAYS_OF_WEEK
+from timeutil import format_epoch, now_epoch
+
+# Клавиатуры бота. Объекты telegram неизменяемы (python-telegram-bot 20), поэтому одна и та же
+# разметка безопасно переиспользуется во всех ответах: статические клавиатуры создаются один раз
+# при импорте, клавиатуры с id напоминания или набором дней собираются по шаблону и кэшируются.
+
+# Размер страницы списка напоминаний
+LIST_PAGE_SIZE = 8
+
+# Собранные клавиатуры по ключу (вид, параметры)
+keyboard_cache = LRUCache('keyboards', maxsize=int(os.environ.get('KEYBOARD_CACHE_SIZE', 4096)), ttl=86400)
+register_report(keyboard_cache.summary)
+
+# Шаблон клавиатуры: строки кнопок. Кнопка шаблона - готовая общая кнопка
+# или пара (текст, callback_data с полем {id}), из которой собирается кнопка напоминания
+Cell = Union[InlineKeyboardButton, Tuple[str, str]]
+Template = Tuple[Tuple[Cell, ...], ...]
+
+
+def _button(text: str, callback_data: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text, callback_data=callback_data)
+
+
+def _markup(rows: Iterable[Iterable[InlineKeyboardButton]]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(tuple(tuple(row) for row in rows))
+
+
+def _cell(cell: Cell, reminder_id: int) -> InlineKeyboardButton:
+    if isinstance(cell, InlineKeyboardButton):
+        return cell
+    text, callback_data = cell
+    return _button(text, callback_data.format(id=reminder_id))
+
+
+# Клавиатура по шаблону для напоминания reminder_id, из кэша
+def _from_template(name: str, template: Template, reminder_id: int) -> InlineKeyboardMarkup:
+    return keyboard_cache.get_or_load((name, reminder_id), lambda: _markup(
+        (_cell(cell, reminder_id) for cell in row) for row in template
+    ))
+
+
+BACK_TO_START = _button("🔙", "back_to_start")
+BACK_TO_START_ROW = (BACK_TO_START,)
+BACK_TO_START_LABELED = _button("🔙 Назад", "back_to_start")
+TO_LIST = _button("К списку", "back_to_list_0")
+
+# Основное меню
+MAIN_MENU = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("Создать напоминание"), KeyboardButton("Мои напоминания")],
+        [KeyboardButton("Ближайшие"), KeyboardButton("🔄"), KeyboardButton("Помощь")]
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Выберите действие..."
+)
+
+# Пустой список: создать напоминание или вернуться
+EMPTY_LIST_KEYBOARD = _markup([
+    [_button("Создать напоминание", "create_new")],
+    BACK_TO_START_ROW
+])
+
+# Напоминание не найдено или недоступно, изменение через список
+TO_LIST_KEYBOARD = _markup([
+    (TO_LIST,),
+    BACK_TO_START_ROW
+])
+
+# Под сообщениями со списками повторяющихся и ближайших напоминаний
+FULL_LIST_KEYBOARD = _markup([
+    [_button("Весь список", "back_to_list_0")],
+    BACK_TO_START_ROW
+])
+
+# После удаления или выполнения напоминания
+AFTER_ACTION_KEYBOARD = _markup([
+    [_button("📋 К списку", "back_to_list_0")],
+    (BACK_TO_START_LABELED,)
+])
+
+# Сводка пропущенных напоминаний: переход к списку напоминаний
+DIGEST_KEYBOARD = _markup([[_button("📋 Мои напоминания", "list_page_0")]])
+
+CONTROL_TEMPLATE: Template = (
+    (("📝 Изменить текст", "edit_text_{id}"), ("⏰ Изменить время", "edit_time_{id}")),
+    (("🔄 Изменить повторение", "edit_repeat_{id}"), ("❌ Удалить", "delete_confirm_{id}")),
+    (("✅ Выполнить сейчас", "done_now_{id}"), ("⏰ Отложить", "snooze_menu_{id}")),
+    (TO_LIST, BACK_TO_START),
+)
+
+DELETE_CONFIRM_TEMPLATE: Template = (
+    (("✅ Да, удалить", "delete_yes_{id}"), ("❌ Нет, отмена", "view_{id}")),
+)
+
+REMINDER_TEMPLATE: Template = (
+    (("✅ Выполнено", "done_{id}"), ("⏰ Отложить", "snooze_menu_{id}")),
+)
+
+SNOOZE_TEMPLATE: Template = (
+    (("5 мин", "snooze_5_{id}"), ("15 мин", "snooze_15_{id}"), ("30 мин", "snooze_30_{id}")),
+    (("1 час", "snooze_60_{id}"), ("2 часа", "snooze_120_{id}"), ("Завтра", "snooze_tomorrow_{id}")),
+    (("🔙", "view_{id}"),),
+)
+
+DETAILS_TEMPLATE: Template = (
+    (("К деталям", "view_{id}"),),
+    BACK_TO_START_ROW,
+)
+
+# После сохранения изменённых дней повторения
+DAYS_SAVED_TEMPLATE: Template = (
+    (("📋 К деталям", "view_{id}"),),
+    (BACK_TO_START_LABELED,),
+)
+
+REPEAT_TEMPLATE: Template = (
+    (("📌 Один раз", "{prefix}once"), ("📅 Ежедневно", "{prefix}daily")),
+    (("🗓️ Еженедельно", "{prefix}weekly"), ("📆 Выбрать дни", "{prefix}custom")),
+)
+
+# Интервалы ежедневного повторения (дни) и подписи кнопок
+DAILY_INTERVALS = (
+    (1, "Каждый день"), (2, "Каждые 2 дня"), (3, "Каждые 3 дня"),
+    (7, "Раз в неделю"), (14, "Раз в 2 недели"), (30, "Раз в месяц"),
+)
+
+
+# Создание основного меню
+def create_main_menu():
+    return MAIN_MENU
+
+# Создание клавиатуры для управления напоминанием
+def create_reminder_control_keyboard(reminder_id: int):
+    return _from_template('control', CONTROL_TEMPLATE, reminder_id)
+
+# Создание клавиатуры для подтверждения удаления
+def create_delete_confirm_keyboard(reminder_id: int):
+    return _from_template('delete_confirm', DELETE_CONFIRM_TEMPLATE, reminder_id)
+
+# Создание клавиатуры для напоминания (для уведомлений)
+def create_reminder_keyboard(reminder_id: int):
+    return _from_template('reminder', REMINDER_TEMPLATE, reminder_id)
+
+# Создание клавиатуры для выбора времени откладывания
+def create_snooze_options_keyboard(reminder_id: int):
+    return _from_template('snooze', SNOOZE_TEMPLATE, reminder_id)
+
+# Переход к карточке напоминания после изменения повторения
+def create_details_keyboard(reminder_id: int):
+    return _from_template('details', DETAILS_TEMPLATE, reminder_id)
+
+# Переход к карточке напоминания после сохранения дней повторения
+def create_days_saved_keyboard(reminder_id: int):
+    return _from_template('days_saved', DAYS_SAVED_TEMPLATE, reminder_id)
+
+# Клавиатура сводки пропущенных напоминаний
+def create_digest_keyboard():
+    return DIGEST_KEYBOARD
+
+# Создание клавиатуры для выбора типа повторения
+def create_repeat_keyboard(reminder_id: int = None):
+    return keyboard_cache.get_or_load(('repeat', reminder_id), lambda: _build_repeat_keyboard(reminder_id))
+
+def _build_repeat_keyboard(reminder_id: Optional[int]) -> InlineKeyboardMarkup:
+    prefix = f"edit_repeat_type_{reminder_id}_" if reminder_id else "repeat_"
+    rows = [[_button(text, callback_data.format(prefix=prefix)) for text, callback_data in row]
+            for row in REPEAT_TEMPLATE]
+
+    if reminder_id:
+        rows.append([_button("🔙", f"view_{reminder_id}")])
+    else:
+        rows.append([_button("⏭️ Пропустить", "repeat_skip")])
+    return _markup(rows)
+
+# Создание клавиатуры для ежедневного интервала
+def create_daily_interval_keyboard(reminder_id: int = None):
+    return keyboard_cache.get_or_load(('daily_interval', reminder_id),
+                                      lambda: _build_daily_interval_keyboard(reminder_id))
+
+def _build_daily_interval_keyboard(reminder_id: Optional[int]) -> InlineKeyboardMarkup:
+    prefix = f"edit_interval_{reminder_id}_" if reminder_id else "interval_"
+    buttons = [_button(text, f"{prefix}{interval}") for interval, text in DAILY_INTERVALS]
+    rows = [buttons[start:start + 2] for start in range(0, len(buttons), 2)]
+
+    back_callback = f"edit_repeat_{reminder_id}" if reminder_id else "interval_back"
+    rows.append([_button("🔙", back_callback)])
+    return _markup(rows)
+
+# Битовая маска выбранных дней недели: бит n - день n
+def days_mask(selected_days: Iterable[int]) -> int:
+    mask = 0
+    for day_num in selected_days:
+        mask |= 1 << day_num
+    return mask
+
+# Подписи кнопок дней в обоих состояниях: (не выбран, выбран)
+DAY_LABELS: Dict[int, Tuple[str, str]] = {
+    day_num: (f"◻️ {day_name[:3]}", f"✅ {day_name[:3]}") for day_num, day_name in DAYS_OF_WEEK.items()
+}
+
+# Кнопки дней при создании напоминания не зависят от напоминания - собраны заранее
+CREATE_DAY_BUTTONS: Dict[int, Tuple[InlineKeyboardButton, InlineKeyboardButton]] = {
+    day_num: tuple(_button(label, f"day_{day_num}") for label in labels) for day_num, labels in DAY_LABELS.items()
+}
+CREATE_DAYS_FOOTER = (_button("✅ Готово", "days_done"), _button("❌ Отмена", "days_cancel"))
+
+# Кнопки дней (в обоих состояниях) и нижний ряд для редактирования напоминания reminder_id
+def _edit_day_buttons(reminder_id: int):
+    day_buttons = {
+        day_num: tuple(_button(label, f"edit_day_{reminder_id}_{day_num}") for label in labels)
+        for day_num, labels in DAY_LABELS.items()
+    }
+    footer = (_button("✅ Готово", f"edit_days_done_{reminder_id}"), _button("❌ Отмена", f"edit_repeat_{reminder_id}"))
+    return day_buttons, footer
+
+# Создание клавиатуры для выбора дней недели.
+# При создании напоминания - готовая клавиатура на каждую маску дней (128 вариантов),
+# при редактировании - разметка из закэшированных кнопок напоминания.
+def create_days_keyboard(selected_days: List[int] = None, reminder_id: int = None):
+    mask = days_mask(selected_days or ())
+    if reminder_id:
+        day_buttons, footer = keyboard_cache.get_or_load(('edit_days', reminder_id),
+                                                         lambda: _edit_day_buttons(reminder_id))
+        return _days_markup(day_buttons, footer, mask)
+    return keyboard_cache.get_or_load(('days', mask),
+                                      lambda: _days_markup(CREATE_DAY_BUTTONS, CREATE_DAYS_FOOTER, mask))
+
+def _days_markup(day_buttons, footer, mask: int) -> InlineKeyboardMarkup:
+    buttons = [day_buttons[day_num][mask >> day_num & 1] for day_num in DAY_LABELS]
+    rows = [buttons[start:start + 2] for start in range(0, len(buttons), 2)]
+    rows.append(footer)
+    return _markup(rows)
+
+# Создание клавиатуры списка напоминаний.
+# reminders - строки текущей страницы; курсор страницы (reminder_time, id) передаётся в callback_data.
+# Строки списка меняются с каждым напоминанием, поэтому не кэшируются.
+def create_reminders_list_keyboard(reminders: List[Dict], page: int = 0, total_count: int = 0,
+                                   has_next: bool = False, page_size: int = LIST_PAGE_SIZE,
+                                   tz: Optional[str] = None):
+    keyboard = []
+
+    current_ts = now_epoch()
+
+    for reminder in reminders:
+        time_str = format_epoch(reminder['reminder_time'], '%d.%m %H:%M', tz)
+        text_preview = reminder['text'][:15] + "..." if len(reminder['text']) > 15 else reminder['text']
+
+        # Добавляем эмодзи для статуса
+        if reminder['sent']:
+            status = "✅"
+        elif reminder['is_active']:
+            if reminder['reminder_time'] < current_ts:
+                status = "⚠️"
+            else:
+                status = "⏳"
+        else:
+            status = "❌"
+
+        # Добавляем эмодзи для повторения
+        if reminder['repeat_type'] != 'once':
+            repeat_emoji = "🔄"
+        else:
+            repeat_emoji = ""
+
+        button_text = f"{status} {time_str} {text_preview} {repeat_emoji}"
+        keyboard.append((_button(button_text, f"view_{reminder['id']}"),))
+
+    # Добавляем кнопки навигации
+    nav_buttons = []
+    total_pages = max(1, (total_count + page_size - 1) // page_size)
+
+    if page > 0 and reminders:
+        first = reminders[0]
+        nav_buttons.append(_button("◀️ Назад", f"list_prev_{page-1}_{first['reminder_time']}_{first['id']}"))
+
+    nav_buttons.append(_button(f"{page+1}/{total_pages}", "list_page_current"))
+
+    if has_next and reminders:
+        last = reminders[-1]
+        nav_buttons.append(_button("Вперёд ▶️", f"list_next_{page+1}_{last['reminder_time']}_{last['id']}"))
+
+    keyboard.append(nav_buttons)
+
+    # Кнопка возврата
+    keyboard.append(BACK_TO_START_ROW)
+
+    return _markup(keyboard)
@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List
+
+from fake_bot_api import ChatMessage, FakeBotApi
+from timeutil import DATE_TIME_FORMAT, format_epoch
+
+logger = logging.getLogger(__name__)
+
+# Нагрузочный тест бота: bot.py запускается отдельным процессом против тестового Bot API
+# (fake_bot_api.py), N пользователей по сценарию создают напоминание, смотрят список,
+# карточку и ближайшие, получают уведомление и выполняют или откладывают его.
+# Результат: обновлений в секунду, p50/p99 времени ответа по действиям и опоздание доставки.
+#
+#   python loadtest.py --suite smoke
+#   python loadtest.py --suite all --json results.json
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Токен для тестового API: бот проверяет только, что он задан
+FAKE_TOKEN = '123456:LOADTEST'
+
+# Первый id пользователя в тесте
+FIRST_USER_ID = 100000
+
+
+# Набор параметров прогона. Сроки напоминаний назначаются с точностью до минуты,
+# поэтому раунд длится от lead до lead + 60 секунд.
+@dataclass
+class Suite:
+    users: int
+    rounds: int = 1
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_limit: float = 0.0
+    retry_after: int = 1
+    lead: int = 20
+    reply_timeout: float = 15.0
+    description: str = ''
+
+
+SUITES = {
+    'smoke': Suite(users=5, description="Проверка сценария на нескольких пользователях"),
+    'baseline': Suite(users=100, rounds=2, description="Пропускная способность без задержек API"),
+    'latency': Suite(users=100, rounds=2, latency=0.1, jitter=0.1,
+                     description="Задержка API 100-200 мс на каждый вызов"),
+    'rate_limit': Suite(users=100, rounds=2, rate_limit=0.05, retry_after=1,
+                        description="5% sendMessage/editMessageText отвечают 429"),
+}
+
+
+# Результаты прогона
+@dataclass
+class Stats:
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    delivery_lags: List[float] = field(default_factory=list)
+    replies: List[float] = field(default_factory=list)
+    updates: int = 0
+    lost_replies: int = 0
+    lost_notifications: int = 0
+    aborted_users: int = 0
+
+    def reply(self, action: str, started: float, message: ChatMessage):
+        self.latencies.setdefault(action, []).append(message.at - started)
+        self.replies.append(message.at)
+
+
+# Процентиль по ближайшему рангу
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(max(values, default=0.0) * 1000, 1),
+    }
+
+
+# Уведомление о наступившем напоминании (отдельное или сводка пропущенных)
+def is_notification(message: ChatMessage) -> bool:
+    return '*напоминание*' in message.text or message.text.startswith('📬')
+
+
+def _ids(message: ChatMessage, prefix: str) -> List[int]:
+    pattern = re.compile(rf'^{prefix}(\d+)$')
+    return [int(match.group(1)) for match in map(pattern.match, message.callbacks()) if match]
+
+
+# Сценарий одного пользователя
+class VirtualUser:
+    """Пользователь, который по очереди проходит раунды сценария"""
+
+    def __init__(self, api: FakeBotApi, suite: Suite, stats: Stats, user_id: int, rng: random.Random):
+        self.api = api
+        self.suite = suite
+        self.stats = stats
+        self.user_id = user_id
+        self.rng = rng
+
+    # Отправить обновление и дождаться ответа бота, для которого condition истинно
+    async def _step(self, action: str, send: Callable[[], int],
+                    condition: Callable[[ChatMessage], bool]) -> ChatMessage:
+        waiter = asyncio.create_task(self.api.wait_for(
+            self.user_id, lambda message: not is_notification(message) and condition(message),
+            self.suite.reply_timeout
+        ))
+        await asyncio.sleep(0)
+        started = time.time()
+        send()
+        self.stats.updates += 1
+        message = await waiter
+        if message is None:
+            self.stats.lost_replies += 1
+            raise TimeoutError(f"нет ответа на {action}")
+        self.stats.reply(action, started, message)
+        return message
+
+    def say(self, action: str, text: str, condition: Callable[[ChatMessage], bool]):
+        return self._step(action, lambda: self.api.push_message(self.user_id, text), condition)
+
+    def click(self, action: str, message: ChatMessage, data: str, condition: Callable[[ChatMessage], bool]):
+        return self._step(action, lambda: self.api.push_callback(self.user_id, message, data), condition)
+
+    async def run(self):
+        # Пользователи начинают не одновременно, но в пределах секунды
+        await asyncio.sleep(self.rng.random())
+        try:
+            for number in range(self.suite.rounds):
+                await self.round(number)
+        except TimeoutError as e:
+            self.stats.aborted_users += 1
+            logger.warning(f"Пользователь {self.user_id} остановлен: {e}")
+
+    async def round(self, number: int):
+        text = f"Нагрузка {self.user_id}-{number}"
+
+        await self.say('create', "Создать напоминание", lambda m: 'Введите текст' in m.text)
+        await self.say('create', text, lambda m: 'введите дату' in m.text)
+
+        # Срок - начало минуты не раньше чем через lead секунд
+        due = (int(time.time()) + self.suite.lead + 59) // 60 * 60
+        message = await self.say('create', format_epoch(due, DATE_TIME_FORMAT),
+                                 lambda m: 'repeat_once' in m.callbacks())
+        notification = asyncio.create_task(self.api.wait_for(
+            self.user_id, lambda m: text in m.text and is_notification(m),
+            due - time.time() + self.suite.lead + 60
+        ))
+        await self.click('create', message, 'repeat_once', lambda m: 'создано успешно' in m.text)
+
+        message = await self.say('list', "Мои напоминания", lambda m: bool(_ids(m, 'view_')))
+        reminder_id = max(_ids(message, 'view_'))
+        await self.click('list', message, f"view_{reminder_id}", lambda m: 'Детали напоминания' in m.text)
+        await self.say('list', "Ближайшие", lambda m: True)
+
+        message = await notification
+        if message is None:
+            self.stats.lost_notifications += 1
+            return
+        self.stats.delivery_lags.append(message.at - due)
+        done_ids = _ids(message, 'done_')
+        if not done_ids:
+            return
+        reminder_id = done_ids[0]
+
+        # Чётные раунды - выполнить, нечётные - отложить на 5 минут
+        if number % 2 == 0:
+            await self.click('complete', message, f"done_{reminder_id}", lambda m: m.edited)
+        else:
+            message = await self.click('snooze', message, f"snooze_menu_{reminder_id}",
+                                       lambda m: f"snooze_5_{reminder_id}" in m.callbacks())
+            await self.click('snooze', message, f"snooze_5_{reminder_id}", lambda m: 'отложено' in m.text)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Прогон одного набора: тестовый API в этом процессе, бот - в дочернем
+async def run_suite(name: str, suite: Suite, seed: int, workdir: str, record: bool) -> Dict:
+    api = FakeBotApi(latency=suite.latency, jitter=suite.jitter, rate_limit=suite.rate_limit,
+                     retry_after=suite.retry_after, seed=seed,
+                     record_path=os.path.join(workdir, f"{name}.calls.jsonl") if record else None)
+    await api.start()
+
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN_REMINDER': FAKE_TOKEN,
+        'TELEGRAM_API_URL': api.url,
+        'REMINDERS_DB': os.path.join(workdir, f"{name}.db"),
+        'PORT': str(_free_port()),
+        'DELIVERY_MODE': 'bot',
+    })
+    env.pop('WEBHOOK_URL', None)
+    env.pop('DATABASE_URL', None)
+    bot_log_path = os.path.join(workdir, f"{name}.bot.log")
+    bot_log = open(bot_log_path, 'w', encoding='utf-8')
+    process = subprocess.Popen([sys.executable, os.path.join(BOT_DIR, 'bot.py')], cwd=workdir, env=env,
+                               stdout=bot_log, stderr=subprocess.STDOUT)
+
+    stats = Stats()
+    try:
+        # Бот готов, когда начал опрашивать getUpdates
+        deadline = time.monotonic() + 60
+        while not any(call.method == 'getUpdates' for call in api.calls):
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"бот не запустился, см. {bot_log_path}")
+            await asyncio.sleep(0.1)
+
+        rng = random.Random(seed)
+        users = [VirtualUser(api, suite, stats, FIRST_USER_ID + i, random.Random(rng.random()))
+                 for i in range(suite.users)]
+        started = time.time()
+        await asyncio.gather(*(user.run() for user in users))
+        duration = time.time() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, process.wait, 30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        bot_log.close()
+        await api.stop()
+
+    # Обновлений в секунду: по секундам, в которые бот отвечал
+    per_second = Counter(int(at) for at in stats.replies)
+    calls = Counter(call.method for call in api.calls)
+    return {
+        'suite': name,
+        'description': suite.description,
+        'params': {'users': suite.users, 'rounds': suite.rounds, 'latency': suite.latency, 'jitter': suite.jitter,
+                   'rate_limit': suite.rate_limit, 'seed': seed},
+        'duration_s': round(duration, 1),
+        'updates': stats.updates,
+        'updates_per_s': {
+            'mean': round(len(stats.replies) / len(per_second), 1) if per_second else 0.0,
+            'peak': max(per_second.values(), default=0),
+        },
+        'latency': {action: summarize(values) for action, values in sorted(stats.latencies.items())},
+        'latency_all': summarize([value for values in stats.latencies.values() for value in values]),
+        'delivery_lag': summarize(stats.delivery_lags),
+        'lost_replies': stats.lost_replies,
+        'lost_notifications': stats.lost_notifications,
+        'aborted_users': stats.aborted_users,
+        'api_calls': dict(calls.most_common()),
+        'rate_limited': sum(1 for call in api.calls if call.status == 429),
+        'bot_log': bot_log_path,
+    }
+
+
+def print_result(result: Dict):
+    print(f"\n== {result['suite']}: {result['description']}")
+    print(f"   пользователей {result['params']['users']}, раундов {result['params']['rounds']}, "
+          f"{result['duration_s']} с, обновлений {result['updates']}")
+    rate = result['updates_per_s']
+    print(f"   обновлений/с: в среднем {rate['mean']}, пик {rate['peak']}")
+    for action, row in list(result['latency'].items()) + [('все', result['latency_all'])]:
+        print(f"   ответ {action:<9} n={row['count']:<5} p50 {row['p50_ms']:>7} мс  "
+              f"p99 {row['p99_ms']:>7} мс  max {row['max_ms']:>7} мс")
+    lag = result['delivery_lag']
+    print(f"   опоздание доставки  n={lag['count']:<5} p50 {lag['p50_ms']:>7} мс  "
+          f"p99 {lag['p99_ms']:>7} мс  max {lag['max_ms']:>7} мс")
+    print(f"   потеряно ответов {result['lost_replies']}, уведомлений {result['lost_notifications']}, "
+          f"остановлено пользователей {result['aborted_users']}, ответов 429: {result['rate_limited']}")
+    print(f"   вызовы API: {result['api_calls']}")
+
+
+async def main_async(args) -> List[Dict]:
+    names = list(SUITES) if args.suite == 'all' else [args.suite]
+    workdir = args.workdir or tempfile.mkdtemp(prefix='loadtest-')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    for name in names:
+        suite = SUITES[name]
+        if args.users:
+            suite = replace(suite, users=args.users)
+        if args.rounds:
+            suite = replace(suite, rounds=args.rounds)
+        logger.info(f"Набор {name}: {suite}")
+        result = await run_suite(name, suite, args.seed, workdir, args.record)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота против тестового Bot API")
+    parser.add_argument('--suite', choices=list(SUITES) + ['all'], default='smoke')
+    parser.add_argument('--users', type=int, help="число пользователей вместо заданного в наборе")
+    parser.add_argument('--rounds', type=int, help="число раундов вместо заданного в наборе")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help="каталог для БД, логов бота и записей вызовов (по умолчанию временный)")
+    parser.add_argument('--record', action='store_true', help="записать все вызовы API в <набор>.calls.jsonl")
+    parser.add_argument('--json', help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    results = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if any(result['lost_replies'] or result['lost_notifications'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
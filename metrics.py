@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Префикс имён метрик в /metrics
+METRICS_PREFIX = 'reminder_bot_'
+
+# Границы корзин для задержки цикла событий и обработчиков (секунды)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Границы корзин для запросов к БД (секунды)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Границы корзин для опоздания доставки напоминаний (секунды)
+DELIVERY_LAG_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+Labels = Tuple[str, ...]
+
+# Все метрики для /metrics в порядке создания
+REGISTRY: List['Metric'] = []
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Базовый класс метрики: имя, описание, тип и строки в текстовом формате Prometheus
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str = '', labelnames: Sequence[str] = (), register: bool = True):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        if register:
+            REGISTRY.append(self)
+
+    def expose(self) -> Iterable[str]:
+        name = METRICS_PREFIX + self.name
+        if self.help:
+            yield f'# HELP {name} {self.help}'
+        yield f'# TYPE {name} {self.kind}'
+        yield from self._samples(name)
+
+    def _samples(self, name: str) -> Iterable[str]:
+        return ()
+
+
+# Гистограмма с фиксированными корзинами.
+# Наблюдения приходят и из потоков БД, поэтому запись под блокировкой.
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, buckets: Sequence[float], help: str = '',
+                 labelnames: Sequence[str] = (), register: bool = True):
+        super().__init__(name, help, labelnames, register)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+        self._children: Dict[Labels, 'Histogram'] = {}
+
+    # Гистограмма для значений меток (создаётся при первом обращении)
+    def labels(self, *values) -> 'Histogram':
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(
+                    values, Histogram(self.name, self.buckets, register=False))
+        return child
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    # Оценка квантиля по верхней границе корзины
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> str:
+        if not self.count:
+            return f"{self.name}: нет данных"
+        return (f"{self.name}: n={self.count} avg={self.sum / self.count * 1000:.1f}мс "
+                f"p50<={self.quantile(0.5) * 1000:.1f}мс p99<={self.quantile(0.99) * 1000:.1f}мс "
+                f"max={self.max * 1000:.1f}мс")
+
+    def _samples(self, name: str) -> Iterable[str]:
+        series = list(self._children.items()) if self.labelnames else [((), self)]
+        for values, histogram in series:
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                yield f'{name}_bucket{le} {cumulative}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{name}_sum{labels} {_format_value(total)}'
+            yield f'{name}_count{labels} {count}'
+
+
+# Счётчик, только растёт. С метками: counter.inc('blocked')
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str = '', labelnames: Sequence[str] = (), register: bool = True):
+        super().__init__(name, help, labelnames, register)
+        # Счётчик без меток виден в /metrics сразу, с нулём
+        self._values: Dict[Labels, float] = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount: float = 1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def value(self, *values) -> float:
+        return self._values.get(values, 0)
+
+    def _samples(self, name: str) -> Iterable[str]:
+        for values, value in sorted(self._values.items()):
+            yield f'{name}{_format_labels(self.labelnames, values)} {_format_value(value)}'
+
+
+# Значение, которое считывается при запросе /metrics: число или функция без аргументов.
+# Функция может вернуть словарь {значения меток: число} - так отдаются, например, счётчики кэшей.
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str = '', labelnames: Sequence[str] = (),
+                 kind: str = 'gauge', register: bool = True):
+        super().__init__(name, help, labelnames, register)
+        self.kind = kind
+        self._values: Dict[Labels, Union[float, Callable]] = {}
+
+    def set(self, value: float, *values):
+        self._values[values] = value
+
+    def set_function(self, func: Callable, *values):
+        self._values[values] = func
+
+    def _samples(self, name: str) -> Iterable[str]:
+        for values, value in list(self._values.items()):
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    logger.warning(f"Ошибка чтения метрики {self.name}: {e}")
+                    continue
+            if isinstance(value, dict):
+                for sub_values, sub_value in sorted(value.items()):
+                    yield f'{name}{_format_labels(self.labelnames, values + tuple(sub_values))} {_format_value(sub_value)}'
+            else:
+                yield f'{name}{_format_labels(self.labelnames, values)} {_format_value(value)}'
+
+
+event_loop_lag = Histogram('event_loop_lag', LAG_BUCKETS, 'Задержка пробуждения цикла событий, секунды')
+
+# Время обработки одного обновления Telegram обработчиками бота
+update_latency = Histogram('update_latency', LAG_BUCKETS, 'Время обработки обновления, секунды')
+
+# Время обработчика callback-кнопки по маршруту ('done_', 'edit_text_', ...)
+handler_latency = Histogram('handler_latency', LAG_BUCKETS, 'Время обработчика кнопки, секунды', ('route',))
+
+# Время функции доступа к данным в потоке БД
+db_query_seconds = Histogram('db_query_seconds', DB_BUCKETS, 'Время запроса к БД, секунды', ('function',))
+
+# Опоздание доставки: момент отправки минус время напоминания.
+# mode: 'on_time' - обычная отправка, 'catch_up' - догоняние после простоя
+delivery_lag = Histogram('delivery_lag', DELIVERY_LAG_BUCKETS, 'Опоздание отправки напоминания, секунды', ('mode',))
+
+# Отправки в пределах цели по опозданию (DELIVERY_LAG_SLO) и с её нарушением
+delivery_lag_slo = Counter('delivery_lag_slo_total', 'Отправки в пределах цели по опозданию и сверх неё', ('result',))
+
+# Результаты отправки и причины ошибок
+deliveries_total = Counter('deliveries_total', 'Отправленные напоминания')
+delivery_failures = Counter('delivery_failures_total', 'Ошибки отправки напоминаний', ('reason',))
+
+# Сверка журнала отправок (outbox): повтор после отправки с неизвестным исходом ('in_doubt'),
+# пропуск уже отправленного срабатывания ('duplicate_skipped'), отказ после лимита
+# неподтверждённых попыток ('abandoned'), отмена отправки удалённого напоминания ('cancelled')
+outbox_events = Counter('outbox_events_total', 'События сверки журнала отправок', ('event',))
+
+# Обслуживание БД: перенесено в архив ('archived'), удалено из outbox ('outbox_pruned'),
+# возвращено страниц файлу базы ('vacuum_pages')
+maintenance_rows = Counter('maintenance_rows_total', 'Строки и страницы, обработанные обслуживанием БД', ('action',))
+
+# Глубина очередей: обновления, отправка, журнал, планировщик
+queue_depth = Gauge('queue_depth', 'Глубина очередей', ('queue',))
+
+# Дополнительные сводки для периодического отчёта (например, статистика кэшей)
+REPORTERS: List[Callable[[], str]] = []
+
+
+def register_report(reporter: Callable[[], str]):
+    REPORTERS.append(reporter)
+
+
+# Текстовый отчёт для лога
+def render_report() -> str:
+    lines = [event_loop_lag.summary(), update_latency.summary()]
+    lines.extend(reporter() for reporter in REPORTERS)
+    return '\n'.join(lines)
+
+
+# Все метрики в текстовом формате Prometheus для /metrics
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+# Измерение задержки цикла событий: насколько позже положенного просыпается sleep
+async def monitor_loop_lag(interval: float = 0.5, report_every: float = 300):
+    last_report = time.monotonic()
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        event_loop_lag.observe(max(0.0, now - started - interval))
+
+        if now - last_report >= report_every:
+            for line in render_report().splitlines():
+                logger.info(line)
+            last_report = now
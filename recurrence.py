@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from timeutil import from_epoch, localize, to_epoch
+
+ALL_DAYS_MASK = 0b1111111
+
+
+# Дни недели '0,2,4' -> битовая маска (бит 0 - понедельник)
+@lru_cache(maxsize=128)
+def days_to_mask(repeat_days: str) -> int:
+    mask = 0
+    for day in repeat_days.split(','):
+        if day:
+            mask |= 1 << int(day)
+    return mask & ALL_DAYS_MASK
+
+
+# Через сколько дней (1..7) после weekday ближайший день из маски
+def _days_until_next(mask: int, weekday: int) -> int:
+    rotated = ((mask >> (weekday + 1)) | (mask << (6 - weekday))) & ALL_DAYS_MASK
+    return (rotated & -rotated).bit_length()
+
+
+# Ближайшее повторение с шагом interval дней строго после after
+def _next_by_interval(dt: datetime, interval: int, after: datetime) -> datetime:
+    delta_days = (after.date() - dt.date()).days
+    steps = max(1, -(-delta_days // interval))
+    candidate = dt + timedelta(days=steps * interval)
+    if candidate <= after:
+        candidate += timedelta(days=interval)
+    return candidate
+
+
+# Ближайший выбранный день недели строго после after, в то же время суток
+def _next_by_weekdays(dt: datetime, mask: int, after: datetime) -> datetime:
+    same_day = datetime.combine(after.date(), dt.time())
+    if mask >> after.weekday() & 1 and same_day > after:
+        return same_day
+    return same_day + timedelta(days=_days_until_next(mask, after.weekday()))
+
+
+# Следующее срабатывание после after (по умолчанию после текущего срабатывания ts).
+# Шаги считаются по часам пользователя в поясе tz, чтобы '9:00' оставалось 9:00 при переходе на летнее время.
+# None - напоминание не повторяется.
+def next_occurrence(ts: int, repeat_type: str, repeat_interval: int = 1,
+                    repeat_days: str = '', after: Optional[int] = None,
+                    tz: Optional[str] = None) -> Optional[int]:
+    if repeat_type == 'once':
+        return None
+
+    dt = from_epoch(ts, tz).replace(tzinfo=None)
+    after_dt = from_epoch(max(ts, after if after is not None else ts), tz).replace(tzinfo=None)
+
+    if repeat_type == 'daily':
+        result = _next_by_interval(dt, max(1, repeat_interval or 1), after_dt)
+    elif repeat_type == 'weekly':
+        result = _next_by_interval(dt, 7 * max(1, repeat_interval or 1), after_dt)
+    elif repeat_type == 'custom':
+        mask = days_to_mask(repeat_days or '')
+        if not mask:
+            return None
+        result = _next_by_weekdays(dt, mask, after_dt)
+    else:
+        return None
+
+    return to_epoch(localize(result, tz))
@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from timeutil import DATE_TIME_FORMAT, format_epoch
+
+# Тексты сообщений с напоминаниями: уведомления, карточка, списки, подтверждение создания.
+# Шаблоны - готовые str.format, таблицы дней недели и форм слов считаются один раз при импорте.
+# Текст напоминаний вводит пользователь, в сообщения с parse_mode='Markdown' он попадает
+# только через escape_markdown/bold.
+
+# Дни недели для повторения
+DAYS_OF_WEEK = {
+    0: "Понедельник",
+    1: "Вторник",
+    2: "Среда",
+    3: "Четверг",
+    4: "Пятница",
+    5: "Суббота",
+    6: "Воскресенье"
+}
+
+# "Каждый понедельник", "каждую среду" - винительный падеж
+WEEKDAY_EVERY = (
+    "каждый понедельник", "каждый вторник", "каждую среду", "каждый четверг",
+    "каждую пятницу", "каждую субботу", "каждое воскресенье"
+)
+
+# "По понедельникам, средам" - дательный падеж множественного числа
+WEEKDAY_ON = ("понедельникам", "вторникам", "средам", "четвергам", "пятницам", "субботам", "воскресеньям")
+
+# Формы слова для числа: (1 день, 2 дня, 5 дней)
+DAY_FORMS = ("день", "дня", "дней")
+HOUR_FORMS = ("час", "часа", "часов")
+MINUTE_FORMS = ("минуту", "минуты", "минут")
+TIMES_FORMS = ("раз", "раза", "раз")
+
+
+def _plural_index(n: int) -> int:
+    if n % 10 == 1 and n % 100 != 11:
+        return 0
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return 1
+    return 2
+
+
+# Номер формы для n % 100
+_PLURAL_INDEX = tuple(_plural_index(n) for n in range(100))
+
+
+# Форма слова для числа n: plural(3, HOUR_FORMS) -> "часа"
+def plural(n: int, forms: Tuple[str, str, str]) -> str:
+    return forms[_PLURAL_INDEX[abs(n) % 100]]
+
+
+# Экранирование для parse_mode='Markdown' (первая версия разметки): вне сущностей
+# служебные символы экранируются обратной косой чертой.
+# str.replace по четырём символам быстрее str.translate на кириллице.
+_MARKDOWN_SPECIAL = ('_', '*', '`', '[')
+
+
+def escape_markdown(text: str) -> str:
+    for char in _MARKDOWN_SPECIAL:
+        if char in text:
+            text = text.replace(char, '\\' + char)
+    return text
+
+
+# Жирный текст. Внутри сущности экранировать нельзя: до звёздочки из текста
+# сущность закрывается и открывается заново после неё
+def bold(text: str) -> str:
+    if '*' not in text:
+        return f"*{text}*" if text else ""
+    return '\\*'.join(f"*{part}*" if part else "" for part in text.split('*'))
+
+
+# Оставшееся время: "2 д. 3 ч. 15 мин." или "менее минуты"
+def time_left(delta: timedelta) -> str:
+    return _time_left(int(delta.total_seconds()) // 60)
+
+
+@lru_cache(maxsize=4096)
+def _time_left(minutes: int) -> str:
+    days, rest = divmod(minutes, 1440)
+    hours, minutes = divmod(rest, 60)
+
+    parts = []
+    if days > 0:
+        parts.append(f"{days} д.")
+    if hours > 0:
+        parts.append(f"{hours} ч.")
+    if minutes > 0:
+        parts.append(f"{minutes} мин.")
+    return " ".join(parts) if parts else "менее минуты"
+
+
+# Срочность по оставшемуся времени: меньше часа, меньше трёх часов, больше
+def urgency(delta: timedelta) -> str:
+    seconds = delta.total_seconds()
+    if seconds < 3600:
+        return "🔴"
+    if seconds < 3 * 3600:
+        return "🟠"
+    return "🟢"
+
+
+# Интервал ежедневного повторения: "каждый день", "каждые 2 дня", "раз в неделю"
+INTERVAL_TEXT = {
+    1: "каждый день",
+    7: "раз в неделю",
+    14: "раз в 2 недели",
+    30: "раз в месяц",
+}
+
+
+def interval_text(interval: int) -> str:
+    text = INTERVAL_TEXT.get(interval)
+    if text is None:
+        text = f"каждые {interval} {plural(interval, DAY_FORMS)}"
+    return text
+
+
+# Описание повторения: "Каждый день", "Каждую среду", "По понедельникам, пятницам"; '' - без повторения.
+# weekday - день недели срабатывания, если у еженедельного напоминания не сохранены дни.
+@lru_cache(maxsize=1024)
+def repeat_text(repeat_type: str, repeat_interval: int = 1, repeat_days: str = '',
+                weekday: Optional[int] = None) -> str:
+    if repeat_type == 'daily':
+        text = interval_text(repeat_interval or 1)
+    elif repeat_type in ('weekly', 'custom'):
+        days = [int(d) for d in (repeat_days or '').split(',') if d]
+        if not days and weekday is not None:
+            days = [weekday]
+        if not days:
+            return ""
+        if repeat_type == 'weekly' and len(days) == 1:
+            text = WEEKDAY_EVERY[days[0]]
+        else:
+            text = "по " + ", ".join(WEEKDAY_ON[d] for d in days)
+    else:
+        return ""
+    return text[0].upper() + text[1:]
+
+
+# Время в часовом поясе пользователя. Напоминания назначаются с точностью до минуты,
+# поэтому одни и те же сроки повторяются в уведомлениях многих пользователей.
+@lru_cache(maxsize=8192)
+def format_time(ts: int, tz: Optional[str] = None) -> str:
+    return format_epoch(ts, DATE_TIME_FORMAT, tz)
+
+
+NOTIFICATION_TEMPLATE = """
+💭 *напоминание*{repeat}
+
+📝 {text}
+⏰ {time}{postponed}
+
+Выберите действие:
+""".format
+
+DETAILS_TEMPLATE = """
+💭 *Детали напоминания*
+
+{status}
+
+📝 *Текст:* {text}
+⏰ *Время:* {time}{repeat}{postponed}
+
+🌟*Выберите действие:*
+""".format
+
+CREATED_TEMPLATE = """
+💭 *напоминание создано успешно!*
+
+📝 *Текст:* {text}
+⏰ *Время:* {time}
+⏱️ *Через:* {time_left}{repeat}
+""".format
+
+UPCOMING_ITEM_TEMPLATE = "{urgency} {title}{postponed}\n   🕐 {time}\n   ⏱️ Через: {time_left}\n\n".format
+
+REPEATING_ITEM_TEMPLATE = "{number}. {title}\n   🕐 Время: {time}\n   🔄 Повтор: {repeat}\n   🆔 ID: {id}\n\n".format
+
+
+# Текст уведомления о наступившем напоминании
+def reminder_message(text: str, reminder_ts: int, postponed_count: int, repeat_type: str,
+                     tz: Optional[str] = None) -> str:
+    return NOTIFICATION_TEMPLATE(
+        repeat="\n🔄 *Повторяющееся напоминание*" if repeat_type != 'once' else "",
+        text=escape_markdown(text),
+        time=format_time(reminder_ts, tz),
+        postponed=f"\n⏰ Откладывалось: {postponed_count} {plural(postponed_count, TIMES_FORMS)}"
+        if postponed_count > 0 else ""
+    )
+
+
+# Карточка напоминания. reminder_time и now - в часовом поясе пользователя.
+def details_message(reminder: Dict, reminder_time: datetime, now: datetime) -> str:
+    if reminder['sent']:
+        status = "✅ *Выполнено*"
+    elif not reminder['is_active']:
+        status = "❌ *Неактивно*"
+    elif reminder_time < now:
+        status = "⚠️ *Просрочено*"
+    else:
+        status = f"⏳ *Ожидает*\n⏱️ *Через:* {time_left(reminder_time - now)}"
+
+    repeat = repeat_text(reminder['repeat_type'], reminder['repeat_interval'], reminder['repeat_days'],
+                         reminder_time.weekday())
+    postponed_count = reminder['postponed_count']
+    return DETAILS_TEMPLATE(
+        status=status,
+        text=escape_markdown(reminder['text']),
+        time=reminder_time.strftime(DATE_TIME_FORMAT),
+        repeat=f"\n🔄 *Повторение:* {repeat}" if repeat else "",
+        postponed=f"\n⏰ *Откладывалось:* {postponed_count} {plural(postponed_count, TIMES_FORMS)}"
+        if postponed_count > 0 else ""
+    )
+
+
+# Подтверждение создания напоминания
+def created_message(text: str, reminder_time: datetime, now: datetime, repeat_type: str,
+                    repeat_days: str, repeat_interval: int) -> str:
+    repeat = repeat_text(repeat_type, repeat_interval, repeat_days, reminder_time.weekday())
+    return CREATED_TEMPLATE(
+        text=escape_markdown(text),
+        time=reminder_time.strftime(DATE_TIME_FORMAT),
+        time_left=time_left(reminder_time - now),
+        repeat=f"\n🔄 *Повторение:* {repeat}" if repeat else ""
+    )
+
+
+# Строка списка ближайших напоминаний
+def upcoming_item(number: int, reminder: Dict, reminder_time: datetime, now: datetime) -> str:
+    delta = reminder_time - now
+    postponed_count = reminder['postponed_count']
+    return UPCOMING_ITEM_TEMPLATE(
+        urgency=urgency(delta),
+        title=bold(f"{number}. {reminder['text']}"),
+        postponed=f" (отложено {postponed_count} {plural(postponed_count, TIMES_FORMS)})"
+        if postponed_count > 0 else "",
+        time=reminder_time.strftime(DATE_TIME_FORMAT),
+        time_left=time_left(delta)
+    )
+
+
+# Строка списка повторяющихся напоминаний
+def repeating_item(number: int, reminder: Dict, tz: Optional[str] = None) -> str:
+    return REPEATING_ITEM_TEMPLATE(
+        number=number,
+        title=bold(reminder['text']),
+        time=format_epoch(reminder['reminder_time'], '%H:%M', tz),
+        repeat=repeat_text(reminder['repeat_type'], reminder['repeat_interval'], reminder['repeat_days']),
+        id=reminder['id']
+    )
+
+
+# Сводка пропущенных напоминаний пользователя для режима догоняния.
+# rows - захваченные claim_overdue_reminders строки одного пользователя от самого раннего срока.
+# Текст напоминаний вставляется как есть, поэтому сводка отправляется без разметки.
+def digest_message(rows: List[Tuple], tz: Optional[str] = None) -> str:
+    lines = [f"📬 Пропущенные напоминания: {len(rows)}", ""]
+    for _, _, text, reminder_ts, _, _, repeat_type, _ in rows:
+        repeat_mark = " 🔄" if repeat_type != 'once' else ""
+        lines.append(f"⏰ {format_time(reminder_ts, tz)}{repeat_mark}")
+        lines.append(f"📝 {text}")
+        lines.append("")
+    lines.append("Разовые напоминания отмечены выполненными, повторяющиеся перенесены на следующий срок.")
+    return '\n'.join(lines)
@@ -0,0 +1,1128 @@
+import asyncio
+import itertools
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from recurrence import next_occurrence
+from cache import CACHES, LRUCache
+from metrics import Gauge, db_query_seconds, outbox_events, register_report
+from scheduler import reminder_scheduler
+from timeutil import DEFAULT_TIMEZONE, from_epoch, now_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get('REMINDERS_DB', 'reminders.db')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+
+# Захват напоминаний на время отправки: процесс помечает строки своим именем и сроком аренды,
+# другие процессы не берут напоминание, пока аренда не истекла или не снята результатом доставки
+CLAIM_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+DELIVERY_LEASE = int(os.environ.get('DELIVERY_LEASE', 300))
+
+# Интервал повторной попытки при временной ошибке отправки (секунды)
+RETRY_DELAY = 10
+
+# Сколько раз срабатывание может уйти в отправку без подтверждённого результата
+# (процесс упал или был остановлен посреди отправки). Столько же раз, не больше,
+# пользователь может получить одно срабатывание; дальше оно закрывается как 'abandoned'.
+# Статусы срабатывания в outbox: claimed (захвачено) -> sending (вызов Telegram API начат) ->
+# sent / blocked / failed / released / abandoned; in_doubt - 'sending' упавшего процесса.
+MAX_UNCONFIRMED = int(os.environ.get('DELIVERY_MAX_UNCONFIRMED', 3))
+
+# Часть пользователей процесса отправки: (номер, всего частей), user_id % всего == номер
+Shard = Tuple[int, int]
+ALL_USERS: Shard = (0, 1)
+SHARD_SQL = '((user_id % ?) + ?) % ? = ?'
+
+# Настройки соединения: WAL, отложенный fsync, mmap и увеличенный кэш страниц
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+
+# Пул долгоживущих соединений с SQLite
+class ConnectionPool:
+    """Небольшой пул соединений; каждое соединение хранит кэш подготовленных запросов"""
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            return self._connect()
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+# Потоки для запросов к БД: по одному на соединение пула, чтобы не блокировать цикл событий
+db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='db')
+
+
+# Выполнить функцию доступа к данным в потоке БД и дождаться результата.
+# Время выполнения в потоке пишется в db_query_seconds по имени функции.
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    histogram = db_query_seconds.labels(getattr(func, '__name__', 'unknown'))
+    return await loop.run_in_executor(db_executor, _timed, histogram, func, args, kwargs)
+
+
+def _timed(histogram, func, args, kwargs):
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+# Соединение из пула: commit при успехе, rollback при ошибке
+@contextmanager
+def connection():
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+
+# Кэши чтения: карточки напоминаний по id и страницы/счётчики списков по пользователю.
+# Сбрасываются после коммита каждой изменяющей функции, а по изменениям процессов отправки -
+# только затронутые ими записи (invalidate_outbox_changes, bot._watch_foreign_writes).
+reminder_cache = LRUCache('reminders', maxsize=int(os.environ.get('REMINDER_CACHE_SIZE', 4096)), ttl=300)
+list_cache = LRUCache('lists', maxsize=int(os.environ.get('LIST_CACHE_SIZE', 2048)), ttl=30)
+timezone_cache = LRUCache('timezones', maxsize=int(os.environ.get('TIMEZONE_CACHE_SIZE', 8192)), ttl=3600)
+register_report(reminder_cache.summary)
+register_report(list_cache.summary)
+register_report(timezone_cache.summary)
+
+Gauge('cache_hits_total', 'Попадания в кэши чтения', ('cache',), kind='counter').set_function(
+    lambda: {(cache.name,): cache.hits for cache in CACHES})
+Gauge('cache_misses_total', 'Промахи кэшей чтения', ('cache',), kind='counter').set_function(
+    lambda: {(cache.name,): cache.misses for cache in CACHES})
+Gauge('cache_entries', 'Записей в кэшах чтения', ('cache',)).set_function(
+    lambda: {(cache.name,): len(cache) for cache in CACHES})
+
+# Версия списков пользователя входит в ключ list_cache: смена версии делает
+# все закэшированные страницы пользователя недоступными, они вытесняются по LRU.
+# Версии хранятся в кэше того же размера и с тем же временем жизни, что и страницы.
+# Вытесненная версия заменяется новым номером счётчика, поэтому старые страницы
+# пользователя не становятся снова доступными.
+list_versions = LRUCache('list_versions', maxsize=list_cache.maxsize, ttl=list_cache.ttl)
+_version_counter = itertools.count(1)
+
+
+def _list_key(user_id: int, *parts) -> tuple:
+    version = list_versions.get(user_id)
+    if version is None:
+        version = next(_version_counter)
+        list_versions.set(user_id, version)
+    return (user_id, version) + parts
+
+
+# Сброс кэшей после изменения напоминаний
+def _invalidate(reminder_ids, user_ids):
+    for reminder_id in reminder_ids:
+        reminder_cache.invalidate(reminder_id)
+    for user_id in user_ids:
+        if user_id is not None:
+            list_versions.set(user_id, next(_version_counter))
+            list_cache.invalidations += 1
+
+
+def _rows_to_dicts(cursor) -> List[Dict]:
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# Миграции схемы: (версия, описание, SQL-скрипт или функция от соединения).
+# Номер применённой версии хранится в PRAGMA user_version.
+MIGRATIONS = [
+    (1, 'таблица reminders', '''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            user_name TEXT,
+            text TEXT NOT NULL,
+            reminder_time DATETIME NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            sent BOOLEAN DEFAULT 0,
+            postponed_count INTEGER DEFAULT 0,
+            repeat_type TEXT DEFAULT 'once',
+            repeat_days TEXT DEFAULT '',
+            repeat_interval INTEGER DEFAULT 1,
+            next_reminder_time DATETIME,
+            original_reminder_id INTEGER DEFAULT NULL
+        );
+    '''),
+    (2, 'индексы для планировщика, списков и связанных напоминаний', '''
+        CREATE INDEX IF NOT EXISTS idx_reminders_pending
+            ON reminders (reminder_time) WHERE is_active = 1 AND sent = 0;
+        CREATE INDEX IF NOT EXISTS idx_reminders_user
+            ON reminders (user_id, is_active, reminder_time);
+        CREATE INDEX IF NOT EXISTS idx_reminders_original
+            ON reminders (original_reminder_id) WHERE original_reminder_id IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_reminders_done
+            ON reminders (reminder_time) WHERE sent = 1 AND is_active = 0;
+    '''),
+    (3, 'время как целые секунды UTC epoch', '''
+        CREATE TABLE reminders_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            user_name TEXT,
+            text TEXT NOT NULL,
+            reminder_time INTEGER NOT NULL,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            is_active BOOLEAN DEFAULT 1,
+            sent BOOLEAN DEFAULT 0,
+            postponed_count INTEGER DEFAULT 0,
+            repeat_type TEXT DEFAULT 'once',
+            repeat_days TEXT DEFAULT '',
+            repeat_interval INTEGER DEFAULT 1,
+            next_reminder_time INTEGER,
+            original_reminder_id INTEGER DEFAULT NULL
+        );
+        INSERT INTO reminders_new
+        SELECT id, user_id, user_name, text,
+               CAST(strftime('%s', reminder_time, 'utc') AS INTEGER),
+               CAST(strftime('%s', created_at, 'utc') AS INTEGER),
+               is_active, sent, postponed_count, repeat_type, repeat_days, repeat_interval,
+               CAST(strftime('%s', next_reminder_time, 'utc') AS INTEGER),
+               original_reminder_id
+        FROM reminders;
+        UPDATE sqlite_sequence SET seq = (SELECT seq FROM sqlite_sequence WHERE name = 'reminders')
+            WHERE name = 'reminders_new';
+        DROP TABLE reminders;
+        ALTER TABLE reminders_new RENAME TO reminders;
+        CREATE INDEX idx_reminders_pending
+            ON reminders (reminder_time) WHERE is_active = 1 AND sent = 0;
+        CREATE INDEX idx_reminders_user
+            ON reminders (user_id, is_active, reminder_time);
+        CREATE INDEX idx_reminders_original
+            ON reminders (original_reminder_id) WHERE original_reminder_id IS NOT NULL;
+        CREATE INDEX idx_reminders_done
+            ON reminders (reminder_time) WHERE sent = 1 AND is_active = 0;
+    '''),
+    (4, 'покрывающий индекс для страниц и счётчиков списка', '''
+        DROP INDEX IF EXISTS idx_reminders_user;
+        CREATE INDEX idx_reminders_user
+            ON reminders (user_id, is_active, reminder_time, sent);
+    '''),
+    (5, 'таблица users с часовым поясом пользователя', '''
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            timezone TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        );
+    '''),
+    (6, 'таблица user_state с состоянием диалогов пользователей', '''
+        CREATE TABLE user_state (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at INTEGER NOT NULL
+        );
+    '''),
+    (7, 'захват напоминаний процессами отправки', '''
+        ALTER TABLE reminders ADD COLUMN claimed_by TEXT;
+        ALTER TABLE reminders ADD COLUMN claim_until INTEGER;
+    '''),
+    (8, 'журнал отправок (outbox) по срабатываниям', '''
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reminder_id INTEGER NOT NULL,
+            occurrence_time INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            unconfirmed INTEGER NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            updated_at INTEGER NOT NULL,
+            UNIQUE (reminder_id, occurrence_time)
+        );
+        CREATE INDEX idx_outbox_open ON outbox (status) WHERE status IN ('claimed', 'sending', 'in_doubt');
+        CREATE INDEX idx_outbox_updated ON outbox (updated_at);
+    '''),
+    (9, 'архив выполненных напоминаний', '''
+        CREATE TABLE reminders_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            user_name TEXT,
+            text TEXT NOT NULL,
+            reminder_time INTEGER NOT NULL,
+            created_at INTEGER,
+            is_active BOOLEAN,
+            sent BOOLEAN,
+            postponed_count INTEGER,
+            repeat_type TEXT,
+            repeat_days TEXT,
+            repeat_interval INTEGER,
+            next_reminder_time INTEGER,
+            original_reminder_id INTEGER,
+            archived_at INTEGER NOT NULL
+        );
+    '''),
+]
+
+# Колонки, которые переносятся в reminders_archive (без захвата процессом отправки)
+ARCHIVE_COLUMNS = '''id, user_id, user_name, text, reminder_time, created_at, is_active, sent, postponed_count,
+    repeat_type, repeat_days, repeat_interval, next_reminder_time, original_reminder_id'''
+
+
+# Применение недостающих миграций, каждая в своей транзакции
+def migrate(conn: sqlite3.Connection) -> int:
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+
+        logger.info(f"Миграция БД до версии {version}: {description}")
+        if callable(migration):
+            conn.execute('BEGIN')
+            try:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        else:
+            conn.executescript(f'BEGIN; {migration} PRAGMA user_version = {version}; COMMIT;')
+        current = version
+
+    return current
+
+
+# Режим auto_vacuum=INCREMENTAL: освобождённые страницы возвращаются порциями (incremental_vacuum),
+# а не остаются в файле навсегда. Новая база получает режим до создания таблиц,
+# существующую один раз перестраивает VACUUM.
+def enable_incremental_vacuum(conn: sqlite3.Connection):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    if conn.execute('PRAGMA page_count').fetchone()[0] > 0:
+        logger.info("Перевод базы в режим auto_vacuum=INCREMENTAL (VACUUM)")
+        conn.execute('VACUUM')
+
+
+# Инициализация базы данных
+def init_db():
+    logger.info(f"Инициализация базы данных: {DB_PATH}")
+
+    with connection() as conn:
+        enable_incremental_vacuum(conn)
+        version = migrate(conn)
+        conn.execute('PRAGMA optimize')
+
+    logger.info(f"База данных инициализирована, версия схемы: {version}")
+
+# Состояние напоминания для планировщика внутри транзакции: (reminder_time, is_active, sent, user_id)
+def _scheduler_state(cursor, reminder_id: int) -> Optional[Tuple]:
+    cursor.execute('SELECT reminder_time, is_active, sent, user_id FROM reminders WHERE id = ?', (reminder_id,))
+    return cursor.fetchone()
+
+# Синхронизация планировщика с состоянием напоминания после коммита: если транзакция
+# не зафиксируется, в расписании не окажется срока, которого нет в БД.
+# Возвращает user_id владельца (None, если напоминания нет) для сброса кэшей.
+def sync_scheduler(reminder_id: int, state: Optional[Tuple]) -> Optional[int]:
+    if state and state[1] and not state[2]:
+        reminder_scheduler.schedule(reminder_id, state[0])
+    else:
+        reminder_scheduler.cancel(reminder_id)
+    return state[3] if state else None
+
+def _shard_params(shard: Shard) -> Tuple[int, int, int, int]:
+    index, count = shard
+    return count, count, count, index
+
+# Загрузка ожидающих напоминаний своей части пользователей для планировщика.
+# Захваченное другим процессом напоминание планируется на момент окончания аренды.
+def load_pending_reminders(shard: Shard = ALL_USERS) -> List[Tuple[int, int]]:
+    with connection() as conn:
+        cursor = conn.execute(f'''
+            SELECT id, MAX(reminder_time, COALESCE(claim_until, 0))
+            FROM reminders
+            WHERE is_active = 1 AND sent = 0 AND {SHARD_SQL}
+        ''', _shard_params(shard))
+        return cursor.fetchall()
+
+# Столбцы захваченного напоминания для отправки
+CLAIM_RETURNING = '''
+    RETURNING id, user_id, text, reminder_time, user_name, postponed_count, repeat_type,
+              COALESCE((SELECT timezone FROM users WHERE users.user_id = reminders.user_id), ?)
+'''
+
+# Атомарный захват наступивших напоминаний по id из планировщика (UPDATE ... RETURNING).
+# Возвращаются только строки, которые захватил этот процесс: чужие незавершённые
+# захваты и уже отправленные напоминания пропускаются, поэтому двойной отправки нет.
+# Свой захват с истёкшей арендой не повторяется: сообщение ещё в очереди этого процесса,
+# а захват снимается результатом доставки.
+def claim_due_reminders(reminder_ids: List[int], shard: Shard = ALL_USERS) -> List[Tuple]:
+    placeholders = ','.join('?' * len(reminder_ids))
+    now = now_epoch()
+
+    with connection() as conn:
+        cursor = conn.execute(f'''
+            UPDATE reminders SET claimed_by = ?, claim_until = ?
+            WHERE id IN ({placeholders})
+            AND reminder_time <= ?
+            AND is_active = 1
+            AND sent = 0
+            AND (claim_until IS NULL OR claim_until <= ?)
+            AND claimed_by IS NOT ?
+            AND {SHARD_SQL}
+        ''' + CLAIM_RETURNING, (CLAIM_OWNER, now + DELIVERY_LEASE, *reminder_ids, now, now, CLAIM_OWNER,
+                                *_shard_params(shard), DEFAULT_TIMEZONE))
+        rows, closed = _open_outbox(conn, cursor.fetchall(), now)
+
+    _outcomes_committed(*closed)
+    return rows
+
+# Захват просроченных напоминаний для режима догоняния: все напоминания со сроком раньше before
+# у владельцев reminder_ids, чтобы каждый пользователь получил одну сводку
+def claim_overdue_reminders(reminder_ids: List[int], before: int, shard: Shard = ALL_USERS) -> List[Tuple]:
+    placeholders = ','.join('?' * len(reminder_ids))
+    now = now_epoch()
+
+    with connection() as conn:
+        cursor = conn.execute(f'''
+            UPDATE reminders SET claimed_by = ?, claim_until = ?
+            WHERE user_id IN (SELECT DISTINCT user_id FROM reminders WHERE id IN ({placeholders}))
+            AND is_active = 1
+            AND sent = 0
+            AND reminder_time < ?
+            AND (claim_until IS NULL OR claim_until <= ?)
+            AND claimed_by IS NOT ?
+            AND {SHARD_SQL}
+        ''' + CLAIM_RETURNING, (CLAIM_OWNER, now + DELIVERY_LEASE, *reminder_ids, before, now, CLAIM_OWNER,
+                                *_shard_params(shard), DEFAULT_TIMEZONE))
+        rows, closed = _open_outbox(conn, cursor.fetchall(), now)
+
+    _outcomes_committed(*closed)
+    return rows
+
+# Решение по захваченному срабатыванию по его строке в outbox (статус, неподтверждённые попытки):
+# новое число неподтверждённых попыток, если отправлять, или статус, с которым срабатывание закрыть.
+# Предыдущая попытка без записанного результата ('sending', 'in_doubt') считается неподтверждённой.
+def _outbox_decision(reminder_id: int, status: Optional[str], unconfirmed: int) -> Tuple[Optional[str], int]:
+    if status == 'sent':
+        outbox_events.inc('duplicate_skipped')
+        logger.warning(f"Срабатывание напоминания {reminder_id} уже отправлено, повторная отправка пропущена")
+        return 'sent', unconfirmed
+    if status in ('sending', 'in_doubt'):
+        unconfirmed += 1
+        outbox_events.inc('in_doubt')
+    if unconfirmed >= MAX_UNCONFIRMED:
+        outbox_events.inc('abandoned')
+        logger.warning(f"Срабатывание напоминания {reminder_id} закрыто без отправки: "
+                       f"{unconfirmed} попыток с неизвестным результатом")
+        return 'abandoned', unconfirmed
+    return None, unconfirmed
+
+# Запись захваченных срабатываний в outbox в одной транзакции с захватом.
+# Ключ (reminder_id, occurrence_time) уникален, поэтому у срабатывания одна строка на все попытки.
+# Возвращает строки для отправки и результаты для закрытых без отправки срабатываний.
+def _open_outbox(conn, rows: List[Tuple], now: int):
+    if not rows:
+        return rows, ([], [], set())
+
+    placeholders = ','.join('?' * len(rows))
+    existing = {
+        (reminder_id, occurrence): (status, unconfirmed)
+        for reminder_id, occurrence, status, unconfirmed in conn.execute(f'''
+            SELECT reminder_id, occurrence_time, status, unconfirmed FROM outbox
+            WHERE reminder_id IN ({placeholders})
+        ''', [row[0] for row in rows])
+    }
+
+    send = []
+    attempts = []
+    closed = []
+    counted = []
+    for row in rows:
+        reminder_id, user_id, reminder_ts = row[0], row[1], row[3]
+        status, unconfirmed = existing.get((reminder_id, reminder_ts), (None, 0))
+        verdict, unconfirmed = _outbox_decision(reminder_id, status, unconfirmed)
+        if verdict is None:
+            send.append(row)
+            attempts.append((reminder_id, reminder_ts, user_id, unconfirmed, CLAIM_OWNER, now))
+        else:
+            closed.append((reminder_id, reminder_ts, verdict))
+            counted.append((unconfirmed, reminder_id, reminder_ts))
+
+    conn.executemany('''
+        INSERT INTO outbox (reminder_id, occurrence_time, user_id, status, unconfirmed, claimed_by, updated_at)
+        VALUES (?, ?, ?, 'claimed', ?, ?, ?)
+        ON CONFLICT (reminder_id, occurrence_time) DO UPDATE SET
+            status = 'claimed', attempts = outbox.attempts + 1, unconfirmed = excluded.unconfirmed,
+            claimed_by = excluded.claimed_by, updated_at = excluded.updated_at
+    ''', attempts)
+    # У закрытых без отправки остаётся учтённая последняя неподтверждённая попытка
+    conn.executemany('UPDATE outbox SET unconfirmed = ? WHERE reminder_id = ? AND occurrence_time = ?', counted)
+    return send, (closed, *_apply_outcomes(conn, closed, now))
+
+# Отметка начала отправки перед вызовом Telegram API. Если процесс упадёт после неё,
+# срабатывание останется 'sending', и следующая попытка будет считаться неподтверждённой.
+# Захваченные, но не начатые отправки упавшего процесса повтором не считаются.
+# Если напоминание удалили, отключили или перенесли, пока сообщение ждало в очереди, его
+# срабатывание отменяется ('cancelled'), а остальные срабатывания сводки отпускаются и
+# снова ставятся в расписание.
+# False - срабатывание уже захватил другой процесс (аренда истекла), оно отправлено или отменено: не отправлять.
+def mark_sending(occurrences: List[Tuple[int, int]]) -> bool:
+    occurrences = [(reminder_id, int(occurrence)) for reminder_id, occurrence in occurrences]
+    values = ','.join(['(?, ?)'] * len(occurrences))
+    now = now_epoch()
+    with connection() as conn:
+        stale = set(conn.execute(f'''
+            SELECT reminder_id, occurrence_time FROM outbox
+            WHERE claimed_by = ? AND (reminder_id, occurrence_time) IN (VALUES {values})
+            AND NOT EXISTS (
+                SELECT 1 FROM reminders r
+                WHERE r.id = outbox.reminder_id AND r.reminder_time = outbox.occurrence_time
+                AND r.is_active = 1 AND r.sent = 0
+            )
+        ''', (CLAIM_OWNER, *itertools.chain.from_iterable(occurrences))).fetchall())
+        if not stale:
+            cursor = conn.execute(f'''
+                UPDATE outbox SET status = 'sending', updated_at = ?
+                WHERE claimed_by = ? AND (reminder_id, occurrence_time) IN (VALUES {values})
+            ''', (now, CLAIM_OWNER, *itertools.chain.from_iterable(occurrences)))
+            return cursor.rowcount == len(occurrences)
+
+        released = [(reminder_id, occurrence, 'released') for reminder_id, occurrence in occurrences]
+        advanced, user_ids = _apply_outcomes(conn, released, now)
+        conn.executemany('''
+            UPDATE outbox SET status = 'cancelled', updated_at = ? WHERE reminder_id = ? AND occurrence_time = ?
+        ''', [(now, reminder_id, occurrence) for reminder_id, occurrence in stale])
+
+    _outcomes_committed(released, advanced, user_ids)
+    outbox_events.inc('cancelled', amount=len(stale))
+    for reminder_id, occurrence in occurrences:
+        if (reminder_id, occurrence) not in stale:
+            reminder_scheduler.schedule(reminder_id, occurrence)
+    logger.info(f"Отправка напоминаний {sorted(reminder_id for reminder_id, _ in stale)} отменена: "
+                f"они изменились, пока сообщение ждало в очереди")
+    return False
+
+# Сверка outbox при запуске процесса отправки: отправки удалённых, отключённых и перенесённых
+# напоминаний отменяются, отправки с истёкшей арендой (процесс упал посреди отправки)
+# помечаются 'in_doubt'. Возвращает (отменено, с неизвестным результатом).
+def recover_outbox(shard: Shard = ALL_USERS) -> Tuple[int, int]:
+    now = now_epoch()
+
+    with connection() as conn:
+        cancelled = conn.execute(f'''
+            UPDATE outbox SET status = 'cancelled', claimed_by = NULL, updated_at = ?
+            WHERE status IN ('claimed', 'sending', 'in_doubt')
+            AND {SHARD_SQL}
+            AND NOT EXISTS (
+                SELECT 1 FROM reminders r
+                WHERE r.id = outbox.reminder_id AND r.reminder_time = outbox.occurrence_time
+                AND r.is_active = 1 AND r.sent = 0
+            )
+        ''', (now, *_shard_params(shard))).rowcount
+        in_doubt = conn.execute(f'''
+            UPDATE outbox SET status = 'in_doubt', claimed_by = NULL, updated_at = ?
+            WHERE status = 'sending'
+            AND {SHARD_SQL}
+            AND reminder_id IN (SELECT id FROM reminders WHERE claim_until IS NULL OR claim_until <= ?)
+        ''', (now, *_shard_params(shard), now)).rowcount
+
+    outbox_events.inc('cancelled', amount=cancelled)
+    return cancelled, in_doubt
+
+# Снятие захватов этого процесса с неотправленных напоминаний (при остановке),
+# чтобы следующий процесс не ждал окончания аренды
+def release_claims() -> int:
+    with connection() as conn:
+        cursor = conn.execute('''
+            UPDATE reminders SET claimed_by = NULL, claim_until = NULL
+            WHERE claimed_by = ? AND is_active = 1 AND sent = 0
+        ''', (CLAIM_OWNER,))
+        return cursor.rowcount
+
+# Отдельное соединение для отслеживания изменений БД другими процессами
+_watch_conn: Optional[sqlite3.Connection] = None
+
+# Счётчик изменений БД, сделанных другими соединениями (PRAGMA data_version)
+def data_version() -> int:
+    global _watch_conn
+    if _watch_conn is None:
+        _watch_conn = pool._connect()
+    return _watch_conn.execute('PRAGMA data_version').fetchone()[0]
+
+# Сброс кэшей по изменениям процессов отправки. Они меняют напоминания только вместе
+# со строками outbox, поэтому сбрасываются карточки и списки из строк outbox, изменённых
+# не раньше since. Возвращает число таких строк.
+def invalidate_outbox_changes(since: int) -> int:
+    with connection() as conn:
+        rows = conn.execute('SELECT reminder_id, user_id FROM outbox WHERE updated_at >= ?', (since,)).fetchall()
+    _invalidate({reminder_id for reminder_id, _ in rows}, {user_id for _, user_id in rows})
+    return len(rows)
+
+# Страница активных напоминаний пользователя по ключу (reminder_time, id).
+# cursor - ключ последней (при direction='next') или первой ('prev') строки соседней страницы.
+# Возвращает строки страницы и признак, что дальше в этом направлении есть ещё.
+def get_reminders_page(user_id: int, cursor: Optional[Tuple[int, int]] = None,
+                       direction: str = 'next', page_size: int = 8) -> Tuple[List[Dict], bool]:
+    return list_cache.get_or_load(
+        _list_key(user_id, 'page', cursor, direction, page_size),
+        lambda: _load_reminders_page(user_id, cursor, direction, page_size)
+    )
+
+def _load_reminders_page(user_id: int, cursor: Optional[Tuple[int, int]],
+                         direction: str, page_size: int) -> Tuple[List[Dict], bool]:
+    with connection() as conn:
+        if cursor is None:
+            rows = conn.execute('''
+                SELECT id, text, reminder_time, sent, is_active, repeat_type FROM reminders
+                WHERE user_id = ? AND is_active = 1
+                ORDER BY reminder_time, id
+                LIMIT ?
+            ''', (user_id, page_size + 1))
+        elif direction == 'next':
+            rows = conn.execute('''
+                SELECT id, text, reminder_time, sent, is_active, repeat_type FROM reminders
+                WHERE user_id = ? AND is_active = 1 AND (reminder_time, id) > (?, ?)
+                ORDER BY reminder_time, id
+                LIMIT ?
+            ''', (user_id, *cursor, page_size + 1))
+        else:
+            rows = conn.execute('''
+                SELECT id, text, reminder_time, sent, is_active, repeat_type FROM reminders
+                WHERE user_id = ? AND is_active = 1 AND (reminder_time, id) < (?, ?)
+                ORDER BY reminder_time DESC, id DESC
+                LIMIT ?
+            ''', (user_id, *cursor, page_size + 1))
+        reminders = _rows_to_dicts(rows)
+
+    has_more = len(reminders) > page_size
+    reminders = reminders[:page_size]
+    if direction != 'next' and cursor is not None:
+        reminders.reverse()
+    return reminders, has_more
+
+# Счётчики списка одним агрегатным запросом: (всего, просрочено, ожидает)
+def get_reminder_counts(user_id: int) -> Tuple[int, int, int]:
+    return list_cache.get_or_load(_list_key(user_id, 'counts'), lambda: _load_reminder_counts(user_id))
+
+def _load_reminder_counts(user_id: int) -> Tuple[int, int, int]:
+    now = now_epoch()
+
+    with connection() as conn:
+        total, overdue, upcoming = conn.execute('''
+            SELECT COUNT(*),
+                   COALESCE(SUM(CASE WHEN sent = 0 AND reminder_time < ? THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN sent = 0 AND reminder_time >= ? THEN 1 ELSE 0 END), 0)
+            FROM reminders
+            WHERE user_id = ? AND is_active = 1
+        ''', (now, now, user_id)).fetchone()
+
+    return total, overdue, upcoming
+
+# Ближайшие limit неотправленных напоминаний пользователя со сроком не раньше текущего момента
+def get_upcoming_reminders(user_id: int, limit: int = 3) -> List[Dict]:
+    return list_cache.get_or_load(_list_key(user_id, 'upcoming', limit),
+                                  lambda: _load_upcoming_reminders(user_id, limit))
+
+def _load_upcoming_reminders(user_id: int, limit: int) -> List[Dict]:
+    with connection() as conn:
+        cursor = conn.execute('''
+            SELECT * FROM reminders
+            WHERE user_id = ? AND is_active = 1 AND reminder_time >= ? AND sent = 0
+            ORDER BY reminder_time, id
+            LIMIT ?
+        ''', (user_id, now_epoch(), limit))
+        return _rows_to_dicts(cursor)
+
+# Оригинальные повторяющиеся напоминания пользователя
+def get_repeating_reminders(user_id: int) -> List[Dict]:
+    with connection() as conn:
+        cursor = conn.execute('''
+            SELECT * FROM reminders
+            WHERE user_id = ?
+            AND is_active = 1
+            AND repeat_type != 'once'
+            AND original_reminder_id IS NULL
+            ORDER BY created_at DESC
+        ''', (user_id,))
+        return _rows_to_dicts(cursor)
+
+# Неотправленные активные напоминания пользователя
+def get_pending_reminders(user_id: int) -> List[Dict]:
+    with connection() as conn:
+        cursor = conn.execute('''
+            SELECT * FROM reminders
+            WHERE user_id = ?
+            AND is_active = 1
+            AND sent = 0
+            ORDER BY reminder_time
+        ''', (user_id,))
+        return _rows_to_dicts(cursor)
+
+# Часовой пояс пользователя (DEFAULT_TIMEZONE, если он не выбирал свой)
+def get_user_timezone(user_id: int) -> str:
+    return timezone_cache.get_or_load(user_id, lambda: _load_user_timezone(user_id))
+
+def _load_user_timezone(user_id: int) -> str:
+    with connection() as conn:
+        return _query_user_timezone(conn, user_id)
+
+def _query_user_timezone(conn, user_id: int) -> str:
+    row = conn.execute('SELECT timezone FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else DEFAULT_TIMEZONE
+
+# Часовой пояс внутри уже открытой транзакции
+def _user_timezone(conn, user_id: int) -> str:
+    return timezone_cache.get_or_load(user_id, lambda: _query_user_timezone(conn, user_id))
+
+# Часовой пояс из цикла событий: при попадании в кэш без перехода в поток БД
+async def user_timezone(user_id: int) -> str:
+    tz = timezone_cache.get(user_id)
+    return tz if tz is not None else await run_db(get_user_timezone, user_id)
+
+# Сохранение часового пояса пользователя.
+# Сроки напоминаний остаются теми же моментами времени, меняется только их отображение.
+def set_user_timezone(user_id: int, timezone: str):
+    with connection() as conn:
+        conn.execute('''
+            INSERT INTO users (user_id, timezone, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone, updated_at = excluded.updated_at
+        ''', (user_id, timezone, now_epoch()))
+
+    timezone_cache.invalidate(user_id)
+    logger.info(f"Пользователь {user_id} выбрал часовой пояс {timezone}")
+
+# Сохранённое состояние диалога пользователя (pickle user_data); None - состояния нет
+def load_user_state(user_id: int) -> Optional[bytes]:
+    with connection() as conn:
+        row = conn.execute('SELECT data FROM user_state WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else None
+
+# Запись пачки состояний одной транзакцией: data None - состояние очищено, строка удаляется
+def save_user_states(states: List[Tuple[int, Optional[bytes]]]):
+    updated_at = now_epoch()
+    with connection() as conn:
+        conn.executemany('''
+            INSERT INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        ''', [(user_id, data, updated_at) for user_id, data in states if data is not None])
+        conn.executemany('DELETE FROM user_state WHERE user_id = ?',
+                         [(user_id,) for user_id, data in states if data is None])
+
+# Сохранение напоминания
+def save_reminder_to_db(user_id: int, user_name: str, text: str, reminder_time: datetime,
+                        repeat_type: str = 'once', repeat_days: str = '',
+                        repeat_interval: int = 1, original_reminder_id: int = None) -> int:
+    reminder_ts = to_epoch(reminder_time)
+
+    with connection() as conn:
+        tz = _user_timezone(conn, user_id)
+        next_ts = next_occurrence(reminder_ts, repeat_type, repeat_interval, repeat_days, tz=tz)
+        cursor = conn.execute('''
+        INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at,
+                              repeat_type, repeat_days, repeat_interval, next_reminder_time,
+                              original_reminder_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, user_name, text, reminder_ts, now_epoch(),
+              repeat_type, repeat_days, repeat_interval, next_ts, original_reminder_id))
+        reminder_id = cursor.lastrowid
+
+    reminder_scheduler.schedule(reminder_id, reminder_ts)
+    _invalidate((), (user_id,))
+
+    logger.info(f"Создано напоминание {reminder_id} для пользователя {user_id}, тип: {repeat_type}")
+    return reminder_id
+
+# Поля, от которых зависит расписание повторений
+RECURRENCE_FIELDS = {'reminder_time', 'repeat_type', 'repeat_interval', 'repeat_days'}
+
+# Пересчёт следующего срабатывания после изменения настроек повторения
+def _refresh_next_time(cursor, reminder_id: int):
+    cursor.execute('''
+        SELECT reminder_time, repeat_type, repeat_interval, repeat_days, user_id
+        FROM reminders WHERE id = ?
+    ''', (reminder_id,))
+    row = cursor.fetchone()
+
+    if row:
+        reminder_ts, repeat_type, repeat_interval, repeat_days, user_id = row
+        next_ts = next_occurrence(reminder_ts, repeat_type, repeat_interval, repeat_days,
+                                  tz=_user_timezone(cursor, user_id))
+        cursor.execute('UPDATE reminders SET next_reminder_time = ? WHERE id = ?', (next_ts, reminder_id))
+
+# Продвинуть повторяющееся напоминание к следующему срабатыванию после after.
+# Возвращает False, если напоминание не повторяется.
+def _advance(cursor, reminder_id: int, after: int) -> bool:
+    cursor.execute('''
+        SELECT reminder_time, repeat_type, repeat_interval, repeat_days, user_id
+        FROM reminders WHERE id = ?
+    ''', (reminder_id,))
+    row = cursor.fetchone()
+    if not row:
+        return False
+
+    reminder_ts, repeat_type, repeat_interval, repeat_days, user_id = row
+    tz = _user_timezone(cursor, user_id)
+    next_ts = next_occurrence(reminder_ts, repeat_type, repeat_interval, repeat_days, after=after, tz=tz)
+    if next_ts is None:
+        return False
+
+    following = next_occurrence(next_ts, repeat_type, repeat_interval, repeat_days, tz=tz)
+    cursor.execute('''
+        UPDATE reminders
+        SET reminder_time = ?, next_reminder_time = ?, sent = 0, postponed_count = 0
+        WHERE id = ?
+    ''', (next_ts, following, reminder_id))
+    return True
+
+# Обновление напоминания
+def update_reminder(reminder_id: int, **kwargs):
+    if 'reminder_time' in kwargs and isinstance(kwargs['reminder_time'], datetime):
+        kwargs['reminder_time'] = to_epoch(kwargs['reminder_time'])
+
+    set_clause = ', '.join([f"{key} = ?" for key in kwargs.keys()])
+    values = list(kwargs.values())
+    values.append(reminder_id)
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            UPDATE reminders
+            SET {set_clause}
+            WHERE id = ?
+        ''', values)
+
+        if RECURRENCE_FIELDS.intersection(kwargs):
+            _refresh_next_time(cursor, reminder_id)
+        state = _scheduler_state(cursor, reminder_id)
+
+    user_id = sync_scheduler(reminder_id, state)
+    _invalidate((reminder_id,), (user_id,))
+    logger.info(f"Обновлено напоминание {reminder_id}")
+
+# Удаление напоминания
+def delete_reminder(reminder_id: int):
+    deleted_ids = [reminder_id]
+    user_id = None
+
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        # Сначала получаем информацию о напоминании
+        cursor.execute('SELECT repeat_type, original_reminder_id, user_id FROM reminders WHERE id = ?', (reminder_id,))
+        result = cursor.fetchone()
+
+        if result:
+            repeat_type, original_id, user_id = result
+
+            # Если это повторяющееся напоминание и оригинальное, удаляем все связанные
+            if repeat_type != 'once' and original_id is None:
+                cursor.execute('SELECT id FROM reminders WHERE original_reminder_id = ?', (reminder_id,))
+                deleted_ids.extend(linked_id for linked_id, in cursor.fetchall())
+                cursor.execute('DELETE FROM reminders WHERE original_reminder_id = ?', (reminder_id,))
+
+            # Удаляем само напоминание
+            cursor.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
+
+    for deleted_id in deleted_ids:
+        reminder_scheduler.cancel(deleted_id)
+    _invalidate(deleted_ids, (user_id,))
+
+    logger.info(f"Удалено напоминание {reminder_id}")
+    return True
+
+# Сдвиг времени напоминания с пометкой об откладывании.
+# Повторяющееся напоминание после отправки уже указывает на следующее срабатывание,
+# поэтому для него создаётся разовая копия от текущего момента, а серия не меняется.
+def _postpone(reminder_id: int, delta: timedelta) -> Optional[datetime]:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT reminder_time, repeat_type, user_id, user_name, text, original_reminder_id
+            FROM reminders WHERE id = ?
+        ''', (reminder_id,))
+        result = cursor.fetchone()
+
+        if not result:
+            return None
+
+        reminder_ts, repeat_type, user_id, user_name, text, original_id = result
+        step = int(delta.total_seconds())
+
+        if repeat_type != 'once':
+            new_ts = now_epoch() + step
+            cursor.execute('''
+                INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at,
+                                      postponed_count, original_reminder_id)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+            ''', (user_id, user_name, text, new_ts, now_epoch(), original_id or reminder_id))
+            scheduled_id = cursor.lastrowid
+        else:
+            new_ts = reminder_ts + step
+
+            cursor.execute('''
+                UPDATE reminders
+                SET reminder_time = ?, sent = 0, postponed_count = postponed_count + 1
+                WHERE id = ?
+            ''', (new_ts, reminder_id))
+            scheduled_id = reminder_id
+
+        state = _scheduler_state(cursor, scheduled_id)
+        new_time = from_epoch(new_ts, _user_timezone(cursor, user_id))
+
+    sync_scheduler(scheduled_id, state)
+    _invalidate((reminder_id,), (user_id,))
+    return new_time
+
+# Обновление времени напоминания (откладывание)
+def postpone_reminder(reminder_id: int, minutes: int):
+    return _postpone(reminder_id, timedelta(minutes=minutes))
+
+# Отложить на завтра
+def postpone_to_tomorrow(reminder_id: int):
+    return _postpone(reminder_id, timedelta(days=1))
+
+# Пометить как выполненное. У повторяющегося напоминания выполняется только
+# текущее срабатывание - серия переходит к следующему.
+def mark_as_done(reminder_id: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT reminder_time, user_id FROM reminders WHERE id = ?', (reminder_id,))
+        row = cursor.fetchone()
+        advanced = bool(row) and _advance(cursor, reminder_id, after=max(row[0], now_epoch()))
+
+        if advanced:
+            state = _scheduler_state(cursor, reminder_id)
+        else:
+            cursor.execute('''
+                UPDATE reminders
+                SET sent = 1, is_active = 0
+                WHERE id = ?
+            ''', (reminder_id,))
+
+    _invalidate((reminder_id,), (row[1] if row else None,))
+
+    if advanced:
+        sync_scheduler(reminder_id, state)
+        logger.info(f"Повторяющееся напоминание {reminder_id} перенесено на следующее срабатывание")
+        return
+
+    reminder_scheduler.cancel(reminder_id)
+
+    logger.info(f"Напоминание {reminder_id} помечено как выполненное")
+
+# Размер одной транзакции при записи результатов доставки
+OUTCOME_CHUNK_SIZE = 500
+
+# Результаты, которые закрывают срабатывание в outbox независимо от того, чей сейчас захват
+FINAL_OUTCOMES = ('sent', 'blocked', 'abandoned')
+
+# Запись результатов доставки пачками: outcomes - (reminder_id, срок срабатывания, статус).
+# Разовые отправленные получают sent = 1, повторяющиеся переходят к следующему
+# срабатыванию, напоминания заблокировавших бота пользователей отключаются.
+# Захват снимается; после временной ошибки - с задержкой RETRY_DELAY до повторной попытки.
+# Статус срабатывания в outbox меняется в той же транзакции.
+def record_delivery_outcomes(outcomes: List[Tuple[int, int, str]]):
+    for start in range(0, len(outcomes), OUTCOME_CHUNK_SIZE):
+        chunk = outcomes[start:start + OUTCOME_CHUNK_SIZE]
+        with connection() as conn:
+            advanced, user_ids = _apply_outcomes(conn, chunk, now_epoch())
+        _outcomes_committed(chunk, advanced, user_ids)
+
+# Изменения напоминаний и outbox по результатам внутри открытой транзакции.
+# 'abandoned' закрывает срабатывание так же, как 'sent'; 'released' (сообщение не отправлялось)
+# только снимает захват. Напоминание, срок которого сменился во время отправки
+# (например, его отложили), не меняется - снимается только захват.
+# Возвращает новые сроки в расписании (продвинутые повторяющиеся напоминания и повторы
+# после временной ошибки) и пользователей для сброса кэшей.
+def _apply_outcomes(conn, outcomes: List[Tuple[int, int, str]], now: int):
+    occurrences = {reminder_id: occurrence for reminder_id, occurrence, _ in outcomes}
+    done_ids = [reminder_id for reminder_id, _, status in outcomes if status in ('sent', 'abandoned')]
+    blocked_ids = [(reminder_id,) for reminder_id, _, status in outcomes if status == 'blocked']
+    failed_ids = [(reminder_id,) for reminder_id, _, status in outcomes if status == 'failed']
+    released_ids = [(reminder_id,) for reminder_id, _, status in outcomes if status == 'released']
+    once_ids = []
+    advanced = []
+    user_ids = set()
+
+    if done_ids:
+        placeholders = ','.join('?' * len(done_ids))
+        cursor = conn.execute(f'''
+            SELECT r.id, r.reminder_time, r.repeat_type, r.repeat_interval, r.repeat_days, r.user_id,
+                   COALESCE(u.timezone, ?)
+            FROM reminders r
+            LEFT JOIN users u ON u.user_id = r.user_id
+            WHERE r.id IN ({placeholders})
+        ''', (DEFAULT_TIMEZONE, *done_ids))
+
+        for reminder_id, reminder_ts, repeat_type, repeat_interval, repeat_days, user_id, tz in cursor.fetchall():
+            user_ids.add(user_id)
+            if reminder_ts != occurrences[reminder_id]:
+                released_ids.append((reminder_id,))
+                continue
+            next_ts = next_occurrence(reminder_ts, repeat_type, repeat_interval, repeat_days, after=now, tz=tz)
+            if next_ts is None:
+                once_ids.append((reminder_id,))
+            else:
+                following = next_occurrence(next_ts, repeat_type, repeat_interval, repeat_days, tz=tz)
+                advanced.append((next_ts, following, reminder_id))
+
+        conn.executemany('UPDATE reminders SET sent = 1, claimed_by = NULL, claim_until = NULL WHERE id = ?',
+                         once_ids)
+        conn.executemany('''
+            UPDATE reminders
+            SET reminder_time = ?, next_reminder_time = ?, sent = 0, postponed_count = 0,
+                claimed_by = NULL, claim_until = NULL
+            WHERE id = ? AND is_active = 1
+        ''', advanced)
+
+    # Захват снимается, только если его не перехватил другой процесс после истечения аренды
+    if failed_ids:
+        retry_at = now + RETRY_DELAY
+        conn.executemany('''
+            UPDATE reminders SET claimed_by = NULL, claim_until = ?
+            WHERE id = ? AND sent = 0 AND claimed_by = ?
+        ''', [(retry_at, reminder_id, CLAIM_OWNER) for reminder_id, in failed_ids])
+        # Повтор ставится в расписание на записанный конец задержки: раньше захват не пройдёт
+        advanced.extend((retry_at, None, reminder_id) for reminder_id, in failed_ids)
+
+    if released_ids:
+        conn.executemany('''
+            UPDATE reminders SET claimed_by = NULL, claim_until = NULL
+            WHERE id = ? AND sent = 0 AND claimed_by = ?
+        ''', [(reminder_id, CLAIM_OWNER) for reminder_id, in released_ids])
+
+    if blocked_ids:
+        conn.executemany('UPDATE reminders SET is_active = 0 WHERE id = ?', blocked_ids)
+        placeholders = ','.join('?' * len(blocked_ids))
+        cursor = conn.execute(f'SELECT DISTINCT user_id FROM reminders WHERE id IN ({placeholders})',
+                              [reminder_id for reminder_id, in blocked_ids])
+        user_ids.update(user_id for user_id, in cursor.fetchall())
+
+    # Итог доставки записывается всегда, 'failed' и 'released' - только в свою попытку
+    conn.executemany('''
+        UPDATE outbox SET status = ?, claimed_by = NULL, updated_at = ?
+        WHERE reminder_id = ? AND occurrence_time = ? AND (? OR claimed_by = ?)
+    ''', [(status, now, reminder_id, occurrence, status in FINAL_OUTCOMES, CLAIM_OWNER)
+          for reminder_id, occurrence, status in outcomes])
+
+    return advanced, user_ids
+
+# Сброс кэшей и обновление планировщика после коммита результатов
+def _outcomes_committed(outcomes: List[Tuple[int, int, str]], advanced: List[Tuple], user_ids):
+    _invalidate([reminder_id for reminder_id, _, _ in outcomes], user_ids)
+
+    for next_ts, _, reminder_id in advanced:
+        reminder_scheduler.schedule(reminder_id, next_ts)
+
+# Получить информацию о напоминании
+def get_reminder_info(reminder_id: int):
+    reminder = reminder_cache.get_or_load(reminder_id, lambda: _load_reminder_info(reminder_id))
+    return dict(reminder) if reminder else None
+
+def _load_reminder_info(reminder_id: int):
+    with connection() as conn:
+        cursor = conn.execute('SELECT * FROM reminders WHERE id = ?', (reminder_id,))
+        rows = _rows_to_dicts(cursor)
+
+    return rows[0] if rows else None
+
+# Перенос порции выполненных напоминаний старше days дней в reminders_archive.
+# Одна короткая транзакция на порцию из limit строк (индекс idx_reminders_done),
+# поэтому запись в reminders не ждёт обслуживания. Возвращает число перенесённых строк.
+def archive_done_reminders(days: int = 30, limit: int = 500) -> int:
+    now = now_epoch()
+
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT id, user_id FROM reminders
+            WHERE sent = 1 AND is_active = 0 AND reminder_time < ?
+            ORDER BY reminder_time
+            LIMIT ?
+        ''', (now - days * 86400, limit)).fetchall()
+        if not rows:
+            return 0
+
+        reminder_ids = [reminder_id for reminder_id, _ in rows]
+        placeholders = ','.join('?' * len(reminder_ids))
+        conn.execute(f'''
+            INSERT INTO reminders_archive ({ARCHIVE_COLUMNS}, archived_at)
+            SELECT {ARCHIVE_COLUMNS}, ? FROM reminders WHERE id IN ({placeholders})
+        ''', (now, *reminder_ids))
+        conn.execute(f'DELETE FROM reminders WHERE id IN ({placeholders})', reminder_ids)
+
+    _invalidate(reminder_ids, {user_id for _, user_id in rows})
+    return len(rows)
+
+# Удаление порции закрытых записей outbox старше days дней
+def prune_outbox(days: int = 30, limit: int = 500) -> int:
+    with connection() as conn:
+        cursor = conn.execute('''
+            DELETE FROM outbox WHERE id IN (
+                SELECT id FROM outbox
+                WHERE updated_at < ? AND status NOT IN ('claimed', 'sending', 'in_doubt')
+                LIMIT ?
+            )
+        ''', (now_epoch() - days * 86400, limit))
+        return cursor.rowcount
+
+# Возврат не больше pages свободных страниц файлу базы. Возвращает число освобождённых страниц.
+def incremental_vacuum(pages: int = 256) -> int:
+    with connection() as conn:
+        free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free_before:
+            return 0
+        # Прагма освобождает по странице на каждом шаге, а execute() делает только первый шаг
+        # запроса без колонок результата; executescript() выполняет её до конца
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        return free_before - conn.execute('PRAGMA freelist_count').fetchone()[0]
@@ -0,0 +1,96 @@
+import logging
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from metrics import handler_latency
+
+logger = logging.getLogger(__name__)
+
+
+# Маршрут: обработчик, типы аргументов после префикса и фиксированные параметры
+class Route(NamedTuple):
+    name: str
+    handler: Callable
+    arg_types: Tuple[Callable[[str], Any], ...]
+    bound: Dict[str, Any]
+
+
+# Разобранное действие кнопки: маршрут и типизированные аргументы
+class CallbackAction(NamedTuple):
+    route: Route
+    args: Tuple[Any, ...]
+
+
+# Маршрутизатор callback-кнопок.
+# Точные значения ищутся в словаре, префиксы - в дереве по частям callback_data между '_'.
+# Выбирается самый длинный подходящий префикс, поэтому порядок регистрации не важен:
+# 'edit_repeat_type_' не перекрывается 'edit_repeat_', 'done_now_' - 'done_'.
+class CallbackRouter:
+    def __init__(self):
+        self._exact: Dict[str, Route] = {}
+        self._trie: dict = {}
+
+    # Регистрация обработчика декоратором.
+    # pattern с '_' на конце - префикс, аргументы после него разделены '_'
+    # и приводятся к arg_types; иначе - точное значение callback_data.
+    def route(self, pattern: str, *arg_types: Callable[[str], Any], **bound):
+        def decorator(handler: Callable) -> Callable:
+            route = Route(pattern, handler, arg_types, bound)
+            if not pattern.endswith('_'):
+                self._register(self._exact, pattern, route)
+                return handler
+
+            node = self._trie
+            for part in pattern[:-1].split('_'):
+                node = node.setdefault(part, {})
+            self._register(node, None, route)
+            return handler
+        return decorator
+
+    @staticmethod
+    def _register(table: dict, key, route: Route):
+        if key in table:
+            raise ValueError(f"Маршрут {route.name} уже зарегистрирован")
+        table[key] = route
+
+    # Разбор callback_data в действие; None - неизвестная или повреждённая кнопка
+    def resolve(self, data: str) -> Optional[CallbackAction]:
+        route = self._exact.get(data)
+        if route is not None:
+            return CallbackAction(route, ())
+
+        parts = data.split('_')
+        matches = []
+        node = self._trie
+        for depth, part in enumerate(parts, 1):
+            node = node.get(part)
+            if node is None:
+                break
+            route = node.get(None)
+            if route is not None:
+                matches.append((depth, route))
+
+        # Если аргументы не подошли под самый длинный префикс, пробуем более короткие
+        for depth, route in reversed(matches):
+            arg_types = route.arg_types
+            if len(parts) - depth != len(arg_types):
+                continue
+            try:
+                return CallbackAction(route, tuple([arg_type(arg) for arg_type, arg in zip(arg_types, parts[depth:])]))
+            except ValueError:
+                continue
+        return None
+
+    # Вызов обработчика для update; False - кнопка не распознана
+    async def dispatch(self, update, context) -> bool:
+        data = update.callback_query.data or ''
+        action = self.resolve(data)
+        if action is None:
+            logger.warning(f"Неизвестная callback-кнопка: {data!r}")
+            return False
+        started = time.perf_counter()
+        try:
+            await action.route.handler(update, context, *action.args, **action.route.bound)
+        finally:
+            handler_latency.labels(action.route.name).observe(time.perf_counter() - started)
+        return True
@@ -0,0 +1,128 @@
+import asyncio
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+Due = Union[datetime, float, int]
+
+
+def _to_timestamp(due: Due) -> float:
+    if isinstance(due, datetime):
+        return due.timestamp()
+    return float(due)
+
+
+# Планировщик напоминаний: мин-куча сроков + словарь актуальных сроков.
+# Устаревшие записи кучи не удаляются сразу, а пропускаются при извлечении.
+class ReminderScheduler:
+    """Событийный планировщик: просыпается ровно к сроку ближайшего напоминания"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._due: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    # Привязка к циклу событий, в котором работает отправка
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    # Первичная загрузка ожидающих напоминаний
+    def load(self, items: Iterable[Tuple[int, Due]]):
+        with self._lock:
+            self._due = {reminder_id: _to_timestamp(due) for reminder_id, due in items}
+            self._heap = [(due, reminder_id) for reminder_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+        self._wake()
+
+    # Добавить напоминание или перенести его срок.
+    # Пока планировщик не привязан к циклу, изменения не копятся: они попадут в load().
+    def schedule(self, reminder_id: int, due: Due):
+        if self._loop is None:
+            return
+        due_ts = _to_timestamp(due)
+        with self._lock:
+            if self._due.get(reminder_id) == due_ts:
+                return
+            self._due[reminder_id] = due_ts
+            heapq.heappush(self._heap, (due_ts, reminder_id))
+            is_next = self._heap[0] == (due_ts, reminder_id)
+        if is_next:
+            self._wake()
+
+    # Убрать напоминание из расписания
+    def cancel(self, reminder_id: int):
+        if self._loop is None:
+            return
+        with self._lock:
+            self._due.pop(reminder_id, None)
+            self._compact()
+
+    # Срок ближайшего напоминания (timestamp) или None
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    # Извлечь все напоминания со сроком не позже now: пары (id, срок) от самого раннего срока
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        if now is None:
+            now = time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due_ts, reminder_id = heapq.heappop(self._heap)
+                if self._due.get(reminder_id) == due_ts:
+                    del self._due[reminder_id]
+                    due.append((reminder_id, due_ts))
+        return due
+
+    # Ждать, пока не наступит срок хотя бы одного напоминания
+    async def wait_due(self) -> List[Tuple[int, float]]:
+        while True:
+            self._wakeup.clear()
+            due = self.pop_due()
+            if due:
+                return due
+
+            next_due = self.next_due()
+            timer = None
+            if next_due is not None:
+                timer = self._loop.call_later(max(0.0, next_due - time.time()), self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    def _wake(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    # Перестраиваем кучу, когда устаревших записей становится слишком много
+    def _compact(self):
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._due):
+            self._heap = [(due, reminder_id) for reminder_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+
+reminder_scheduler = ReminderScheduler()
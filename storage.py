@@ -0,0 +1,996 @@
+import functools
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import repository
+from metrics import db_query_seconds, outbox_events
+from recurrence import next_occurrence
+from repository import (
+    ALL_USERS, ARCHIVE_COLUMNS, CLAIM_OWNER, DELIVERY_LEASE, FINAL_OUTCOMES, OUTCOME_CHUNK_SIZE, RECURRENCE_FIELDS,
+    RETRY_DELAY, Shard, _invalidate, _list_key, _outbox_decision, _outcomes_committed, list_cache, reminder_cache,
+    run_db, timezone_cache
+)
+from scheduler import reminder_scheduler
+from timeutil import DEFAULT_TIMEZONE, from_epoch, now_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Адрес базы: postgres://... или postgresql://... - PostgreSQL, иначе SQLite из REMINDERS_DB
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+
+# Размер пула соединений PostgreSQL
+PG_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+
+
+# Операции с данными бота и процессов отправки.
+# Реализации разделяют кэши чтения и планировщик из repository.py,
+# поэтому поведение бота не зависит от выбранной базы.
+class Storage(ABC):
+    async def initialize(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # Напоминания
+    @abstractmethod
+    async def save_reminder_to_db(self, user_id: int, user_name: str, text: str, reminder_time: datetime,
+                                  repeat_type: str = 'once', repeat_days: str = '',
+                                  repeat_interval: int = 1, original_reminder_id: int = None) -> int: ...
+
+    @abstractmethod
+    async def update_reminder(self, reminder_id: int, **kwargs): ...
+
+    @abstractmethod
+    async def delete_reminder(self, reminder_id: int) -> bool: ...
+
+    @abstractmethod
+    async def postpone_reminder(self, reminder_id: int, minutes: int) -> Optional[datetime]: ...
+
+    @abstractmethod
+    async def postpone_to_tomorrow(self, reminder_id: int) -> Optional[datetime]: ...
+
+    @abstractmethod
+    async def mark_as_done(self, reminder_id: int): ...
+
+    @abstractmethod
+    async def get_reminder_info(self, reminder_id: int) -> Optional[Dict]: ...
+
+    @abstractmethod
+    async def get_reminders_page(self, user_id: int, cursor: Optional[Tuple[int, int]] = None,
+                                 direction: str = 'next', page_size: int = 8) -> Tuple[List[Dict], bool]: ...
+
+    @abstractmethod
+    async def get_reminder_counts(self, user_id: int) -> Tuple[int, int, int]: ...
+
+    # Ближайшие limit неотправленных напоминаний со сроком не раньше текущего момента
+    @abstractmethod
+    async def get_upcoming_reminders(self, user_id: int, limit: int = 3) -> List[Dict]: ...
+
+    @abstractmethod
+    async def get_repeating_reminders(self, user_id: int) -> List[Dict]: ...
+
+    @abstractmethod
+    async def get_pending_reminders(self, user_id: int) -> List[Dict]: ...
+
+    # Обслуживание: перенос выполненных напоминаний в архив и очистка порциями
+    @abstractmethod
+    async def archive_done_reminders(self, days: int = 30, limit: int = 500) -> int: ...
+
+    @abstractmethod
+    async def prune_outbox(self, days: int = 30, limit: int = 500) -> int: ...
+
+    # Возврат свободного места файлу базы; 0 - нечего возвращать или база делает это сама
+    async def incremental_vacuum(self, pages: int = 256) -> int:
+        return 0
+
+    # Пользователи
+    @abstractmethod
+    async def user_timezone(self, user_id: int) -> str: ...
+
+    @abstractmethod
+    async def set_user_timezone(self, user_id: int, timezone: str): ...
+
+    @abstractmethod
+    async def load_user_state(self, user_id: int) -> Optional[bytes]: ...
+
+    @abstractmethod
+    async def save_user_states(self, states: List[Tuple[int, Optional[bytes]]]): ...
+
+    # Расписание и доставка
+    @abstractmethod
+    async def load_pending_reminders(self, shard: Shard = ALL_USERS) -> List[Tuple[int, int]]: ...
+
+    @abstractmethod
+    async def claim_due_reminders(self, reminder_ids: List[int], shard: Shard = ALL_USERS) -> List[Tuple]: ...
+
+    @abstractmethod
+    async def claim_overdue_reminders(self, reminder_ids: List[int], before: int,
+                                      shard: Shard = ALL_USERS) -> List[Tuple]: ...
+
+    # outcomes - (reminder_id, срок срабатывания, статус)
+    @abstractmethod
+    async def record_delivery_outcomes(self, outcomes: List[Tuple[int, int, str]]): ...
+
+    # Отметка начала отправки срабатываний (reminder_id, срок) перед вызовом Telegram API.
+    # False - срабатывания уже не принадлежат этому процессу, отправлять нельзя.
+    @abstractmethod
+    async def mark_sending(self, occurrences: List[Tuple[int, int]]) -> bool: ...
+
+    # Сверка незавершённых отправок при запуске: (отменено, с неизвестным результатом)
+    @abstractmethod
+    async def recover_outbox(self, shard: Shard = ALL_USERS) -> Tuple[int, int]: ...
+
+    @abstractmethod
+    async def release_claims(self) -> int: ...
+
+    # Значение меняется, когда данные изменил другой процесс
+    @abstractmethod
+    async def data_version(self) -> int: ...
+
+    # Сброс кэшей по строкам outbox, изменённым не раньше since; возвращает их число
+    @abstractmethod
+    async def invalidate_outbox_changes(self, since: int) -> int: ...
+
+
+# SQLite: функции repository.py в потоках БД
+class SQLiteStorage(Storage):
+    async def initialize(self):
+        await run_db(repository.init_db)
+
+    async def close(self):
+        await run_db(repository.pool.close)
+
+    async def save_reminder_to_db(self, user_id, user_name, text, reminder_time, repeat_type='once',
+                                  repeat_days='', repeat_interval=1, original_reminder_id=None):
+        return await run_db(repository.save_reminder_to_db, user_id, user_name, text, reminder_time,
+                            repeat_type, repeat_days, repeat_interval, original_reminder_id)
+
+    async def update_reminder(self, reminder_id, **kwargs):
+        return await run_db(repository.update_reminder, reminder_id, **kwargs)
+
+    async def delete_reminder(self, reminder_id):
+        return await run_db(repository.delete_reminder, reminder_id)
+
+    async def postpone_reminder(self, reminder_id, minutes):
+        return await run_db(repository.postpone_reminder, reminder_id, minutes)
+
+    async def postpone_to_tomorrow(self, reminder_id):
+        return await run_db(repository.postpone_to_tomorrow, reminder_id)
+
+    async def mark_as_done(self, reminder_id):
+        return await run_db(repository.mark_as_done, reminder_id)
+
+    async def get_reminder_info(self, reminder_id):
+        return await run_db(repository.get_reminder_info, reminder_id)
+
+    async def get_reminders_page(self, user_id, cursor=None, direction='next', page_size=8):
+        return await run_db(repository.get_reminders_page, user_id, cursor, direction, page_size)
+
+    async def get_reminder_counts(self, user_id):
+        return await run_db(repository.get_reminder_counts, user_id)
+
+    async def get_upcoming_reminders(self, user_id, limit=3):
+        return await run_db(repository.get_upcoming_reminders, user_id, limit)
+
+    async def get_repeating_reminders(self, user_id):
+        return await run_db(repository.get_repeating_reminders, user_id)
+
+    async def get_pending_reminders(self, user_id):
+        return await run_db(repository.get_pending_reminders, user_id)
+
+    async def archive_done_reminders(self, days=30, limit=500):
+        return await run_db(repository.archive_done_reminders, days, limit)
+
+    async def prune_outbox(self, days=30, limit=500):
+        return await run_db(repository.prune_outbox, days, limit)
+
+    async def incremental_vacuum(self, pages=256):
+        return await run_db(repository.incremental_vacuum, pages)
+
+    async def user_timezone(self, user_id):
+        return await repository.user_timezone(user_id)
+
+    async def set_user_timezone(self, user_id, timezone):
+        return await run_db(repository.set_user_timezone, user_id, timezone)
+
+    async def load_user_state(self, user_id):
+        return await run_db(repository.load_user_state, user_id)
+
+    async def save_user_states(self, states):
+        return await run_db(repository.save_user_states, states)
+
+    async def load_pending_reminders(self, shard=ALL_USERS):
+        return await run_db(repository.load_pending_reminders, shard)
+
+    async def claim_due_reminders(self, reminder_ids, shard=ALL_USERS):
+        return await run_db(repository.claim_due_reminders, reminder_ids, shard)
+
+    async def claim_overdue_reminders(self, reminder_ids, before, shard=ALL_USERS):
+        return await run_db(repository.claim_overdue_reminders, reminder_ids, before, shard)
+
+    async def record_delivery_outcomes(self, outcomes):
+        return await run_db(repository.record_delivery_outcomes, outcomes)
+
+    async def mark_sending(self, occurrences):
+        return await run_db(repository.mark_sending, occurrences)
+
+    async def recover_outbox(self, shard=ALL_USERS):
+        return await run_db(repository.recover_outbox, shard)
+
+    async def release_claims(self):
+        return await run_db(repository.release_claims)
+
+    async def data_version(self):
+        return await run_db(repository.data_version)
+
+    async def invalidate_outbox_changes(self, since):
+        return await run_db(repository.invalidate_outbox_changes, since)
+
+
+# Время операции PostgreSQL в db_query_seconds под тем же именем, что и у SQLite
+def _measured(method):
+    histogram = db_query_seconds.labels(method.__name__)
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+# Синхронизация планировщика по состоянию строки после изменения
+def _sync_scheduler(reminder_id: int, row) -> Optional[int]:
+    if row and row['is_active'] and not row['sent']:
+        reminder_scheduler.schedule(reminder_id, row['reminder_time'])
+    else:
+        reminder_scheduler.cancel(reminder_id)
+    return row['user_id'] if row else None
+
+
+# Схема PostgreSQL: (версия, описание, SQL). Версии отдельные от SQLite,
+# схема соответствует SQLite после миграции 9. Флаги - SMALLINT 0/1, как в SQLite.
+PG_MIGRATIONS = [
+    (1, 'начальная схема', '''
+        CREATE TABLE reminders (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            user_name TEXT,
+            text TEXT NOT NULL,
+            reminder_time BIGINT NOT NULL,
+            created_at BIGINT DEFAULT EXTRACT(EPOCH FROM now())::BIGINT,
+            is_active SMALLINT DEFAULT 1,
+            sent SMALLINT DEFAULT 0,
+            postponed_count INTEGER DEFAULT 0,
+            repeat_type TEXT DEFAULT 'once',
+            repeat_days TEXT DEFAULT '',
+            repeat_interval INTEGER DEFAULT 1,
+            next_reminder_time BIGINT,
+            original_reminder_id BIGINT DEFAULT NULL,
+            claimed_by TEXT,
+            claim_until BIGINT
+        );
+        CREATE INDEX idx_reminders_pending
+            ON reminders (reminder_time) WHERE is_active = 1 AND sent = 0;
+        CREATE INDEX idx_reminders_user
+            ON reminders (user_id, is_active, reminder_time, sent);
+        CREATE INDEX idx_reminders_original
+            ON reminders (original_reminder_id) WHERE original_reminder_id IS NOT NULL;
+        CREATE INDEX idx_reminders_done
+            ON reminders (reminder_time) WHERE sent = 1 AND is_active = 0;
+        CREATE TABLE users (
+            user_id BIGINT PRIMARY KEY,
+            timezone TEXT NOT NULL,
+            updated_at BIGINT NOT NULL
+        );
+        CREATE TABLE user_state (
+            user_id BIGINT PRIMARY KEY,
+            data BYTEA NOT NULL,
+            updated_at BIGINT NOT NULL
+        );
+    '''),
+    (2, 'журнал отправок (outbox) по срабатываниям', '''
+        CREATE TABLE outbox (
+            id BIGSERIAL PRIMARY KEY,
+            reminder_id BIGINT NOT NULL,
+            occurrence_time BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            unconfirmed INTEGER NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            updated_at BIGINT NOT NULL,
+            UNIQUE (reminder_id, occurrence_time)
+        );
+        CREATE INDEX idx_outbox_open ON outbox (status) WHERE status IN ('claimed', 'sending', 'in_doubt');
+        CREATE INDEX idx_outbox_updated ON outbox (updated_at);
+    '''),
+    (3, 'архив выполненных напоминаний', '''
+        CREATE TABLE reminders_archive (
+            id BIGINT PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            user_name TEXT,
+            text TEXT NOT NULL,
+            reminder_time BIGINT NOT NULL,
+            created_at BIGINT,
+            is_active SMALLINT,
+            sent SMALLINT,
+            postponed_count INTEGER,
+            repeat_type TEXT,
+            repeat_days TEXT,
+            repeat_interval INTEGER,
+            next_reminder_time BIGINT,
+            original_reminder_id BIGINT,
+            archived_at BIGINT NOT NULL
+        );
+    '''),
+]
+
+PG_CLAIM_RETURNING = '''
+    RETURNING id, user_id, text, reminder_time, user_name, postponed_count, repeat_type,
+              COALESCE((SELECT timezone FROM users u WHERE u.user_id = reminders.user_id), $1)
+'''
+
+
+# Условие части пользователей (как SHARD_SQL) с параметрами $first..$first+3
+def _shard_sql(first: int) -> str:
+    return f'((user_id % ${first}) + ${first + 1}) % ${first + 2} = ${first + 3}'
+
+
+def _count(status: str) -> int:
+    # Статус команды asyncpg: 'UPDATE 3', 'DELETE 0'
+    return int(status.rsplit(' ', 1)[-1])
+
+
+# PostgreSQL через asyncpg: пул соединений, запросы прямо из цикла событий.
+# Захват напоминаний - UPDATE ... RETURNING по строкам, выбранным с FOR UPDATE SKIP LOCKED.
+class PostgresStorage(Storage):
+    def __init__(self, dsn: str, pool_size: int = PG_POOL_SIZE):
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.pool = None
+
+    async def initialize(self):
+        import asyncpg
+
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size)
+        async with self.pool.acquire() as conn:
+            await self._migrate(conn)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    # Миграции под блокировкой: несколько процессов могут стартовать одновременно
+    @staticmethod
+    async def _migrate(conn):
+        async with conn.transaction():
+            await conn.execute('SELECT pg_advisory_xact_lock(hashtext($1))', 'reminders_schema')
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)
+            ''')
+            current = await conn.fetchval('SELECT MAX(version) FROM schema_version') or 0
+            for version, description, migration in PG_MIGRATIONS:
+                if version <= current:
+                    continue
+                logger.info(f"Миграция PostgreSQL до версии {version}: {description}")
+                await conn.execute(migration)
+                await conn.execute('INSERT INTO schema_version (version) VALUES ($1)', version)
+                current = version
+        logger.info(f"База данных PostgreSQL инициализирована, версия схемы: {current}")
+
+    async def _user_timezone(self, conn, user_id: int) -> str:
+        async def load():
+            tz = await conn.fetchval('SELECT timezone FROM users WHERE user_id = $1', user_id)
+            return tz or DEFAULT_TIMEZONE
+        return await timezone_cache.aget_or_load(user_id, load)
+
+    @_measured
+    async def save_reminder_to_db(self, user_id, user_name, text, reminder_time, repeat_type='once',
+                                  repeat_days='', repeat_interval=1, original_reminder_id=None):
+        reminder_ts = to_epoch(reminder_time)
+
+        async with self.pool.acquire() as conn:
+            tz = await self._user_timezone(conn, user_id)
+            next_ts = next_occurrence(reminder_ts, repeat_type, repeat_interval, repeat_days, tz=tz)
+            reminder_id = await conn.fetchval('''
+                INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at,
+                                       repeat_type, repeat_days, repeat_interval, next_reminder_time,
+                                       original_reminder_id)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                RETURNING id
+            ''', user_id, user_name, text, reminder_ts, now_epoch(),
+                repeat_type, repeat_days, repeat_interval, next_ts, original_reminder_id)
+
+        reminder_scheduler.schedule(reminder_id, reminder_ts)
+        _invalidate((), (user_id,))
+
+        logger.info(f"Создано напоминание {reminder_id} для пользователя {user_id}, тип: {repeat_type}")
+        return reminder_id
+
+    @_measured
+    async def update_reminder(self, reminder_id, **kwargs):
+        if 'reminder_time' in kwargs and isinstance(kwargs['reminder_time'], datetime):
+            kwargs['reminder_time'] = to_epoch(kwargs['reminder_time'])
+
+        set_clause = ', '.join([f"{key} = ${i}" for i, key in enumerate(kwargs.keys(), 2)])
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(f'''
+                    UPDATE reminders
+                    SET {set_clause}
+                    WHERE id = $1
+                    RETURNING reminder_time, repeat_type, repeat_interval, repeat_days, is_active, sent, user_id
+                ''', reminder_id, *kwargs.values())
+
+                if row and RECURRENCE_FIELDS.intersection(kwargs):
+                    tz = await self._user_timezone(conn, row['user_id'])
+                    next_ts = next_occurrence(row['reminder_time'], row['repeat_type'], row['repeat_interval'],
+                                              row['repeat_days'], tz=tz)
+                    await conn.execute('UPDATE reminders SET next_reminder_time = $1 WHERE id = $2',
+                                       next_ts, reminder_id)
+        user_id = _sync_scheduler(reminder_id, row)
+
+        _invalidate((reminder_id,), (user_id,))
+        logger.info(f"Обновлено напоминание {reminder_id}")
+
+    @_measured
+    async def delete_reminder(self, reminder_id):
+        deleted_ids = [reminder_id]
+        user_id = None
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow('''
+                    DELETE FROM reminders WHERE id = $1
+                    RETURNING repeat_type, original_reminder_id, user_id
+                ''', reminder_id)
+
+                if row:
+                    user_id = row['user_id']
+                    # Если это повторяющееся напоминание и оригинальное, удаляем все связанные
+                    if row['repeat_type'] != 'once' and row['original_reminder_id'] is None:
+                        linked = await conn.fetch('DELETE FROM reminders WHERE original_reminder_id = $1 RETURNING id',
+                                                  reminder_id)
+                        deleted_ids.extend(linked_id for linked_id, in linked)
+
+        for deleted_id in deleted_ids:
+            reminder_scheduler.cancel(deleted_id)
+        _invalidate(deleted_ids, (user_id,))
+
+        logger.info(f"Удалено напоминание {reminder_id}")
+        return True
+
+    async def _postpone(self, reminder_id: int, delta: timedelta) -> Optional[datetime]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow('''
+                    SELECT reminder_time, repeat_type, user_id, user_name, text, original_reminder_id
+                    FROM reminders WHERE id = $1
+                    FOR UPDATE
+                ''', reminder_id)
+
+                if not row:
+                    return None
+
+                step = int(delta.total_seconds())
+                if row['repeat_type'] != 'once':
+                    new_ts = now_epoch() + step
+                    new_id = await conn.fetchval('''
+                        INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at,
+                                               postponed_count, original_reminder_id)
+                        VALUES ($1, $2, $3, $4, $5, 1, $6)
+                        RETURNING id
+                    ''', row['user_id'], row['user_name'], row['text'], new_ts, now_epoch(),
+                        row['original_reminder_id'] or reminder_id)
+                    scheduled_id = new_id
+                else:
+                    new_ts = row['reminder_time'] + step
+                    await conn.execute('''
+                        UPDATE reminders
+                        SET reminder_time = $1, sent = 0, postponed_count = postponed_count + 1
+                        WHERE id = $2
+                    ''', new_ts, reminder_id)
+                    scheduled_id = reminder_id
+
+            # В расписание - только после коммита, как в repository.py
+            reminder_scheduler.schedule(scheduled_id, new_ts)
+            new_time = from_epoch(new_ts, await self._user_timezone(conn, row['user_id']))
+
+        _invalidate((reminder_id,), (row['user_id'],))
+        return new_time
+
+    @_measured
+    async def postpone_reminder(self, reminder_id, minutes):
+        return await self._postpone(reminder_id, timedelta(minutes=minutes))
+
+    @_measured
+    async def postpone_to_tomorrow(self, reminder_id):
+        return await self._postpone(reminder_id, timedelta(days=1))
+
+    @_measured
+    async def mark_as_done(self, reminder_id):
+        advanced = False
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow('''
+                    SELECT reminder_time, repeat_type, repeat_interval, repeat_days, user_id
+                    FROM reminders WHERE id = $1
+                    FOR UPDATE
+                ''', reminder_id)
+
+                if row:
+                    tz = await self._user_timezone(conn, row['user_id'])
+                    args = (row['repeat_type'], row['repeat_interval'], row['repeat_days'])
+                    next_ts = next_occurrence(row['reminder_time'], *args,
+                                              after=max(row['reminder_time'], now_epoch()), tz=tz)
+                    advanced = next_ts is not None
+
+                if advanced:
+                    following = next_occurrence(next_ts, *args, tz=tz)
+                    await conn.execute('''
+                        UPDATE reminders
+                        SET reminder_time = $1, next_reminder_time = $2, sent = 0, postponed_count = 0
+                        WHERE id = $3
+                    ''', next_ts, following, reminder_id)
+                else:
+                    await conn.execute('UPDATE reminders SET sent = 1, is_active = 0 WHERE id = $1', reminder_id)
+
+        _invalidate((reminder_id,), (row['user_id'] if row else None,))
+
+        if advanced:
+            reminder_scheduler.schedule(reminder_id, next_ts)
+            logger.info(f"Повторяющееся напоминание {reminder_id} перенесено на следующее срабатывание")
+            return
+
+        reminder_scheduler.cancel(reminder_id)
+        logger.info(f"Напоминание {reminder_id} помечено как выполненное")
+
+    @_measured
+    async def get_reminder_info(self, reminder_id):
+        async def load():
+            row = await self.pool.fetchrow('SELECT * FROM reminders WHERE id = $1', reminder_id)
+            return dict(row) if row else None
+
+        reminder = await reminder_cache.aget_or_load(reminder_id, load)
+        return dict(reminder) if reminder else None
+
+    @_measured
+    async def get_reminders_page(self, user_id, cursor=None, direction='next', page_size=8):
+        async def load():
+            columns = 'id, text, reminder_time, sent, is_active, repeat_type'
+            if cursor is None:
+                rows = await self.pool.fetch(f'''
+                    SELECT {columns} FROM reminders
+                    WHERE user_id = $1 AND is_active = 1
+                    ORDER BY reminder_time, id
+                    LIMIT $2
+                ''', user_id, page_size + 1)
+            elif direction == 'next':
+                rows = await self.pool.fetch(f'''
+                    SELECT {columns} FROM reminders
+                    WHERE user_id = $1 AND is_active = 1 AND (reminder_time, id) > ($2, $3)
+                    ORDER BY reminder_time, id
+                    LIMIT $4
+                ''', user_id, *cursor, page_size + 1)
+            else:
+                rows = await self.pool.fetch(f'''
+                    SELECT {columns} FROM reminders
+                    WHERE user_id = $1 AND is_active = 1 AND (reminder_time, id) < ($2, $3)
+                    ORDER BY reminder_time DESC, id DESC
+                    LIMIT $4
+                ''', user_id, *cursor, page_size + 1)
+
+            reminders = [dict(row) for row in rows]
+            has_more = len(reminders) > page_size
+            reminders = reminders[:page_size]
+            if direction != 'next' and cursor is not None:
+                reminders.reverse()
+            return reminders, has_more
+
+        return await list_cache.aget_or_load(_list_key(user_id, 'page', cursor, direction, page_size), load)
+
+    @_measured
+    async def get_reminder_counts(self, user_id):
+        async def load():
+            now = now_epoch()
+            row = await self.pool.fetchrow('''
+                SELECT COUNT(*),
+                       COUNT(*) FILTER (WHERE sent = 0 AND reminder_time < $1),
+                       COUNT(*) FILTER (WHERE sent = 0 AND reminder_time >= $1)
+                FROM reminders
+                WHERE user_id = $2 AND is_active = 1
+            ''', now, user_id)
+            return tuple(row)
+
+        return await list_cache.aget_or_load(_list_key(user_id, 'counts'), load)
+
+    @_measured
+    async def get_upcoming_reminders(self, user_id, limit=3):
+        async def load():
+            rows = await self.pool.fetch('''
+                SELECT * FROM reminders
+                WHERE user_id = $1 AND is_active = 1 AND reminder_time >= $2 AND sent = 0
+                ORDER BY reminder_time, id
+                LIMIT $3
+            ''', user_id, now_epoch(), limit)
+            return [dict(row) for row in rows]
+
+        return await list_cache.aget_or_load(_list_key(user_id, 'upcoming', limit), load)
+
+    @_measured
+    async def get_repeating_reminders(self, user_id):
+        rows = await self.pool.fetch('''
+            SELECT * FROM reminders
+            WHERE user_id = $1
+            AND is_active = 1
+            AND repeat_type != 'once'
+            AND original_reminder_id IS NULL
+            ORDER BY created_at DESC
+        ''', user_id)
+        return [dict(row) for row in rows]
+
+    @_measured
+    async def get_pending_reminders(self, user_id):
+        rows = await self.pool.fetch('''
+            SELECT * FROM reminders
+            WHERE user_id = $1
+            AND is_active = 1
+            AND sent = 0
+            ORDER BY reminder_time
+        ''', user_id)
+        return [dict(row) for row in rows]
+
+    # Порция переносится одним запросом: DELETE ... RETURNING внутри INSERT
+    @_measured
+    async def archive_done_reminders(self, days=30, limit=500):
+        now = now_epoch()
+        rows = await self.pool.fetch(f'''
+            WITH moved AS (
+                DELETE FROM reminders WHERE id IN (
+                    SELECT id FROM reminders
+                    WHERE sent = 1 AND is_active = 0 AND reminder_time < $1
+                    ORDER BY reminder_time
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {ARCHIVE_COLUMNS}
+            )
+            INSERT INTO reminders_archive ({ARCHIVE_COLUMNS}, archived_at)
+            SELECT {ARCHIVE_COLUMNS}, $3 FROM moved
+            RETURNING id, user_id
+        ''', now - days * 86400, limit, now)
+
+        _invalidate([row['id'] for row in rows], {row['user_id'] for row in rows})
+        return len(rows)
+
+    @_measured
+    async def prune_outbox(self, days=30, limit=500):
+        status = await self.pool.execute('''
+            DELETE FROM outbox WHERE id IN (
+                SELECT id FROM outbox
+                WHERE updated_at < $1 AND status NOT IN ('claimed', 'sending', 'in_doubt')
+                LIMIT $2
+            )
+        ''', now_epoch() - days * 86400, limit)
+        return _count(status)
+
+    async def user_timezone(self, user_id):
+        tz = timezone_cache.get(user_id)
+        if tz is not None:
+            return tz
+        async with self.pool.acquire() as conn:
+            return await self._user_timezone(conn, user_id)
+
+    @_measured
+    async def set_user_timezone(self, user_id, timezone):
+        await self.pool.execute('''
+            INSERT INTO users (user_id, timezone, updated_at) VALUES ($1, $2, $3)
+            ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone, updated_at = excluded.updated_at
+        ''', user_id, timezone, now_epoch())
+
+        timezone_cache.invalidate(user_id)
+        logger.info(f"Пользователь {user_id} выбрал часовой пояс {timezone}")
+
+    @_measured
+    async def load_user_state(self, user_id):
+        return await self.pool.fetchval('SELECT data FROM user_state WHERE user_id = $1', user_id)
+
+    @_measured
+    async def save_user_states(self, states):
+        updated_at = now_epoch()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany('''
+                    INSERT INTO user_state (user_id, data, updated_at) VALUES ($1, $2, $3)
+                    ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                ''', [(user_id, data, updated_at) for user_id, data in states if data is not None])
+                await conn.execute('DELETE FROM user_state WHERE user_id = ANY($1::BIGINT[])',
+                                   [user_id for user_id, data in states if data is None])
+
+    @_measured
+    async def load_pending_reminders(self, shard=ALL_USERS):
+        index, count = shard
+        rows = await self.pool.fetch(f'''
+            SELECT id, GREATEST(reminder_time, COALESCE(claim_until, 0))
+            FROM reminders
+            WHERE is_active = 1 AND sent = 0 AND {_shard_sql(1)}
+        ''', count, count, count, index)
+        return [tuple(row) for row in rows]
+
+    @_measured
+    async def claim_due_reminders(self, reminder_ids, shard=ALL_USERS):
+        index, count = shard
+        now = now_epoch()
+        return await self._claim(f'''
+            UPDATE reminders SET claimed_by = $2, claim_until = $3
+            WHERE id IN (
+                SELECT id FROM reminders
+                WHERE id = ANY($4::BIGINT[])
+                AND reminder_time <= $5
+                AND is_active = 1
+                AND sent = 0
+                AND (claim_until IS NULL OR claim_until <= $5)
+                AND claimed_by IS DISTINCT FROM $2
+                AND {_shard_sql(6)}
+                FOR UPDATE SKIP LOCKED
+            )
+        ''' + PG_CLAIM_RETURNING, now, DEFAULT_TIMEZONE, CLAIM_OWNER, now + DELIVERY_LEASE,
+            reminder_ids, now, count, count, count, index)
+
+    @_measured
+    async def claim_overdue_reminders(self, reminder_ids, before, shard=ALL_USERS):
+        index, count = shard
+        now = now_epoch()
+        return await self._claim(f'''
+            UPDATE reminders SET claimed_by = $2, claim_until = $3
+            WHERE id IN (
+                SELECT id FROM reminders
+                WHERE user_id IN (SELECT DISTINCT user_id FROM reminders WHERE id = ANY($4::BIGINT[]))
+                AND is_active = 1
+                AND sent = 0
+                AND reminder_time < $5
+                AND (claim_until IS NULL OR claim_until <= $6)
+                AND claimed_by IS DISTINCT FROM $2
+                AND {_shard_sql(7)}
+                FOR UPDATE SKIP LOCKED
+            )
+        ''' + PG_CLAIM_RETURNING, now, DEFAULT_TIMEZONE, CLAIM_OWNER, now + DELIVERY_LEASE,
+            reminder_ids, before, now, count, count, count, index)
+
+    # Захват и запись срабатываний в outbox одной транзакцией (см. repository._open_outbox)
+    async def _claim(self, query: str, now: int, *args) -> List[Tuple]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = [tuple(row) for row in await conn.fetch(query, *args)]
+                if not rows:
+                    return rows
+
+                existing = {
+                    (reminder_id, occurrence): (status, unconfirmed)
+                    for reminder_id, occurrence, status, unconfirmed in await conn.fetch('''
+                        SELECT reminder_id, occurrence_time, status, unconfirmed FROM outbox
+                        WHERE reminder_id = ANY($1::BIGINT[])
+                        FOR UPDATE
+                    ''', [row[0] for row in rows])
+                }
+
+                send = []
+                attempts = []
+                closed = []
+                counted = []
+                for row in rows:
+                    reminder_id, user_id, reminder_ts = row[0], row[1], row[3]
+                    status, unconfirmed = existing.get((reminder_id, reminder_ts), (None, 0))
+                    verdict, unconfirmed = _outbox_decision(reminder_id, status, unconfirmed)
+                    if verdict is None:
+                        send.append(row)
+                        attempts.append((reminder_id, reminder_ts, user_id, unconfirmed, CLAIM_OWNER, now))
+                    else:
+                        closed.append((reminder_id, reminder_ts, verdict))
+                        counted.append((unconfirmed, reminder_id, reminder_ts))
+
+                await conn.executemany('''
+                    INSERT INTO outbox (reminder_id, occurrence_time, user_id, status, unconfirmed,
+                                        claimed_by, updated_at)
+                    VALUES ($1, $2, $3, 'claimed', $4, $5, $6)
+                    ON CONFLICT (reminder_id, occurrence_time) DO UPDATE SET
+                        status = 'claimed', attempts = outbox.attempts + 1, unconfirmed = excluded.unconfirmed,
+                        claimed_by = excluded.claimed_by, updated_at = excluded.updated_at
+                ''', attempts)
+                await conn.executemany('''
+                    UPDATE outbox SET unconfirmed = $1 WHERE reminder_id = $2 AND occurrence_time = $3
+                ''', counted)
+                advanced, user_ids = await self._apply_outcomes(conn, closed, now)
+
+        _outcomes_committed(closed, advanced, user_ids)
+        return send
+
+    @_measured
+    async def record_delivery_outcomes(self, outcomes):
+        for start in range(0, len(outcomes), OUTCOME_CHUNK_SIZE):
+            chunk = outcomes[start:start + OUTCOME_CHUNK_SIZE]
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    advanced, user_ids = await self._apply_outcomes(conn, chunk, now_epoch())
+            _outcomes_committed(chunk, advanced, user_ids)
+
+    # Изменения напоминаний и outbox по результатам (см. repository._apply_outcomes)
+    @staticmethod
+    async def _apply_outcomes(conn, outcomes: List[Tuple[int, int, str]], now: int):
+        occurrences = {reminder_id: occurrence for reminder_id, occurrence, _ in outcomes}
+        done_ids = [reminder_id for reminder_id, _, status in outcomes if status in ('sent', 'abandoned')]
+        blocked_ids = [reminder_id for reminder_id, _, status in outcomes if status == 'blocked']
+        failed_ids = [reminder_id for reminder_id, _, status in outcomes if status == 'failed']
+        released_ids = [reminder_id for reminder_id, _, status in outcomes if status == 'released']
+        once_ids = []
+        advanced = []
+        user_ids = set()
+
+        if done_ids:
+            rows = await conn.fetch('''
+                SELECT r.id, r.reminder_time, r.repeat_type, r.repeat_interval, r.repeat_days, r.user_id,
+                       COALESCE(u.timezone, $1)
+                FROM reminders r
+                LEFT JOIN users u ON u.user_id = r.user_id
+                WHERE r.id = ANY($2::BIGINT[])
+            ''', DEFAULT_TIMEZONE, done_ids)
+
+            for reminder_id, reminder_ts, repeat_type, repeat_interval, repeat_days, user_id, tz in rows:
+                user_ids.add(user_id)
+                if reminder_ts != occurrences[reminder_id]:
+                    released_ids.append(reminder_id)
+                    continue
+                next_ts = next_occurrence(reminder_ts, repeat_type, repeat_interval, repeat_days,
+                                          after=now, tz=tz)
+                if next_ts is None:
+                    once_ids.append(reminder_id)
+                else:
+                    following = next_occurrence(next_ts, repeat_type, repeat_interval, repeat_days, tz=tz)
+                    advanced.append((next_ts, following, reminder_id))
+
+            await conn.execute('''
+                UPDATE reminders SET sent = 1, claimed_by = NULL, claim_until = NULL
+                WHERE id = ANY($1::BIGINT[])
+            ''', once_ids)
+            await conn.executemany('''
+                UPDATE reminders
+                SET reminder_time = $1, next_reminder_time = $2, sent = 0, postponed_count = 0,
+                    claimed_by = NULL, claim_until = NULL
+                WHERE id = $3 AND is_active = 1
+            ''', advanced)
+
+        if failed_ids:
+            retry_at = now + RETRY_DELAY
+            await conn.execute('''
+                UPDATE reminders SET claimed_by = NULL, claim_until = $1
+                WHERE id = ANY($2::BIGINT[]) AND sent = 0 AND claimed_by = $3
+            ''', retry_at, failed_ids, CLAIM_OWNER)
+            advanced.extend((retry_at, None, reminder_id) for reminder_id in failed_ids)
+
+        if released_ids:
+            await conn.execute('''
+                UPDATE reminders SET claimed_by = NULL, claim_until = NULL
+                WHERE id = ANY($1::BIGINT[]) AND sent = 0 AND claimed_by = $2
+            ''', released_ids, CLAIM_OWNER)
+
+        if blocked_ids:
+            rows = await conn.fetch('''
+                UPDATE reminders SET is_active = 0
+                WHERE id = ANY($1::BIGINT[])
+                RETURNING user_id
+            ''', blocked_ids)
+            user_ids.update(user_id for user_id, in rows)
+
+        await conn.executemany('''
+            UPDATE outbox SET status = $1, claimed_by = NULL, updated_at = $2
+            WHERE reminder_id = $3 AND occurrence_time = $4 AND ($5 OR claimed_by = $6)
+        ''', [(status, now, reminder_id, int(occurrence), status in FINAL_OUTCOMES, CLAIM_OWNER)
+              for reminder_id, occurrence, status in outcomes])
+
+        return advanced, user_ids
+
+    # Отметка начала отправки и отмена изменившихся напоминаний (см. repository.mark_sending)
+    @_measured
+    async def mark_sending(self, occurrences):
+        occurrences = [(reminder_id, int(occurrence)) for reminder_id, occurrence in occurrences]
+        reminder_ids = [reminder_id for reminder_id, _ in occurrences]
+        times = [occurrence for _, occurrence in occurrences]
+        now = now_epoch()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                stale = {tuple(row) for row in await conn.fetch('''
+                    SELECT reminder_id, occurrence_time FROM outbox
+                    WHERE claimed_by = $1
+                    AND (reminder_id, occurrence_time) IN (SELECT * FROM unnest($2::BIGINT[], $3::BIGINT[]))
+                    AND NOT EXISTS (
+                        SELECT 1 FROM reminders r
+                        WHERE r.id = outbox.reminder_id AND r.reminder_time = outbox.occurrence_time
+                        AND r.is_active = 1 AND r.sent = 0
+                    )
+                ''', CLAIM_OWNER, reminder_ids, times)}
+                if not stale:
+                    status = await conn.execute('''
+                        UPDATE outbox SET status = 'sending', updated_at = $1
+                        WHERE claimed_by = $2
+                        AND (reminder_id, occurrence_time) IN (SELECT * FROM unnest($3::BIGINT[], $4::BIGINT[]))
+                    ''', now, CLAIM_OWNER, reminder_ids, times)
+                    return _count(status) == len(occurrences)
+
+                released = [(reminder_id, occurrence, 'released') for reminder_id, occurrence in occurrences]
+                advanced, user_ids = await self._apply_outcomes(conn, released, now)
+                await conn.executemany('''
+                    UPDATE outbox SET status = 'cancelled', updated_at = $1
+                    WHERE reminder_id = $2 AND occurrence_time = $3
+                ''', [(now, reminder_id, occurrence) for reminder_id, occurrence in stale])
+
+        _outcomes_committed(released, advanced, user_ids)
+        outbox_events.inc('cancelled', amount=len(stale))
+        for reminder_id, occurrence in occurrences:
+            if (reminder_id, occurrence) not in stale:
+                reminder_scheduler.schedule(reminder_id, occurrence)
+        logger.info(f"Отправка напоминаний {sorted(reminder_id for reminder_id, _ in stale)} отменена: "
+                    f"они изменились, пока сообщение ждало в очереди")
+        return False
+
+    @_measured
+    async def recover_outbox(self, shard=ALL_USERS):
+        index, count = shard
+        now = now_epoch()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                cancelled = _count(await conn.execute(f'''
+                    UPDATE outbox SET status = 'cancelled', claimed_by = NULL, updated_at = $1
+                    WHERE status IN ('claimed', 'sending', 'in_doubt')
+                    AND {_shard_sql(2)}
+                    AND NOT EXISTS (
+                        SELECT 1 FROM reminders r
+                        WHERE r.id = outbox.reminder_id AND r.reminder_time = outbox.occurrence_time
+                        AND r.is_active = 1 AND r.sent = 0
+                    )
+                ''', now, count, count, count, index))
+                in_doubt = _count(await conn.execute(f'''
+                    UPDATE outbox SET status = 'in_doubt', claimed_by = NULL, updated_at = $1
+                    WHERE status = 'sending'
+                    AND {_shard_sql(2)}
+                    AND reminder_id IN (SELECT id FROM reminders WHERE claim_until IS NULL OR claim_until <= $1)
+                ''', now, count, count, count, index))
+
+        outbox_events.inc('cancelled', amount=cancelled)
+        return cancelled, in_doubt
+
+    @_measured
+    async def release_claims(self):
+        status = await self.pool.execute('''
+            UPDATE reminders SET claimed_by = NULL, claim_until = NULL
+            WHERE claimed_by = $1 AND is_active = 1 AND sent = 0
+        ''', CLAIM_OWNER)
+        return _count(status)
+
+    # Граница снимка транзакций растёт при каждой пишущей транзакции в базе
+    @_measured
+    async def data_version(self):
+        return await self.pool.fetchval('SELECT txid_snapshot_xmax(txid_current_snapshot())')
+
+    @_measured
+    async def invalidate_outbox_changes(self, since):
+        rows = await self.pool.fetch('SELECT reminder_id, user_id FROM outbox WHERE updated_at >= $1', since)
+        _invalidate({reminder_id for reminder_id, _ in rows}, {user_id for _, user_id in rows})
+        return len(rows)
+
+
+# Хранилище по DATABASE_URL
+def create_storage(url: str = DATABASE_URL) -> Storage:
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresStorage(url)
+    return SQLiteStorage()
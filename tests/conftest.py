@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Модули читают настройки при импорте: база тестов - временный файл, не reminders.db
+os.environ['REMINDERS_DB'] = os.path.join(tempfile.mkdtemp(prefix='reminders-tests-'), 'reminders.db')
+
+import pytest  # noqa: E402
+
+import repository  # noqa: E402
+from cache import CACHES  # noqa: E402
+from fake_bot_api import FakeBotApi  # noqa: E402
+from timeutil import now_epoch  # noqa: E402
+
+FAKE_TOKEN = '123456:TEST'
+
+
+# Чистая база repository.py для теста: новый файл, пустые кэши и расписание
+@pytest.fixture
+def db(tmp_path):
+    repository.pool.close()
+    repository.DB_PATH = str(tmp_path / 'reminders.db')
+    repository.pool = repository.ConnectionPool(repository.DB_PATH)
+    repository._watch_conn = None
+    for cache in CACHES:
+        cache.clear()
+    repository.init_db()
+    yield repository.DB_PATH
+    repository.pool.close()
+
+
+# Схема в файле path без пула repository.py (для баз процессов отправки)
+def create_db(path: str) -> str:
+    conn = sqlite3.connect(path)
+    repository.migrate(conn)
+    conn.close()
+    return path
+
+
+# Разовые напоминания пользователям users со сроком due; возвращает их id
+def seed_reminders(path: str, users: Iterable[int], due: Optional[int] = None) -> List[int]:
+    due = now_epoch() if due is None else due
+    conn = sqlite3.connect(path)
+    with conn:
+        ids = [conn.execute('''
+            INSERT INTO reminders (user_id, user_name, text, reminder_time, created_at)
+            VALUES (?, 'user', ?, ?, ?)
+        ''', (user_id, f"напоминание {user_id}", due, now_epoch())).lastrowid for user_id in users]
+    conn.close()
+    return ids
+
+
+# Запрос отдельным соединением, как из другого процесса; изменения фиксируются
+def query(path: str, sql: str, params: tuple = ()) -> List[Tuple]:
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+# Процесс отправки worker.py против тестового Bot API
+def spawn_worker(path: str, api: FakeBotApi, shard: Tuple[int, int] = (0, 1),
+                 log_dir: Optional[str] = None, **env) -> subprocess.Popen:
+    environment = dict(os.environ)
+    environment.update({
+        'BOT_TOKEN_REMINDER': FAKE_TOKEN,
+        'TELEGRAM_API_URL': api.url,
+        'REMINDERS_DB': path,
+        'CHANGE_POLL_INTERVAL': '0.2',
+    })
+    environment.pop('DATABASE_URL', None)
+    environment.update({name: str(value) for name, value in env.items()})
+    log_path = os.path.join(log_dir or os.path.dirname(path), f"worker-{shard[0]}-{time.monotonic_ns()}.log")
+    with open(log_path, 'w') as log:
+        return subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'worker.py'), '--shard', str(shard[0]), '--shards', str(shard[1])],
+            cwd=os.path.dirname(path), env=environment, stdout=log, stderr=subprocess.STDOUT
+        )
+
+
+# Остановка процесса: SIGTERM и ожидание в потоке, чтобы тестовый API продолжал отвечать
+async def stop_process(process: subprocess.Popen, timeout: float = 30):
+    process.terminate()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, process.wait, timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        raise
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float, interval: float = 0.05):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("условие не выполнилось за отведённое время")
+        await asyncio.sleep(interval)
+
+
+# Сколько уведомлений (успешных sendMessage) получил каждый чат
+def deliveries(api: FakeBotApi) -> Dict[int, int]:
+    return Counter(int(call.params['chat_id']) for call in api.calls
+                   if call.method == 'sendMessage' and call.status == 200)
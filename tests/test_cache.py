@@ -0,0 +1,113 @@
+import asyncio
+from datetime import timedelta
+
+import repository
+from conftest import query, wait_until
+from timeutil import now_epoch, now_in
+
+
+def _page_texts(user_id):
+    reminders, _ = repository.get_reminders_page(user_id)
+    return [reminder['text'] for reminder in reminders]
+
+
+def test_list_cache_invalidated_by_writes(db):
+    when = now_in() + timedelta(hours=1)
+    repository.save_reminder_to_db(1, 'user', 'первое', when)
+    assert _page_texts(1) == ['первое']
+
+    reminder_id = repository.save_reminder_to_db(1, 'user', 'второе', when + timedelta(minutes=1))
+    assert _page_texts(1) == ['первое', 'второе']
+
+    repository.mark_as_done(reminder_id)
+    assert _page_texts(1) == ['первое']
+
+
+def test_list_versions_are_bounded(db, monkeypatch):
+    monkeypatch.setattr(repository.list_versions, 'maxsize', 4)
+    monkeypatch.setattr(repository.list_cache, 'maxsize', 4)
+    when = now_in() + timedelta(hours=1)
+    for user_id in range(50):
+        repository.save_reminder_to_db(user_id, 'user', f"текст {user_id}", when)
+        _page_texts(user_id)
+
+    assert len(repository.list_versions) <= 4
+    assert len(repository.list_cache) <= 4
+
+
+# Вытесненная версия не возвращает закэшированную под ней страницу
+def test_evicted_version_does_not_resurrect_pages(db, monkeypatch):
+    monkeypatch.setattr(repository.list_versions, 'maxsize', 2)
+    when = now_in() + timedelta(hours=1)
+    repository.save_reminder_to_db(1, 'user', 'старый текст', when)
+    assert _page_texts(1) == ['старый текст']
+
+    # Изменение в обход repository.py: кэш о нём не знает
+    conn = repository.pool.acquire()
+    with conn:
+        conn.execute("UPDATE reminders SET text = 'новый текст' WHERE user_id = 1")
+    repository.pool.release(conn)
+    assert _page_texts(1) == ['старый текст']
+
+    for user_id in (2, 3):
+        _page_texts(user_id)
+    assert repository.list_versions.get(1) is None
+    assert _page_texts(1) == ['новый текст']
+
+
+# Процесс бота при DELIVERY_MODE=workers: изменения процесса отправки сбрасывают его кэши
+def test_foreign_writes_clear_caches(db):
+    import bot
+
+    when = now_in() + timedelta(hours=1)
+    reminder_id = repository.save_reminder_to_db(1, 'user', 'до отправки', when)
+    assert _page_texts(1) == ['до отправки']
+    assert repository.get_reminder_info(reminder_id)['text'] == 'до отправки'
+
+    async def run():
+        watcher = asyncio.create_task(bot._watch_foreign_writes(0.05))
+        await asyncio.sleep(0.2)
+        # Процесс отправки перевёл напоминание к следующему сроку и записал итог в outbox
+        query(db, 'UPDATE reminders SET text = ?, reminder_time = reminder_time + 86400 WHERE id = ?',
+              ('после отправки', reminder_id))
+        query(db, """
+            INSERT INTO outbox (reminder_id, occurrence_time, user_id, status, unconfirmed, updated_at)
+            VALUES (?, ?, 1, 'sent', 0, ?)
+        """, (reminder_id, int(when.timestamp()), now_epoch()))
+        try:
+            await wait_until(lambda: _page_texts(1) == ['после отправки'], timeout=5)
+        finally:
+            watcher.cancel()
+
+    asyncio.run(run())
+    reminder = repository.get_reminder_info(reminder_id)
+    assert reminder['text'] == 'после отправки'
+    assert reminder['reminder_time'] == int(when.timestamp()) + 86400
+
+
+# Собственные записи процесса бота меняют версию данных, но не сбрасывают кэши других пользователей
+def test_own_writes_keep_other_caches(db):
+    import bot
+
+    when = now_in() + timedelta(hours=1)
+    reminder_id = repository.save_reminder_to_db(1, 'user', 'первое', when)
+    repository.save_reminder_to_db(2, 'user', 'второе', when)
+
+    async def run():
+        watcher = asyncio.create_task(bot._watch_foreign_writes(0.05))
+        try:
+            assert _page_texts(1) == ['первое']
+            assert repository.get_reminder_info(reminder_id)['text'] == 'первое'
+            version = repository.data_version()
+            for minutes in range(5):
+                repository.save_reminder_to_db(2, 'user', f"ещё {minutes}", when + timedelta(minutes=minutes))
+                await asyncio.sleep(0.1)
+            assert repository.data_version() != version
+        finally:
+            watcher.cancel()
+
+    asyncio.run(run())
+    hits = (repository.list_cache.hits, repository.reminder_cache.hits)
+    assert _page_texts(1) == ['первое']
+    assert repository.get_reminder_info(reminder_id)['text'] == 'первое'
+    assert (repository.list_cache.hits, repository.reminder_cache.hits) == (hits[0] + 1, hits[1] + 1)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+import delivery
+from delivery import SENT, Delivery, DeliveryPipeline, TokenBucket
+
+# Допуск на неточность таймеров цикла событий (секунды)
+SLACK = 0.05
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# Бот, который запоминает время каждой отправки; retry_after - чаты, первая отправка
+# в которые отвечает RetryAfter на столько секунд
+class FakeBot:
+    def __init__(self, retry_after=None):
+        self.retry_after = dict(retry_after or {})
+        self.sent = []
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.monotonic()
+        self.attempts.append((now, chat_id, text))
+        if chat_id in self.retry_after:
+            raise RetryAfter(self.retry_after.pop(chat_id))
+        self.sent.append((now, chat_id, text))
+
+
+async def _deliver(bot, messages, **limits):
+    results = []
+
+    async def on_result(item, status):
+        results.append((item.text, status))
+
+    pipeline = DeliveryPipeline(bot, on_result, **limits)
+    started = time.monotonic()
+    pipeline.start()
+    for reminder_id, (chat_id, text) in enumerate(messages, 1):
+        pipeline.submit(Delivery(reminder_id, chat_id, text))
+    await asyncio.wait_for(pipeline.join(), 30)
+    await pipeline.stop()
+    return started, results
+
+
+# Отправок в любом окне [t, t + window] не больше запаса ведра и пополнения за окно
+def _assert_within_rate(times, rate, capacity):
+    times = sorted(times)
+    for i, start in enumerate(times):
+        for j in range(i, len(times)):
+            window = times[j] - start
+            assert j - i + 1 <= capacity + rate * (window + SLACK) + 1e-9, (i, j, window)
+
+
+def test_token_bucket_refill_and_pause(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(delivery.time, 'monotonic', clock)
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == 0.5
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0.0
+    # Пополнение не больше запаса
+    clock.now += 60
+    assert bucket.is_idle()
+    assert [bucket.try_acquire() for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+
+    bucket.pause(5)
+    clock.now += 1
+    assert bucket.try_acquire() == 4
+    assert not bucket.is_idle()
+    # Сразу после паузы отправка разрешена, дальше снова действует лимит
+    clock.now += 4
+    assert [bucket.try_acquire() for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_global_rate():
+    bot = FakeBot()
+    messages = [(chat_id, f"сообщение {chat_id}") for chat_id in range(60)]
+    started, results = asyncio.run(_deliver(bot, messages, workers=8, global_rate=40, per_chat_rate=100))
+
+    assert sorted(results) == sorted((text, SENT) for _, text in messages)
+    _assert_within_rate([sent for sent, _, _ in bot.sent], rate=40, capacity=40)
+    # Первые 40 - запасом ведра, остальные 20 - по 40 в секунду
+    assert bot.sent[-1][0] - started >= 0.5 - SLACK
+
+
+def test_per_chat_rate():
+    bot = FakeBot()
+    messages = [(1, f"первый чат {i}") for i in range(8)] + [(2, f"второй чат {i}") for i in range(8)]
+    started, results = asyncio.run(_deliver(bot, messages, workers=4, global_rate=1000, per_chat_rate=5))
+
+    assert sorted(results) == sorted((text, SENT) for _, text in messages)
+    for chat_id in (1, 2):
+        times = [sent for sent, chat, _ in bot.sent if chat == chat_id]
+        assert len(times) == 8
+        _assert_within_rate(times, rate=5, capacity=5)
+    # Чаты ограничиваются независимо: второй не ждёт первого
+    second = [sent for sent, chat, _ in bot.sent if chat == 2]
+    assert second[0] - started < 0.1
+
+
+# RetryAfter для чата: чат молчит паузу, сообщение отправляется повторно после неё,
+# другие чаты отправляются без ожидания, а пропускная способность остаётся в лимитах
+def test_retry_after_pauses_chat_and_requeues():
+    pause = 1
+    bot = FakeBot(retry_after={1: pause})
+    messages = [(1, "первый чат 0"), (1, "первый чат 1"), (2, "второй чат 0"), (3, "третий чат 0")]
+    started, results = asyncio.run(_deliver(bot, messages, workers=4, global_rate=30, per_chat_rate=5))
+
+    assert sorted(results) == sorted((text, SENT) for _, text in messages)
+    rejected, = [(at, text) for at, chat, text in bot.attempts if chat == 1][:1]
+    first_chat = [(at, text) for at, chat, text in bot.sent if chat == 1]
+    assert {text for _, text in first_chat} == {"первый чат 0", "первый чат 1"}
+    assert rejected[1] in {text for _, text in first_chat}
+    # Ни одной отправки в чат до конца паузы
+    assert all(at >= rejected[0] + pause - SLACK for at, _ in first_chat)
+    assert all(at - started < 0.5 for at, chat, _ in bot.sent if chat != 1)
+    _assert_within_rate([at for at, _, _ in bot.attempts], rate=30, capacity=30)
+    _assert_within_rate([at for at, _ in first_chat], rate=5, capacity=5)
@@ -0,0 +1,66 @@
+import asyncio
+
+from conftest import create_db, deliveries, query, seed_reminders, spawn_worker, stop_process, wait_until
+from fake_bot_api import FakeBotApi
+
+# Остановка процесса отправки посреди пачки журнала доставки и перезапуск.
+# Журнал записывает результаты после отправки, поэтому записанные срабатывания не повторяются,
+# а повторно может уйти только незаписанная часть пачки - каждое такое сообщение не больше одного раза.
+
+USERS = range(1000, 1150)
+JOURNAL_BATCH = 40
+# Воркеров конвейера доставки (DELIVERY_WORKERS по умолчанию): столько сообщений может быть в полёте
+IN_FLIGHT = 8
+
+
+async def _interrupt_and_restart(tmp_path, interrupt):
+    path = create_db(str(tmp_path / 'reminders.db'))
+    seed_reminders(path, USERS)
+    api = FakeBotApi()
+    await api.start()
+    try:
+        worker = spawn_worker(path, api, DELIVERY_LEASE=2, DELIVERY_JOURNAL_BATCH=JOURNAL_BATCH)
+        await wait_until(lambda: sum(deliveries(api).values()) >= 70, timeout=60)
+        await interrupt(worker)
+        # Запросы, которые процесс успел отправить до остановки, тестовый API дочитывает после неё
+        await asyncio.sleep(0.5)
+
+        first_run = deliveries(api)
+        committed = {user_id for user_id, in query(path, "SELECT user_id FROM outbox WHERE status = 'sent'")}
+
+        worker = spawn_worker(path, api, DELIVERY_LEASE=2, DELIVERY_JOURNAL_BATCH=JOURNAL_BATCH)
+        await wait_until(lambda: not query(path, 'SELECT id FROM reminders WHERE sent = 0'), timeout=60)
+        await stop_process(worker)
+    finally:
+        await api.stop()
+
+    sent = deliveries(api)
+    duplicates = {user_id for user_id, count in sent.items() if count > 1}
+    assert set(first_run.values()) == {1}
+    assert committed <= set(first_run)
+    # Ничего не потеряно
+    assert set(sent) == set(USERS)
+    # Записанные до остановки не отправлены повторно, остальные - не больше одного повтора
+    assert duplicates <= set(first_run) - committed
+    assert all(sent[user_id] == 2 for user_id in duplicates)
+    # Повтор учтён в outbox как неподтверждённая попытка
+    for user_id in duplicates:
+        assert query(path, 'SELECT status, unconfirmed FROM outbox WHERE user_id = ?', (user_id,)) == [('sent', 1)]
+    return first_run, committed, duplicates
+
+
+async def _kill(worker):
+    worker.kill()
+    worker.wait()
+
+
+def test_kill_mid_batch_resends_only_unrecorded(tmp_path):
+    first_run, committed, duplicates = asyncio.run(_interrupt_and_restart(tmp_path, _kill))
+    assert len(duplicates) <= JOURNAL_BATCH + IN_FLIGHT
+
+
+def test_stop_mid_batch_flushes_journal(tmp_path):
+    first_run, committed, duplicates = asyncio.run(_interrupt_and_restart(tmp_path, stop_process))
+    # При остановке начавшиеся отправки завершаются и журнал дописывается: повторов нет
+    assert set(first_run) == committed
+    assert not duplicates
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import random
+
+from telegram import Update
+from telegram.ext import Application
+
+import ingress
+from conftest import FAKE_TOKEN
+from ingress import SECRET_HEADER, PerUserUpdateProcessor, WebhookServer
+
+SECRET = 'test-secret'
+UPDATE = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+                                      'from': {'id': 1, 'is_bot': False, 'first_name': 'user'}, 'text': 'привет'}}
+
+
+async def _with_server(check, secret_token=SECRET):
+    application = Application.builder().token(FAKE_TOKEN).updater(None).build()
+    server = WebhookServer(application, host='127.0.0.1', port=0, secret_token=secret_token)
+    await server.start()
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        try:
+            return await check(application, reader, writer)
+        finally:
+            writer.close()
+    finally:
+        await server.stop()
+
+
+# Ответ: (статус, заголовки, тело); тело читается по Content-Length, если with_body
+async def _response(reader, with_body=True):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode()
+        if line == '\r\n':
+            break
+        name, _, value = line.partition(':')
+        headers[name.lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length'])) if with_body else b''
+    return status, headers, body
+
+
+def _post(writer, secret=None):
+    body = json.dumps(UPDATE).encode()
+    head = f"POST /telegram HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+    if secret is not None:
+        head += f"{SECRET_HEADER}: {secret}\r\n"
+    writer.write(head.encode() + b'\r\n' + body)
+
+
+def test_webhook_requires_secret():
+    async def check(application, reader, writer):
+        statuses = []
+        for secret in (None, 'wrong', SECRET):
+            _post(writer, secret)
+            statuses.append((await _response(reader))[0])
+        return statuses, application.update_queue.qsize()
+
+    assert asyncio.run(_with_server(check)) == ([403, 403, 200], 1)
+
+
+# Без секрета (режим опроса) вебхук отклоняет любые обновления
+def test_webhook_closed_without_secret():
+    async def check(application, reader, writer):
+        _post(writer, '')
+        return (await _response(reader))[0], application.update_queue.qsize()
+
+    assert asyncio.run(_with_server(check, secret_token=None)) == (403, 0)
+
+
+def test_head_has_no_body():
+    async def check(application, reader, writer):
+        writer.write(b"HEAD / HTTP/1.1\r\n\r\n")
+        status, headers, _ = await _response(reader, with_body=False)
+        # Следующий ответ на том же соединении начинается сразу после заголовков HEAD
+        writer.write(b"GET /health HTTP/1.1\r\n\r\n")
+        return status, int(headers['content-length']) > 0, await _response(reader)
+
+    status, has_length, following = asyncio.run(_with_server(check))
+    assert status == 200 and has_length
+    assert following[0] == 503 and following[2] == b'Starting'
+
+
+def test_slow_headers_time_out(monkeypatch):
+    monkeypatch.setattr(ingress, 'REQUEST_TIMEOUT', 0.2)
+
+    async def check(application, reader, writer):
+        writer.write(b"GET /health HTTP/1.1\r\nHost: localhost\r\n")
+        return await asyncio.wait_for(reader.read(), 5)
+
+    assert asyncio.run(_with_server(check)) == b''
+
+
+def _update(update_id, user_id):
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'}, 'text': 'привет'}}, None)
+
+
+# Вперемешку обновления многих пользователей: у каждого пользователя по порядку и без
+# наложения, разные пользователи - параллельно, но не больше слотов процессора
+def test_per_user_order_and_parallelism():
+    users, per_user, slots = 200, 5, 16
+    rng = random.Random(1)
+    senders = [user_id for user_id in range(1, users + 1) for _ in range(per_user)]
+    rng.shuffle(senders)
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(slots)
+        spans = {}
+        running = peak = 0
+
+        async def handle(update_id, delay):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            started = asyncio.get_running_loop().time()
+            await asyncio.sleep(delay)
+            running -= 1
+            spans[update_id] = (started, asyncio.get_running_loop().time())
+
+        await asyncio.gather(*(
+            processor.process_update(_update(update_id, user_id), handle(update_id, rng.random() * 0.005))
+            for update_id, user_id in enumerate(senders, 1)
+        ))
+        return spans, peak, processor.active_queues()
+
+    spans, peak, active = asyncio.run(scenario())
+    assert len(spans) == len(senders) and active == 0
+    assert 1 < peak <= slots
+
+    by_user = {}
+    for update_id, user_id in enumerate(senders, 1):
+        by_user.setdefault(user_id, []).append(spans[update_id])
+    for user_spans in by_user.values():
+        for (_, finished), (started, _) in zip(user_spans, user_spans[1:]):
+            assert started >= finished
@@ -0,0 +1,279 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from telegram.error import NetworkError
+
+import repository
+from bot import build_catch_up_deliveries, build_delivery
+from conftest import FAKE_TOKEN, create_db, deliveries, query, seed_reminders, spawn_worker, stop_process, wait_until
+from delivery import DeliveryPipeline
+from fake_bot_api import FakeBotApi
+from repository import run_db
+from timeutil import now_epoch, now_in
+
+# Сбои доставки и сверка outbox. Процессы отправки изображаются сменой CLAIM_OWNER,
+# Telegram - FakeBot, который только запоминает отправленное; падение процесса - отсутствие
+# записанного результата. Последний тест роняет настоящий worker.py посреди запроса к Bot API.
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+# Отправка сообщений конвейером с отметкой начала в outbox, как в процессе отправки.
+# Возвращает результаты (id, статус) - их записывает журнал, если процесс не упал.
+async def _deliver(bot, deliveries_):
+    results = []
+
+    async def on_result(delivery, status):
+        results.append((delivery.reminder_id, status))
+
+    pipeline = DeliveryPipeline(bot, on_result, workers=2, global_rate=1000, per_chat_rate=1000,
+                                on_attempt=lambda delivery: run_db(repository.mark_sending, delivery.covered()))
+    pipeline.start()
+    for delivery in deliveries_:
+        pipeline.submit(delivery)
+    await pipeline.join()
+    await pipeline.stop()
+    return results
+
+
+class FlakyBot(FakeBot):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise NetworkError('сбой сети')
+        await super().send_message(chat_id, text, **kwargs)
+
+
+def deliver(bot, rows):
+    return asyncio.run(_deliver(bot, [build_delivery(row) for row in rows]))
+
+
+@pytest.fixture
+def owner(monkeypatch):
+    def switch(name):
+        monkeypatch.setattr(repository, 'CLAIM_OWNER', name)
+    return switch
+
+
+def _due_reminder(user_id=1):
+    return repository.save_reminder_to_db(user_id, 'user', 'текст', now_in() - timedelta(minutes=1))
+
+
+def _expire_leases(db):
+    query(db, 'UPDATE reminders SET claim_until = ? WHERE claim_until IS NOT NULL', (now_epoch() - 1,))
+
+
+def _outbox(db, reminder_id):
+    return query(db, 'SELECT status, unconfirmed, claimed_by FROM outbox WHERE reminder_id = ?', (reminder_id,))
+
+
+# Процесс упал после отметки 'sending': результат неизвестен, срабатывание уходит ещё раз
+# и учитывается как неподтверждённое
+def test_crash_after_sending(db, owner):
+    reminder_id = _due_reminder()
+    owner('a')
+    rows = repository.claim_due_reminders([reminder_id])
+    assert repository.mark_sending([(rows[0][0], rows[0][3])])
+
+    # Пока аренда не истекла, сверка не трогает чужую отправку
+    owner('b')
+    assert repository.recover_outbox() == (0, 0)
+    assert repository.claim_due_reminders([reminder_id]) == []
+
+    _expire_leases(db)
+    assert repository.recover_outbox() == (0, 1)
+    assert _outbox(db, reminder_id) == [('in_doubt', 0, None)]
+    rows = repository.claim_due_reminders([reminder_id])
+    bot = FakeBot()
+    assert deliver(bot, rows) == [(reminder_id, 'sent')]
+    repository.record_delivery_outcomes([(reminder_id, rows[0][3], 'sent')])
+
+    assert bot.sent == [1]
+    assert _outbox(db, reminder_id) == [('sent', 1, None)]
+    assert repository.get_reminder_info(reminder_id)['sent'] == 1
+
+
+# Аренда истекла, срабатывание перехватил другой процесс: прежний владелец не отправляет,
+# а его запоздавший результат не меняет итог
+def test_lease_takeover(db, owner):
+    reminder_id = _due_reminder()
+    owner('a')
+    stale_rows = repository.claim_due_reminders([reminder_id])
+    _expire_leases(db)
+
+    owner('b')
+    rows = repository.claim_due_reminders([reminder_id])
+    assert [row[0] for row in rows] == [reminder_id]
+    bot = FakeBot()
+    assert deliver(bot, rows) == [(reminder_id, 'sent')]
+    repository.record_delivery_outcomes([(reminder_id, rows[0][3], 'sent')])
+
+    owner('a')
+    late = FakeBot()
+    assert deliver(late, stale_rows) == []
+    repository.record_delivery_outcomes([(reminder_id, stale_rows[0][3], 'failed')])
+
+    assert bot.sent == [1] and late.sent == []
+    assert _outbox(db, reminder_id) == [('sent', 0, None)]
+    assert query(db, 'SELECT sent, claimed_by FROM reminders WHERE id = ?', (reminder_id,)) == [(1, None)]
+
+
+# Каждая попытка падает после отметки 'sending': после MAX_UNCONFIRMED таких попыток
+# срабатывание закрывается без отправки
+def test_unconfirmed_cap(db, owner, monkeypatch):
+    monkeypatch.setattr(repository, 'MAX_UNCONFIRMED', 3)
+    reminder_id = _due_reminder()
+    bot = FakeBot()
+
+    for attempt in range(3):
+        owner(f"process-{attempt}")
+        rows = repository.claim_due_reminders([reminder_id])
+        assert [row[0] for row in rows] == [reminder_id]
+        assert deliver(bot, rows) == [(reminder_id, 'sent')]
+        # Процесс упал до записи результата
+        _expire_leases(db)
+        assert _outbox(db, reminder_id)[0][:2] == ('sending', attempt)
+
+    owner('process-3')
+    assert repository.claim_due_reminders([reminder_id]) == []
+    assert bot.sent == [1, 1, 1]
+    assert _outbox(db, reminder_id) == [('abandoned', 3, None)]
+    assert reminder_id not in dict(repository.load_pending_reminders())
+
+
+# Напоминание удалили, пока его сообщение ждало в очереди: отправка отменяется
+def test_deleted_while_queued(db, owner):
+    reminder_id = _due_reminder()
+    owner('a')
+    rows = repository.claim_due_reminders([reminder_id])
+    repository.delete_reminder(reminder_id)
+
+    bot = FakeBot()
+    assert deliver(bot, rows) == []
+    assert bot.sent == []
+    assert _outbox(db, reminder_id) == [('cancelled', 0, None)]
+
+
+# Процесс упал посреди отправки, напоминание удалили: сверка при запуске отменяет срабатывание
+def test_deleted_after_crash(db, owner):
+    reminder_id = _due_reminder()
+    owner('a')
+    rows = repository.claim_due_reminders([reminder_id])
+    assert repository.mark_sending([(rows[0][0], rows[0][3])])
+    repository.delete_reminder(reminder_id)
+
+    owner('b')
+    assert repository.recover_outbox() == (1, 0)
+    assert _outbox(db, reminder_id) == [('cancelled', 0, None)]
+
+
+# Отложенное в очереди напоминание не отправляется со старым сроком и не остаётся захваченным
+def test_postponed_while_queued(db, owner):
+    reminder_id = _due_reminder()
+    owner('a')
+    rows = repository.claim_due_reminders([reminder_id])
+    repository.postpone_reminder(reminder_id, 30)
+
+    bot = FakeBot()
+    assert deliver(bot, rows) == []
+    assert bot.sent == []
+    assert _outbox(db, reminder_id) == [('cancelled', 0, None)]
+    assert query(db, 'SELECT claimed_by, claim_until FROM reminders WHERE id = ?', (reminder_id,)) == [(None, None)]
+
+
+# В сводке одно напоминание удалили: сводка не отправляется, остальные напоминания отпускаются
+# и захватываются снова
+def test_digest_with_deleted_reminder(db, owner):
+    first = repository.save_reminder_to_db(1, 'user', 'первое', now_in() - timedelta(hours=2))
+    second = repository.save_reminder_to_db(1, 'user', 'второе', now_in() - timedelta(hours=1))
+    owner('a')
+    rows = repository.claim_overdue_reminders([first], now_epoch())
+    digest, = build_catch_up_deliveries(rows)
+    assert {reminder_id for reminder_id, _ in digest.covered()} == {first, second}
+    repository.delete_reminder(second)
+
+    bot = FakeBot()
+    assert asyncio.run(_deliver(bot, [digest])) == []
+    assert bot.sent == []
+    assert _outbox(db, second) == [('cancelled', 0, None)]
+    assert _outbox(db, first) == [('released', 0, None)]
+    assert [row[0] for row in repository.claim_due_reminders([first])] == [first]
+
+
+# Тестовый Bot API, который запоминает методы запросов при их получении, до ответа
+class ReceivingApi(FakeBotApi):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.received = []
+
+    async def _route(self, method, path, headers, body):
+        self.received.append(path.rsplit('/', 1)[-1])
+        return await super()._route(method, path, headers, body)
+
+
+# Настоящий процесс отправки убит, пока Bot API обрабатывал sendMessage: сообщение дошло,
+# но результат не записан. После перезапуска срабатывание уходит ещё раз как неподтверждённое.
+def test_worker_killed_mid_request(tmp_path):
+    async def run():
+        path = create_db(str(tmp_path / 'reminders.db'))
+        reminder_id, = seed_reminders(path, [3000])
+        api = ReceivingApi(latency=2)
+        await api.start()
+        try:
+            worker = spawn_worker(path, api, DELIVERY_LEASE=1)
+            # Процесс убивается, когда запрос уже дошёл до Bot API, но ответа ещё нет
+            await wait_until(lambda: 'sendMessage' in api.received, timeout=30)
+            assert query(path, 'SELECT status FROM outbox') == [('sending',)]
+            worker.kill()
+            worker.wait()
+            await wait_until(lambda: deliveries(api)[3000] == 1, timeout=10)
+
+            api.latency = 0
+            worker = spawn_worker(path, api, DELIVERY_LEASE=1)
+            await wait_until(lambda: query(path, 'SELECT sent FROM reminders') == [(1,)], timeout=30)
+            await stop_process(worker)
+        finally:
+            await api.stop()
+        return deliveries(api), query(path, 'SELECT status, unconfirmed FROM outbox WHERE reminder_id = ?',
+                                      (reminder_id,))
+
+    sent, outbox = asyncio.run(run())
+    assert sent == {3000: 2}
+    assert outbox == [('sent', 1)]
+
+
+# Временная ошибка отправки: повтор ставится в расписание на записанный в БД конец задержки
+# и проходит захват, даже если журнал записал результат позже, чем произошла ошибка
+def test_failed_send_is_retried(db, monkeypatch):
+    import bot as bot_module
+
+    monkeypatch.setattr(repository, 'RETRY_DELAY', 1)
+    # Результат ошибки попадает в БД заметно позже самой ошибки
+    monkeypatch.setattr(bot_module.delivery_journal, 'flush_interval', 1.5)
+    reminder_id = _due_reminder()
+    bot = FlakyBot(failures=1)
+
+    async def run():
+        checker = asyncio.create_task(bot_module.async_reminder_checker(FAKE_TOKEN, bot=bot))
+        try:
+            await wait_until(lambda: bot.sent, timeout=6)
+        finally:
+            checker.cancel()
+            await asyncio.gather(checker, return_exceptions=True)
+
+    asyncio.run(run())
+    assert bot.attempts == 2 and bot.sent == [1]
+    assert _outbox(db, reminder_id) == [('sent', 0, None)]
+    assert repository.get_reminder_info(reminder_id)['sent'] == 1
@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import pytest
+
+from recurrence import _days_until_next, _next_by_interval, days_to_mask, next_occurrence
+from timeutil import from_epoch, localize, to_epoch
+
+HOUR = 3600
+# Переход на летнее время 29.03.2026 02:00 -> 03:00, обратно 25.10.2026 03:00 -> 02:00
+DST_TZ = 'Europe/Berlin'
+
+
+def _epoch(*parts, tz=DST_TZ) -> int:
+    return to_epoch(localize(datetime(*parts), tz))
+
+
+def _wall(ts: int, tz=DST_TZ) -> datetime:
+    return from_epoch(ts, tz).replace(tzinfo=None)
+
+
+def test_days_to_mask():
+    assert days_to_mask('0,2,4') == 0b10101
+    assert days_to_mask('6') == 1 << 6
+    assert days_to_mask('') == 0
+    assert days_to_mask('1,,1,') == 0b10
+
+
+# Через сколько дней ближайший день из маски: сверка с перебором по всем маскам и дням,
+# в том числе переход через воскресенье и тот же день через неделю
+def test_days_until_next_matches_brute_force():
+    for mask in range(1, 1 << 7):
+        for weekday in range(7):
+            expected = next(days for days in range(1, 8) if mask >> (weekday + days) % 7 & 1)
+            assert _days_until_next(mask, weekday) == expected, (bin(mask), weekday)
+
+
+def test_days_until_next_wraps_around_week():
+    monday, friday = 1 << 0, 1 << 4
+    assert _days_until_next(monday, 6) == 1
+    assert _days_until_next(monday, 0) == 7
+    assert _days_until_next(monday | friday, 2) == 2
+    assert _days_until_next(monday | friday, 4) == 3
+
+
+@pytest.mark.parametrize('after, expected', [
+    # Раньше первого срабатывания и ровно в него - следующий шаг
+    (datetime(2026, 9, 30, 12, 0), datetime(2026, 10, 4, 9, 0)),
+    (datetime(2026, 10, 1, 9, 0), datetime(2026, 10, 4, 9, 0)),
+    # День шага, но до времени срабатывания - этот же день
+    (datetime(2026, 10, 10, 8, 0), datetime(2026, 10, 10, 9, 0)),
+    (datetime(2026, 10, 10, 9, 0), datetime(2026, 10, 13, 9, 0)),
+    # День между шагами
+    (datetime(2026, 10, 11, 23, 0), datetime(2026, 10, 13, 9, 0)),
+    # Пропущено много шагов
+    (datetime(2027, 1, 1, 0, 0), datetime(2027, 1, 2, 9, 0)),
+])
+def test_next_by_interval(after, expected):
+    assert _next_by_interval(datetime(2026, 10, 1, 9, 0), 3, after) == expected
+
+
+def test_not_repeating():
+    ts = _epoch(2026, 10, 1, 9, 0)
+    assert next_occurrence(ts, 'once', tz=DST_TZ) is None
+    assert next_occurrence(ts, 'custom', repeat_days='', tz=DST_TZ) is None
+    assert next_occurrence(ts, 'monthly', tz=DST_TZ) is None
+
+
+@pytest.mark.parametrize('repeat_type, interval, days, expected', [
+    ('daily', 1, '', datetime(2026, 10, 2, 9, 0)),
+    ('daily', 0, '', datetime(2026, 10, 2, 9, 0)),
+    ('daily', 3, '', datetime(2026, 10, 4, 9, 0)),
+    ('weekly', 1, '', datetime(2026, 10, 8, 9, 0)),
+    ('weekly', 2, '', datetime(2026, 10, 15, 9, 0)),
+    # 01.10.2026 - четверг: следующий выбранный день - понедельник
+    ('custom', 1, '0,2', datetime(2026, 10, 5, 9, 0)),
+    ('custom', 1, '3', datetime(2026, 10, 8, 9, 0)),
+    ('custom', 1, '4,6', datetime(2026, 10, 2, 9, 0)),
+])
+def test_next_occurrence(repeat_type, interval, days, expected):
+    ts = _epoch(2026, 10, 1, 9, 0)
+    assert _wall(next_occurrence(ts, repeat_type, interval, days, tz=DST_TZ)) == expected
+
+
+# Пропущенные срабатывания: следующее - первое после after, а не после ts
+def test_next_occurrence_after():
+    ts = _epoch(2026, 10, 1, 9, 0)
+    after = _epoch(2026, 10, 20, 12, 0)
+    assert _wall(next_occurrence(ts, 'daily', 1, after=after, tz=DST_TZ)) == datetime(2026, 10, 21, 9, 0)
+    assert _wall(next_occurrence(ts, 'daily', 5, after=after, tz=DST_TZ)) == datetime(2026, 10, 21, 9, 0)
+    assert _wall(next_occurrence(ts, 'weekly', 1, after=after, tz=DST_TZ)) == datetime(2026, 10, 22, 9, 0)
+    assert _wall(next_occurrence(ts, 'custom', 1, '1', after=after, tz=DST_TZ)) == datetime(2026, 10, 27, 9, 0)
+
+
+# Через переход на летнее и зимнее время срабатывание остаётся в 9:00 по часам пользователя
+@pytest.mark.parametrize('start, repeat_type, days, expected, hours', [
+    ((2026, 3, 28, 9, 0), 'daily', '', datetime(2026, 3, 29, 9, 0), 23),
+    ((2026, 10, 24, 9, 0), 'daily', '', datetime(2026, 10, 25, 9, 0), 25),
+    ((2026, 3, 22, 9, 0), 'weekly', '', datetime(2026, 3, 29, 9, 0), 7 * 24 - 1),
+    ((2026, 10, 18, 9, 0), 'weekly', '', datetime(2026, 10, 25, 9, 0), 7 * 24 + 1),
+    # Суббота -> воскресенье через переход
+    ((2026, 3, 28, 9, 0), 'custom', '5,6', datetime(2026, 3, 29, 9, 0), 23),
+    ((2026, 10, 24, 9, 0), 'custom', '6', datetime(2026, 10, 25, 9, 0), 25),
+])
+def test_dst_keeps_wall_time(start, repeat_type, days, expected, hours):
+    ts = _epoch(*start)
+    result = next_occurrence(ts, repeat_type, 1, days, tz=DST_TZ)
+    assert _wall(result) == expected
+    assert result - ts == hours * HOUR
+
+
+# Время, которого нет (02:30 при переходе на летнее) или которое бывает дважды (02:30 при
+# переходе на зимнее): срабатывание не теряется и не повторяется. Несуществующее 02:30
+# становится 03:30, и дальше напоминание идёт от него (хранится только срок, не исходное время).
+def test_dst_gap_and_overlap():
+    ts = _epoch(2026, 3, 28, 2, 30)
+    skipped = next_occurrence(ts, 'daily', tz=DST_TZ)
+    assert skipped - ts == 24 * HOUR
+    assert _wall(skipped) == datetime(2026, 3, 29, 3, 30)
+    assert _wall(next_occurrence(skipped, 'daily', tz=DST_TZ)) == datetime(2026, 3, 30, 3, 30)
+
+    ts = _epoch(2026, 10, 24, 2, 30)
+    repeated = next_occurrence(ts, 'daily', tz=DST_TZ)
+    assert repeated - ts == 25 * HOUR
+    assert _wall(repeated) == datetime(2026, 10, 25, 2, 30)
+    assert _wall(next_occurrence(repeated, 'daily', tz=DST_TZ)) == datetime(2026, 10, 26, 2, 30)
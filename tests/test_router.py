@@ -0,0 +1,124 @@
+import pytest
+
+import bot
+import keyboards
+from bot import callback_router
+from router import CallbackRouter
+
+REMINDER_ID = 7
+
+# callback_data -> (обработчик, аргументы, фиксированные параметры) для всех маршрутов bot.py,
+# в том числе префиксов, которые начинаются с другого префикса
+ROUTES = [
+    ('back_to_start', bot.on_back_to_start, (), {}),
+    ('create_new', bot.on_create_new, (), {}),
+    ('back_to_list_0', bot.on_back_to_list, (0,), {}),
+    ('list_page_2', bot.on_back_to_list, (2,), {}),
+    ('list_page_current', bot.on_list_page_current, (), {}),
+    ('list_next_1_1800000000_42', bot.on_list_page, (1, 1800000000, 42), {'direction': 'next'}),
+    ('list_prev_0_1800000000_42', bot.on_list_page, (0, 1800000000, 42), {'direction': 'prev'}),
+    ('view_7', bot.on_view, (7,), {}),
+    ('delete_confirm_7', bot.on_delete_confirm, (7,), {}),
+    ('delete_yes_7', bot.on_delete_yes, (7,), {}),
+    ('done_7', bot.on_done, (7,), {}),
+    ('done_now_7', bot.on_done_now, (7,), {}),
+    ('edit_text_7', bot.on_edit_text, (7,), {}),
+    ('edit_time_7', bot.on_edit_time, (7,), {}),
+    ('edit_repeat_7', bot.on_edit_repeat, (7,), {}),
+    ('edit_repeat_type_7_weekly', bot.on_edit_repeat_type, (7, 'weekly'), {}),
+    ('edit_interval_7_3', bot.on_edit_interval, (7, 3), {}),
+    ('edit_day_7_4', bot.on_edit_day, (7, 4), {}),
+    ('edit_days_done_7', bot.on_edit_days_done, (7,), {}),
+    ('repeat_daily', bot.on_repeat, ('daily',), {}),
+    ('repeat_skip', bot.on_repeat, ('skip',), {}),
+    ('interval_back', bot.on_back_to_repeat, (), {}),
+    ('days_cancel', bot.on_back_to_repeat, (), {}),
+    ('interval_3', bot.on_interval, (3,), {}),
+    ('day_4', bot.on_day, (4,), {}),
+    ('days_done', bot.on_days_done, (), {}),
+    ('snooze_menu_7', bot.on_snooze_menu, (7,), {}),
+    ('snooze_15_7', bot.on_snooze, ('15', 7), {}),
+    ('snooze_tomorrow_7', bot.on_snooze, ('tomorrow', 7), {}),
+]
+
+# Повреждённые и неизвестные кнопки
+UNKNOWN = [
+    '', 'unknown', 'view', 'view_', 'view_abc', 'view_7_8', 'done_now_', 'done_now_x',
+    'snooze_7', 'snooze_menu_x', 'edit_repeat_type_7', 'edit_day_7', 'list_next_1_2', 'back_to_start_1',
+]
+
+
+# Все маршруты маршрутизатора: из словаря точных значений и из дерева префиксов
+def _registered(router: CallbackRouter):
+    routes = list(router._exact.values())
+    nodes = [router._trie]
+    while nodes:
+        node = nodes.pop()
+        for key, value in node.items():
+            if key is None:
+                routes.append(value)
+            else:
+                nodes.append(value)
+    return routes
+
+
+@pytest.mark.parametrize('data, handler, args, bound', ROUTES)
+def test_resolves(data, handler, args, bound):
+    action = callback_router.resolve(data)
+    assert action is not None
+    assert (action.route.handler, action.args, action.route.bound) == (handler, args, bound)
+
+
+def test_every_route_is_covered():
+    covered = {callback_router.resolve(data).route.name for data, *_ in ROUTES}
+    assert covered == {route.name for route in _registered(callback_router)}
+
+
+@pytest.mark.parametrize('data', UNKNOWN)
+def test_rejects(data):
+    assert callback_router.resolve(data) is None
+
+
+# Все кнопки клавиатур бота ведут на зарегистрированные маршруты
+def test_keyboard_buttons_resolve():
+    reminders = [{'id': REMINDER_ID, 'text': 'текст', 'reminder_time': 1800000000, 'sent': 0, 'is_active': 1,
+                  'repeat_type': 'once'}] * 3
+    markups = [
+        keyboards.EMPTY_LIST_KEYBOARD, keyboards.TO_LIST_KEYBOARD, keyboards.FULL_LIST_KEYBOARD,
+        keyboards.AFTER_ACTION_KEYBOARD, keyboards.create_digest_keyboard(),
+        keyboards.create_reminder_control_keyboard(REMINDER_ID), keyboards.create_delete_confirm_keyboard(REMINDER_ID),
+        keyboards.create_reminder_keyboard(REMINDER_ID), keyboards.create_snooze_options_keyboard(REMINDER_ID),
+        keyboards.create_details_keyboard(REMINDER_ID), keyboards.create_days_saved_keyboard(REMINDER_ID),
+        keyboards.create_repeat_keyboard(), keyboards.create_repeat_keyboard(REMINDER_ID),
+        keyboards.create_daily_interval_keyboard(), keyboards.create_daily_interval_keyboard(REMINDER_ID),
+        keyboards.create_days_keyboard([0, 3]), keyboards.create_days_keyboard([0, 3], REMINDER_ID),
+        keyboards.create_reminders_list_keyboard(reminders, page=1, total_count=30, has_next=True),
+    ]
+    buttons = [button for markup in markups for row in markup.inline_keyboard for button in row]
+    assert len(buttons) > 50
+    for button in buttons:
+        assert callback_router.resolve(button.callback_data) is not None, button.callback_data
+
+
+# Порядок регистрации не важен: короткий префикс после длинного его не перекрывает,
+# а аргументы, не подошедшие длинному префиксу, разбираются более коротким
+def test_longest_prefix_wins_regardless_of_order():
+    router = CallbackRouter()
+
+    @router.route('a_b_', int)
+    async def longer(update, context, value):
+        pass
+
+    @router.route('a_', str, str)
+    async def shorter(update, context, name, value):
+        pass
+
+    action = router.resolve('a_b_1')
+    assert (action.route.handler, action.args) == (longer, (1,))
+    assert router.resolve('a_c_1').route.handler is shorter
+    action = router.resolve('a_b_x')
+    assert (action.route.handler, action.args) == (shorter, ('b', 'x'))
+    assert router.resolve('a_b_1_2') is None
+
+    with pytest.raises(ValueError):
+        router.route('a_b_', int)(longer)
@@ -0,0 +1,52 @@
+import asyncio
+
+from conftest import create_db, deliveries, query, seed_reminders, spawn_worker, stop_process, wait_until
+from fake_bot_api import FakeBotApi
+from timeutil import now_epoch
+
+# Несколько процессов worker.py на одной базе: части пользователей, второй экземпляр части
+# (старая и новая реплика во время выкладки) и процесс на всех пользователей сразу.
+# Напоминания захватываются атомарно, поэтому каждое уходит ровно один раз.
+
+USERS = range(2000, 2240)
+# Сроки напоминаний растянуты на несколько секунд, чтобы процессы захватывали их одновременно
+SPREAD = 4
+
+
+async def _run_overlapping(tmp_path):
+    path = create_db(str(tmp_path / 'reminders.db'))
+    api = FakeBotApi(latency=0.005)
+    await api.start()
+    workers = []
+    try:
+        shards = ((0, 3), (1, 3), (2, 3), (1, 3), (0, 1))
+        for shard in shards:
+            workers.append(spawn_worker(path, api, shard=shard))
+        # Напоминания появляются, когда все процессы запущены (каждый при запуске вызывает getMe)
+        await wait_until(lambda: sum(call.method == 'getMe' for call in api.calls) >= len(shards), timeout=60)
+        now = now_epoch()
+        for offset in range(SPREAD):
+            seed_reminders(path, [user_id for user_id in USERS if user_id % SPREAD == offset], due=now + 1 + offset)
+
+        # Процесс на всех пользователей останавливается посреди работы и отпускает захваченное
+        await wait_until(lambda: sum(deliveries(api).values()) >= len(USERS) // 3, timeout=60)
+        await stop_process(workers.pop())
+
+        await wait_until(lambda: not query(path, 'SELECT id FROM reminders WHERE sent = 0'), timeout=60)
+        await asyncio.sleep(0.5)
+        for worker in workers:
+            await stop_process(worker)
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+        await api.stop()
+    return path, deliveries(api)
+
+
+def test_overlapping_workers_deliver_exactly_once(tmp_path):
+    path, sent = asyncio.run(_run_overlapping(tmp_path))
+    assert set(sent) == set(USERS)
+    assert set(sent.values()) == {1}
+    assert query(path, "SELECT status, COUNT(*) FROM outbox GROUP BY status") == [('sent', len(USERS))]
+    assert query(path, 'SELECT COUNT(*) FROM reminders WHERE claimed_by IS NOT NULL') == [(0,)]
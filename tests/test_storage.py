@@ -0,0 +1,258 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pytest
+
+import repository
+from cache import CACHES
+from scheduler import reminder_scheduler
+from storage import PostgresStorage, SQLiteStorage, create_storage
+from timeutil import DEFAULT_TIMEZONE, now_epoch, now_in, to_epoch
+
+# Одни и те же проверки для SQLiteStorage и PostgresStorage.
+# PostgreSQL проверяется, если задан TEST_DATABASE_URL; таблицы этой базы очищаются перед каждым тестом.
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+PG_TABLES = 'reminders, reminders_archive, users, user_state, outbox'
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def make_storage(request):
+    if request.param == 'sqlite':
+        request.getfixturevalue('db')
+        return SQLiteStorage
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL не задан')
+    pytest.importorskip('asyncpg')
+    for cache in CACHES:
+        cache.clear()
+    return lambda: PostgresStorage(TEST_DATABASE_URL)
+
+
+def run(make_storage, check):
+    async def main():
+        storage = make_storage()
+        await storage.initialize()
+        if isinstance(storage, PostgresStorage):
+            await storage.pool.execute(f'TRUNCATE {PG_TABLES} RESTART IDENTITY')
+        try:
+            return await check(storage)
+        finally:
+            await storage.close()
+    return asyncio.run(main())
+
+
+def test_create_storage_by_url():
+    assert isinstance(create_storage('postgresql://localhost/reminders'), PostgresStorage)
+    assert isinstance(create_storage('postgres://localhost/reminders'), PostgresStorage)
+    assert isinstance(create_storage(''), SQLiteStorage)
+
+
+def test_reminder_lifecycle(make_storage):
+    async def check(storage):
+        now = now_in()
+        overdue = await storage.save_reminder_to_db(7, 'user', 'разовое', now - timedelta(minutes=1))
+        daily = await storage.save_reminder_to_db(7, 'user', 'ежедневное', now + timedelta(hours=1), 'daily', '', 1)
+
+        info = await storage.get_reminder_info(daily)
+        assert info['text'] == 'ежедневное' and info['user_id'] == 7
+        assert info['next_reminder_time'] == info['reminder_time'] + 86400
+        page, has_more = await storage.get_reminders_page(7)
+        assert [reminder['id'] for reminder in page] == [overdue, daily] and not has_more
+        assert await storage.get_reminder_counts(7) == (2, 1, 1)
+        assert [reminder['id'] for reminder in await storage.get_repeating_reminders(7)] == [daily]
+        assert [reminder['id'] for reminder in await storage.get_pending_reminders(7)] == [overdue, daily]
+        assert [reminder['id'] for reminder in await storage.get_upcoming_reminders(7)] == [daily]
+
+        await storage.update_reminder(overdue, text='изменённое')
+        assert (await storage.get_reminder_info(overdue))['text'] == 'изменённое'
+        postponed = await storage.postpone_reminder(overdue, 30)
+        assert to_epoch(postponed) == (await storage.get_reminder_info(overdue))['reminder_time']
+        assert postponed > now
+
+        # Выполненное повторяющееся переходит к следующему срабатыванию, разовое - в архив
+        await storage.mark_as_done(daily)
+        assert (await storage.get_reminder_info(daily))['reminder_time'] == info['next_reminder_time']
+        await storage.mark_as_done(overdue)
+        assert await storage.get_reminder_counts(7) == (1, 0, 1)
+
+        assert await storage.delete_reminder(daily)
+        assert await storage.get_reminder_info(daily) is None
+
+    run(make_storage, check)
+
+
+def test_keyset_pages(make_storage):
+    async def check(storage):
+        start = now_in() + timedelta(hours=1)
+        ids = [await storage.save_reminder_to_db(7, 'user', f"№{i}", start + timedelta(minutes=i // 2))
+               for i in range(20)]
+
+        pages, cursor, has_more = [], None, True
+        while has_more:
+            page, has_more = await storage.get_reminders_page(7, cursor, 'next', 8)
+            pages.append([reminder['id'] for reminder in page])
+            cursor = (page[-1]['reminder_time'], page[-1]['id'])
+        assert pages == [ids[:8], ids[8:16], ids[16:]]
+
+        first = await storage.get_reminder_info(ids[16])
+        page, has_more = await storage.get_reminders_page(7, (first['reminder_time'], first['id']), 'prev', 8)
+        assert [reminder['id'] for reminder in page] == ids[8:16] and has_more
+
+        # Ближайшие - в том же порядке (время, id), не больше limit
+        assert [reminder['id'] for reminder in await storage.get_upcoming_reminders(7)] == ids[:3]
+        assert [reminder['id'] for reminder in await storage.get_upcoming_reminders(7, 5)] == ids[:5]
+        await storage.delete_reminder(ids[0])
+        assert [reminder['id'] for reminder in await storage.get_upcoming_reminders(7)] == ids[1:4]
+
+    run(make_storage, check)
+
+
+def test_users(make_storage):
+    async def check(storage):
+        assert await storage.user_timezone(7) == DEFAULT_TIMEZONE
+        await storage.set_user_timezone(7, 'Asia/Tokyo')
+        assert await storage.user_timezone(7) == 'Asia/Tokyo'
+
+        await storage.save_user_states([(7, b'state'), (8, None)])
+        assert await storage.load_user_state(7) == b'state'
+        assert await storage.load_user_state(8) is None
+        await storage.save_user_states([(7, None)])
+        assert await storage.load_user_state(7) is None
+
+    run(make_storage, check)
+
+
+def test_claim_and_record(make_storage):
+    async def check(storage):
+        now = now_in()
+        await storage.set_user_timezone(7, 'Asia/Tokyo')
+        once = await storage.save_reminder_to_db(7, 'user', 'разовое', now - timedelta(minutes=1))
+        daily = await storage.save_reminder_to_db(8, 'user', 'ежедневное', now - timedelta(minutes=1), 'daily')
+        future = await storage.save_reminder_to_db(7, 'user', 'будущее', now + timedelta(hours=1))
+        pending = dict(await storage.load_pending_reminders())
+        assert set(pending) == {once, daily, future}
+
+        claimed = await storage.claim_due_reminders([once, daily, future])
+        assert sorted(row[0] for row in claimed) == [once, daily]
+        assert {row[0]: row[7] for row in claimed}[once] == 'Asia/Tokyo'
+        # Захваченное не захватывается повторно, в расписании оно - на момент окончания аренды
+        assert await storage.claim_due_reminders([once, daily]) == []
+        leased = dict(await storage.load_pending_reminders())
+        assert leased[once] > pending[once] and leased[future] == pending[future]
+
+        occurrences = [(row[0], row[3]) for row in claimed]
+        assert await storage.mark_sending(occurrences)
+        await storage.record_delivery_outcomes([(reminder_id, due, 'sent') for reminder_id, due in occurrences])
+
+        assert (await storage.get_reminder_info(once))['sent'] == 1
+        advanced = await storage.get_reminder_info(daily)
+        assert advanced['sent'] == 0 and advanced['reminder_time'] == pending[daily] + 86400
+        assert set(dict(await storage.load_pending_reminders())) == {daily, future}
+        assert await storage.recover_outbox() == (0, 0)
+        assert await storage.invalidate_outbox_changes(now_epoch() - 60) == 2
+        assert await storage.invalidate_outbox_changes(now_epoch() + 60) == 0
+
+    run(make_storage, check)
+
+
+# Отправка удалённого или перенесённого в очереди напоминания отменяется,
+# остальные срабатывания той же сводки отпускаются
+def test_mark_sending_cancels_changed(make_storage):
+    async def check(storage):
+        due = now_in() - timedelta(minutes=1)
+        deleted = await storage.save_reminder_to_db(7, 'user', 'удалённое', due)
+        kept = await storage.save_reminder_to_db(7, 'user', 'оставшееся', due)
+        moved = await storage.save_reminder_to_db(8, 'user', 'перенесённое', due)
+        claimed = {row[0]: row[3] for row in await storage.claim_due_reminders([deleted, kept, moved])}
+
+        await storage.delete_reminder(deleted)
+        await storage.postpone_reminder(moved, 30)
+        assert not await storage.mark_sending([(deleted, claimed[deleted]), (kept, claimed[kept])])
+        assert not await storage.mark_sending([(moved, claimed[moved])])
+
+        assert await storage.recover_outbox() == (0, 0)
+        assert [row[0] for row in await storage.claim_due_reminders([kept, moved])] == [kept]
+
+    run(make_storage, check)
+
+
+# Коммит изменения срока не удался: в расписании остаётся прежний срок
+def test_failed_postpone_keeps_schedule(make_storage, monkeypatch):
+    @contextmanager
+    def failing_connection():
+        conn = repository.pool.acquire()
+        try:
+            yield conn
+            conn.rollback()
+            raise RuntimeError('сбой')
+        finally:
+            repository.pool.release(conn)
+
+    async def check(storage):
+        # Планировщик процесса отправки, после теста - прежний
+        monkeypatch.setattr(reminder_scheduler, '_loop', asyncio.get_running_loop())
+        monkeypatch.setattr(reminder_scheduler, '_wakeup', asyncio.Event())
+        reminder_scheduler.load([])
+        when = now_in() + timedelta(hours=1)
+        reminder_id = await storage.save_reminder_to_db(7, 'user', 'текст', when)
+
+        with monkeypatch.context() as patch:
+            if isinstance(storage, PostgresStorage):
+                from asyncpg.transaction import Transaction
+                commit = Transaction.__aexit__
+
+                # Вместо коммита - откат
+                async def failing_exit(transaction, *exc_info):
+                    await commit(transaction, RuntimeError, RuntimeError('сбой'), None)
+                    raise RuntimeError('сбой')
+                patch.setattr(Transaction, '__aexit__', failing_exit)
+            else:
+                patch.setattr(repository, 'connection', failing_connection)
+            with pytest.raises(RuntimeError):
+                await storage.postpone_reminder(reminder_id, 30)
+
+        assert reminder_scheduler._due[reminder_id] == to_epoch(when)
+        assert (await storage.get_reminder_info(reminder_id))['reminder_time'] == to_epoch(when)
+
+    run(make_storage, check)
+
+
+def test_shards_and_release(make_storage):
+    async def check(storage):
+        due = now_in() - timedelta(minutes=1)
+        even = await storage.save_reminder_to_db(10, 'user', 'чётный', due)
+        odd = await storage.save_reminder_to_db(11, 'user', 'нечётный', due)
+        assert dict(await storage.load_pending_reminders((1, 2))) == {odd: to_epoch(due)}
+
+        assert [row[0] for row in await storage.claim_due_reminders([even, odd], (0, 2))] == [even]
+        # Снятый захват снова доступен
+        assert await storage.release_claims() == 1
+        assert [row[0] for row in await storage.claim_due_reminders([even, odd])] == [even, odd]
+
+        overdue = await storage.save_reminder_to_db(10, 'user', 'давнее', due - timedelta(hours=2))
+        rows = await storage.claim_overdue_reminders([overdue], to_epoch(due))
+        assert [row[0] for row in rows] == [overdue]
+
+    run(make_storage, check)
+
+
+def test_maintenance(make_storage):
+    async def check(storage):
+        old = await storage.save_reminder_to_db(7, 'user', 'давнее', now_in() - timedelta(days=40))
+        kept = await storage.save_reminder_to_db(7, 'user', 'недавнее', now_in() - timedelta(days=1))
+        await storage.mark_as_done(old)
+        await storage.mark_as_done(kept)
+
+        version = await storage.data_version()
+        assert await storage.archive_done_reminders(30) == 1
+        assert await storage.archive_done_reminders(30) == 0
+        assert await storage.get_reminder_info(old) is None
+        assert (await storage.get_reminder_info(kept))['is_active'] == 0
+        assert await storage.data_version() != version
+        assert await storage.prune_outbox(0) == 0
+        assert await storage.incremental_vacuum() >= 0
+
+    run(make_storage, check)
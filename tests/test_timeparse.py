@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import timeparse
+from timeparse import parse_datetime
+from timeutil import localize
+
+TZ = 'Europe/Moscow'
+# Суббота, 14:20:35 по часам пользователя
+NOW = datetime(2026, 10, 17, 14, 20, 35)
+
+# Корпус: текст и ожидаемое время по часам пользователя
+CORPUS = [
+    ('сегодня 20:30', datetime(2026, 10, 17, 20, 30)),
+    ('завтра 10:00', datetime(2026, 10, 18, 10, 0)),
+    ('ПОСЛЕЗАВТРА 9:05', datetime(2026, 10, 19, 9, 5)),
+    ('25.12.2024 15:45', datetime(2024, 12, 25, 15, 45)),
+    ('25.12 15:45', datetime(2026, 12, 25, 15, 45)),
+    ('01.02 8:00', datetime(2027, 2, 1, 8, 0)),
+    ('10.12 15:45', datetime(2026, 12, 10, 15, 45)),
+    ('15:30', datetime(2026, 10, 17, 15, 30)),
+    ('9:00', datetime(2026, 10, 18, 9, 0)),
+    ('  14:21 ', datetime(2026, 10, 17, 14, 21)),
+    ('14:20', datetime(2026, 10, 18, 14, 20)),
+    ('через 2 часа', NOW + timedelta(hours=2)),
+    ('через 30 минут', NOW + timedelta(minutes=30)),
+    ('через час', NOW + timedelta(hours=1)),
+    ('через 1 день', NOW + timedelta(days=1)),
+    ('через 2 часа 30 минут', NOW + timedelta(hours=2, minutes=30)),
+    ('через 1 час и 15 минут', NOW + timedelta(hours=1, minutes=15)),
+    ('через полчаса', NOW + timedelta(minutes=30)),
+    ('через 2 недели', NOW + timedelta(weeks=2)),
+    ('через 5 мин', NOW + timedelta(minutes=5)),
+    ('через 2 дня в 10:00', datetime(2026, 10, 19, 10, 0)),
+    ('в пятницу 18:00', datetime(2026, 10, 23, 18, 0)),
+    ('в субботу 15:00', datetime(2026, 10, 17, 15, 0)),
+    ('суббота 10:00', datetime(2026, 10, 24, 10, 0)),
+    ('во вторник в 7:30', datetime(2026, 10, 20, 7, 30)),
+    ('в 9 вечера', datetime(2026, 10, 17, 21, 0)),
+    ('завтра в 9 утра', datetime(2026, 10, 18, 9, 0)),
+    ('в 12 ночи', datetime(2026, 10, 18, 0, 0)),
+    ('завтра в 2 дня', datetime(2026, 10, 18, 14, 0)),
+    # Знаки препинания между частями
+    ('завтра, 10:00', datetime(2026, 10, 18, 10, 0)),
+    ('в пятницу, в 18:00', datetime(2026, 10, 23, 18, 0)),
+    ('25.12, 15:45', datetime(2026, 12, 25, 15, 45)),
+    ('через 2 часа, 30 минут', NOW + timedelta(hours=2, minutes=30)),
+    ('завтра в 10:00.', datetime(2026, 10, 18, 10, 0)),
+    # Время через точку
+    ('10.30', datetime(2026, 10, 18, 10, 30)),
+    ('завтра 10.30', datetime(2026, 10, 18, 10, 30)),
+    ('сегодня 18.05', datetime(2026, 10, 17, 18, 5)),
+    ('в пятницу в 9.15', datetime(2026, 10, 23, 9, 15)),
+    ('через 2 дня в 10.30', datetime(2026, 10, 19, 10, 30)),
+]
+
+REJECTED = [
+    # 'сегодня' с прошедшим временем не переносится на завтра
+    'сегодня 10:00',
+    'сегодня 14:20',
+    'сегодня 9.30',
+    'сегодня в 9 утра',
+    'абракадабра',
+    'через ёжика',
+    'завтра',
+    '25.12',
+    '31.02.2026 10:00',
+    '25:00',
+    '10.3',
+    '10.30 11.45',
+    '10.30 15:00',
+    'через',
+    'через 2',
+    'через 2 часа в 10:00',
+    'через 99999999999 дней',
+    '',
+    'в пятницу завтра 10:00',
+    'завтра ? 10:00',
+]
+
+
+@pytest.mark.parametrize('text, expected', CORPUS)
+def test_parses(text, expected):
+    assert parse_datetime(text, TZ, NOW).replace(tzinfo=None) == expected
+
+
+@pytest.mark.parametrize('text', REJECTED)
+def test_rejects(text):
+    with pytest.raises(ValueError, match='Не удалось распознать время'):
+        parse_datetime(text, TZ, NOW)
+
+
+# Без now время берётся с часов: результат тот же, что при явном now, и для каждого
+# пояса свой, хотя текст и минута эпохи совпадают
+@pytest.mark.parametrize('text', ['завтра 10:00', '15:30', 'через 2 часа 30 минут', 'в пятницу 18:00'])
+def test_current_time(monkeypatch, text):
+    now = localize(NOW, TZ)
+    monkeypatch.setattr(timeparse._time, 'time', now.timestamp)
+    for tz in (TZ, 'Asia/Tokyo', 'UTC'):
+        expected = parse_datetime(text, tz, now)
+        for _ in range(2):
+            result = parse_datetime(text, tz)
+            assert result == expected and result.utcoffset() == expected.utcoffset()
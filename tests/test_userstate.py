@@ -0,0 +1,106 @@
+import asyncio
+import pickle
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+from telegram.ext import Application, TypeHandler
+
+from conftest import FAKE_TOKEN
+from userstate import UserStateStore
+
+
+# Хранилище состояний в памяти; load падает для пользователей из failing
+class MemoryStates:
+    def __init__(self):
+        self.rows = {}
+        self.failing = set()
+        self.saved = []
+
+    async def load(self, user_id):
+        if user_id in self.failing:
+            raise RuntimeError('база недоступна')
+        return self.rows.get(user_id)
+
+    async def save(self, changes):
+        self.saved.extend(user_id for user_id, _ in changes)
+        for user_id, data in changes:
+            if data is None:
+                self.rows.pop(user_id, None)
+            else:
+                self.rows[user_id] = data
+
+
+def _update(update_id, user_id):
+    user, chat = User(user_id, 'user', False), Chat(user_id, 'private')
+    return Update(update_id, message=Message(update_id, datetime.now(), chat, from_user=user, text='текст'))
+
+
+# Приложение с хранилищем состояний; handler(user_data) - обработчик обновлений
+def _application(states, handler, **options):
+    application = Application.builder().token(FAKE_TOKEN).updater(None).build()
+    store = UserStateStore(states.load, states.save, **options)
+    store.attach(application)
+
+    async def handle(update, context):
+        handler(context.user_data)
+    application.add_handler(TypeHandler(Update, handle))
+    application._initialized = True
+    return application, store
+
+
+def test_failed_load_is_not_flushed():
+    states = MemoryStates()
+    states.rows[1] = pickle.dumps({'reminder_step': 'waiting_time', 'reminder_text': 'сохранённый'})
+    states.failing.add(1)
+    application, store = _application(states, lambda user_data: user_data.setdefault('new', True))
+
+    async def run():
+        await application.process_update(_update(1, 1))
+        await store.flush()
+        assert states.saved == []
+
+        states.failing.clear()
+        await application.process_update(_update(2, 1))
+        await store.flush()
+
+    asyncio.run(run())
+    assert pickle.loads(states.rows[1]) == {'reminder_step': 'waiting_time', 'reminder_text': 'сохранённый',
+                                            'new': True}
+
+
+def test_idle_users_are_evicted_with_state():
+    states = MemoryStates()
+
+    def handler(user_data):
+        user_data['count'] = user_data.get('count', 0) + 1
+
+    application, store = _application(states, handler, max_users=3, idle_timeout=0)
+
+    async def run():
+        for user_id in range(10):
+            await application.process_update(_update(user_id, user_id))
+        await store.flush()
+        assert len(store._loaded) == 3 and len(store._saved) == 3
+        assert set(application.user_data) == set(store._loaded) == {7, 8, 9}
+
+        # Выгруженное состояние читается снова при следующем обновлении
+        await application.process_update(_update(10, 0))
+        await store.flush()
+
+    asyncio.run(run())
+    assert pickle.loads(states.rows[0]) == {'count': 2}
+    assert len(states.rows) == 10
+
+
+def test_recent_users_are_kept():
+    states = MemoryStates()
+    application, store = _application(states, lambda user_data: user_data.setdefault('step', 1), max_users=3)
+
+    async def run():
+        for user_id in range(10):
+            await application.process_update(_update(user_id, user_id))
+        await store.flush()
+
+    asyncio.run(run())
+    # Недавно активные не выгружаются, даже сверх max_users
+    assert len(store._loaded) == 10 and len(application.user_data) == 10
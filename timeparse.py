@@ -0,0 +1,252 @@
+import re
+import time as _time
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple, Union
+
+from timeutil import get_zone, localize
+
+# Разбор времени напоминания на естественном языке за один проход по токенам.
+# Поддерживается: 'сегодня/завтра/послезавтра 20:30', 'в пятницу 18:00', '25.12.2024 15:45',
+# '25.12 15:45', '15:30', '10.30', 'в 9 вечера', 'через 2 часа 30 минут', 'через полчаса', 'через 2 дня в 10:00'
+
+FORMATS_HINT = ("'сегодня 20:30', 'завтра 10:00', 'в пятницу 18:00', '25.12.2024 15:45', '15:30', "
+                "'через 2 часа 30 минут'")
+
+TOKEN_RE = re.compile(r'''
+    (?P<date>\d{1,2}\.\d{1,2}(?:\.\d{2}(?:\d{2})?)?(?!\d))
+  | (?P<time>\d{1,2}:\d{2})
+  | (?P<num>\d+)
+  | (?P<word>[а-я]+)
+  | (?P<other>\S)
+''', re.VERBOSE)
+
+DAY_WORDS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+# Дни недели по началу слова: 'пятница', 'пятницу', 'пт'
+WEEKDAY_STEMS = (
+    ('понед', 0), ('пн', 0), ('втор', 1), ('вт', 1), ('сред', 2), ('ср', 2),
+    ('четв', 3), ('чт', 3), ('пятн', 4), ('пт', 4), ('субб', 5), ('сб', 5),
+    ('воскр', 6), ('вс', 6),
+)
+
+# Единицы длительности по началу слова; 'полчаса' и 'полдня' - отдельно
+UNIT_STEMS = (
+    ('полчас', timedelta(minutes=30)), ('полдн', timedelta(hours=12)),
+    ('мин', timedelta(minutes=1)), ('м', timedelta(minutes=1)),
+    ('час', timedelta(hours=1)), ('ч', timedelta(hours=1)),
+    ('ден', timedelta(days=1)), ('дн', timedelta(days=1)), ('д', timedelta(days=1)),
+    ('недел', timedelta(weeks=1)), ('нед', timedelta(weeks=1)),
+)
+
+# Части суток после часа: 'в 9 вечера'
+DAY_PARTS = {'утра': 0, 'дня': 12, 'вечера': 12, 'ночи': 0}
+
+FILLER_WORDS = {'в', 'во', 'на', 'и', 'к'}
+
+# Знаки препинания между частями: 'завтра, 10:00'
+PUNCTUATION = {',', ';', '.', '!'}
+
+Spec = Tuple[str, Union[datetime, timedelta]]
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+@lru_cache(maxsize=256)
+def _weekday(word: str) -> Optional[int]:
+    for stem, weekday in WEEKDAY_STEMS:
+        if word.startswith(stem) and (len(stem) > 2 or word == stem):
+            return weekday
+    return None
+
+
+@lru_cache(maxsize=256)
+def _unit(word: str) -> Optional[timedelta]:
+    for stem, unit in UNIT_STEMS:
+        if word.startswith(stem) and (len(stem) > 1 or word == stem):
+            return unit
+    return None
+
+
+# Дата из частей 'дд.мм[.гг[гг]]'; без года - ближайшая будущая
+def _date(parts, minute: datetime) -> date:
+    year = parts[2] if len(parts) == 3 else minute.year
+    if year < 100:
+        year += 2000
+    day = date(year, parts[1], parts[0])
+    if len(parts) == 2 and day < minute.date():
+        day = day.replace(year=year + 1)
+    return day
+
+
+def _tokenize(text: str):
+    for match in TOKEN_RE.finditer(text):
+        yield match.lastgroup, match.group()
+
+
+# Разбор нормализованной строки в спецификацию: ('abs', datetime) или ('rel', timedelta)
+def _parse_spec(text: str, minute: datetime) -> Spec:
+    tokens = list(_tokenize(text))
+    day: Optional[date] = None
+    is_today = False
+    at: Optional[time] = None
+    weekday: Optional[int] = None
+    duration: Optional[timedelta] = None
+    has_clock_duration = False
+    # '10.30' - время через точку, если в тексте нет другого времени; иначе это дата
+    dotted: Optional[Tuple[time, Optional[date]]] = None
+
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        i += 1
+
+        if kind == 'word' and value == 'через':
+            duration = duration or timedelta()
+            # Длительность: последовательность '[число] единица', допускаются 'и' и запятые между частями
+            while i < len(tokens):
+                kind, value = tokens[i]
+                amount = None
+                if kind == 'other' and value in PUNCTUATION:
+                    i += 1
+                    continue
+                if kind == 'num':
+                    if i + 1 >= len(tokens) or tokens[i + 1][0] != 'word':
+                        break
+                    amount = int(value)
+                    i += 1
+                    kind, value = tokens[i]
+                if kind != 'word':
+                    break
+                if value == 'и' and amount is None:
+                    i += 1
+                    continue
+                unit = _unit(value)
+                if unit is None:
+                    if amount is not None:
+                        raise ValueError(value)
+                    break
+                if amount is None:
+                    amount = 1
+                duration += unit * amount
+                has_clock_duration = has_clock_duration or unit < timedelta(days=1)
+                i += 1
+            continue
+
+        if kind == 'date':
+            parts = [int(part) for part in value.split('.')]
+            if len(parts) == 2 and len(value.split('.')[1]) == 2 and parts[0] < 24 and parts[1] < 60:
+                if dotted is not None:
+                    raise ValueError(value)
+                try:
+                    dotted = time(parts[0], parts[1]), _date(parts, minute)
+                except ValueError:
+                    dotted = time(parts[0], parts[1]), None
+                continue
+            day = _date(parts, minute)
+        elif kind == 'time':
+            hours, minutes = map(int, value.split(':'))
+            at = time(hours, minutes)
+        elif kind == 'num':
+            # Час без минут: 'в 9', 'в 9 вечера'
+            hours = int(value)
+            if i < len(tokens) and tokens[i][1] in DAY_PARTS:
+                if hours < 12:
+                    hours += DAY_PARTS[tokens[i][1]]
+                elif hours == 12 and tokens[i][1] == 'ночи':
+                    hours = 0
+                i += 1
+            at = time(hours, 0)
+        elif kind == 'word' and value in DAY_WORDS:
+            day = minute.date() + timedelta(days=DAY_WORDS[value])
+            is_today = DAY_WORDS[value] == 0
+        elif kind == 'word' and value in FILLER_WORDS or kind == 'other' and value in PUNCTUATION:
+            continue
+        elif kind == 'word' and _weekday(value) is not None:
+            weekday = _weekday(value)
+        else:
+            raise ValueError(value)
+
+    if dotted is not None:
+        if at is None:
+            at = dotted[0]
+        elif day is not None or dotted[1] is None:
+            raise ValueError(text)
+        else:
+            day = dotted[1]
+
+    if duration is not None:
+        if day is not None or weekday is not None or not duration:
+            raise ValueError(text)
+        if at is None:
+            return 'rel', duration
+        # 'через 2 дня в 10:00' - только дни/недели плюс время суток
+        if has_clock_duration:
+            raise ValueError(text)
+        day = minute.date() + timedelta(days=duration.days)
+
+    if at is None:
+        raise ValueError(text)
+
+    if weekday is not None:
+        if day is not None:
+            raise ValueError(text)
+        day = minute.date() + timedelta(days=(weekday - minute.weekday()) % 7)
+        result = datetime.combine(day, at)
+        if result <= minute:
+            result += timedelta(days=7)
+        return 'abs', result
+
+    if day is not None:
+        result = datetime.combine(day, at)
+        # Явное 'сегодня' с прошедшим временем - ошибка, а не перенос на завтра
+        if is_today and result <= minute:
+            raise ValueError(text)
+        return 'abs', result
+
+    # Время без дня: если оно уже прошло - на завтра
+    result = datetime.combine(minute.date(), at)
+    if result <= minute:
+        result += timedelta(days=1)
+    return 'abs', result
+
+
+# Текущая минута на часах пояса tz по минуте эпохи: перевод в пояс (pytz) делается раз в минуту
+@lru_cache(maxsize=64)
+def _wall_minute(tz: Optional[str], epoch_minute: int) -> datetime:
+    return datetime.fromtimestamp(epoch_minute * 60, get_zone(tz)).replace(tzinfo=None)
+
+
+# Спецификация с уже локализованным абсолютным временем. Результат зависит от текущей
+# минуты и пояса, поэтому они входят в ключ кэша.
+@lru_cache(maxsize=1024)
+def _resolve(text: str, minute: datetime, tz: Optional[str]) -> Spec:
+    kind, value = _parse_spec(text, minute)
+    if kind == 'abs':
+        value = localize(value, tz)
+    return kind, value
+
+
+# Время напоминания по тексту пользователя в его часовом поясе tz.
+# Разбор идёт по часам пользователя, результат - datetime с часовым поясом.
+def parse_datetime(text: str, tz: Optional[str] = None, now: Optional[datetime] = None) -> datetime:
+    if now is None:
+        timestamp = _time.time()
+        minute = _wall_minute(tz, int(timestamp // 60))
+    else:
+        if now.tzinfo is None:
+            now = localize(now, tz)
+        minute = now.astimezone(get_zone(tz)).replace(tzinfo=None, second=0, microsecond=0)
+
+    try:
+        kind, value = _resolve(_normalize(text), minute, tz)
+    except (ValueError, OverflowError):
+        raise ValueError(f"Не удалось распознать время: '{text.strip()}'. Используйте форматы: {FORMATS_HINT}") from None
+
+    if kind == 'abs':
+        return value
+    if now is None:
+        return datetime.fromtimestamp(timestamp + value.total_seconds(), get_zone(tz))
+    return (now + value).astimezone(get_zone(tz))
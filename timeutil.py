@@ -0,0 +1,73 @@
+import os
+import re
+import time
+from datetime import datetime, tzinfo
+from functools import lru_cache
+from typing import Optional
+
+import pytz
+
+# Единый слой преобразования времени: в БД и в планировщике хранится UTC epoch (целые секунды),
+# в часовой пояс пользователя время переводится только для разбора ввода и отображения
+
+DATE_TIME_FORMAT = '%d.%m.%Y %H:%M'
+
+# Часовой пояс пользователей, которые не выбрали свой
+DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'Europe/Moscow')
+
+UTC_OFFSET_RE = re.compile(r'^(?:utc|gmt)?\s*([+-])\s*(\d{1,2})$')
+
+# Названия зон без учёта регистра: 'europe/moscow' -> 'Europe/Moscow'
+_ZONE_NAMES = {name.lower(): name for name in pytz.all_timezones}
+
+
+# Объект часового пояса по имени; None - пояс по умолчанию
+@lru_cache(maxsize=None)
+def get_zone(name: Optional[str] = None) -> tzinfo:
+    return pytz.timezone(name or DEFAULT_TIMEZONE)
+
+
+# Имя часового пояса из ввода пользователя: 'Europe/Berlin', 'utc+3', '-5', 'мск'.
+# None - пояс не распознан.
+def resolve_timezone(text: str) -> Optional[str]:
+    value = text.strip().lower()
+    if value in ('мск', 'москва'):
+        return 'Europe/Moscow'
+    if value in _ZONE_NAMES:
+        return _ZONE_NAMES[value]
+
+    match = UTC_OFFSET_RE.match(value)
+    if match:
+        sign, hours = match.groups()
+        if int(hours) == 0:
+            return 'UTC'
+        # В зонах Etc/GMT знак инвертирован: UTC+3 = Etc/GMT-3
+        name = f"Etc/GMT{'-' if sign == '+' else '+'}{int(hours)}"
+        return name if name.lower() in _ZONE_NAMES else None
+    return None
+
+
+def now_epoch() -> int:
+    return int(time.time())
+
+
+# Текущее время в часовом поясе пользователя
+def now_in(tz: Optional[str] = None) -> datetime:
+    return datetime.now(get_zone(tz))
+
+
+def to_epoch(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+
+# Наивное время на часах пользователя -> datetime с часовым поясом
+def localize(dt: datetime, tz: Optional[str] = None) -> datetime:
+    return get_zone(tz).localize(dt)
+
+
+def from_epoch(ts: int, tz: Optional[str] = None) -> datetime:
+    return datetime.fromtimestamp(ts, get_zone(tz))
+
+
+def format_epoch(ts: int, fmt: str = DATE_TIME_FORMAT, tz: Optional[str] = None) -> str:
+    return from_epoch(ts, tz).strftime(fmt)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# Группа обработчика загрузки - раньше всех остальных обработчиков,
+# группа отметки изменений - после всех
+HYDRATE_GROUP = -100
+TOUCH_GROUP = 100
+
+
+# Хранение context.user_data (шаги создания и редактирования напоминаний) между перезапусками.
+# Состояние пользователя читается из БД при первом его обновлении после старта,
+# изменения записываются пачками раз в flush_interval секунд.
+# В памяти остаются не больше max_users пользователей: состояние записанных и неактивных
+# дольше idle_timeout секунд выгружается и при следующем обновлении читается снова.
+class UserStateStore:
+    """Ленивая загрузка и пакетная запись user_data"""
+
+    def __init__(self, load: Callable[[int], Awaitable[Optional[bytes]]],
+                 save: Callable[[List[Tuple[int, Optional[bytes]]]], Awaitable[None]],
+                 flush_interval: float = 5.0, max_users: int = 10000, idle_timeout: float = 600.0):
+        self.load_func = load
+        self.save_func = save
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        self.idle_timeout = idle_timeout
+        self.application: Optional[Application] = None
+        # Загруженные пользователи -> время последнего обновления, от давних к недавним
+        self._loaded: OrderedDict[int, float] = OrderedDict()
+        # Последнее записанное состояние пользователя: запись только при изменении
+        self._saved: Dict[int, bytes] = {}
+        self._dirty: Set[int] = set()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def attach(self, application: Application):
+        self.application = application
+        application.add_handler(TypeHandler(Update, self._hydrate), group=HYDRATE_GROUP)
+        application.add_handler(TypeHandler(Update, self._touch), group=TOUCH_GROUP)
+
+    def start(self):
+        self._task = asyncio.create_task(self._periodic_flush(), name="user-state")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _hydrate(self, update: Update, context):
+        user = update.effective_user
+        if user is None:
+            return
+        user_id = user.id
+        if user_id in self._loaded:
+            self._seen(user_id)
+            self._dirty.add(user_id)
+            return
+
+        # Пока состояние не загружено, пользователь не записывается: иначе пустое состояние
+        # в памяти заменило бы сохранённое. Загрузка повторится при следующем обновлении.
+        try:
+            data = await self.load_func(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки состояния пользователя {user_id}: {e}")
+            return
+        self._seen(user_id)
+        self._dirty.add(user_id)
+        if data is None:
+            return
+
+        self._saved[user_id] = data
+        try:
+            state = pickle.loads(data)
+        except Exception as e:
+            logger.error(f"Повреждённое состояние пользователя {user_id}: {e}")
+            return
+        # Значения, появившиеся в памяти до загрузки, новее сохранённых
+        for key, value in state.items():
+            context.user_data.setdefault(key, value)
+
+    # Любое обновление может изменить user_data - проверим его при следующей записи.
+    # Отметка после обработчиков: запись могла пройти, пока обработчик ещё работал.
+    async def _touch(self, update: Update, context):
+        user = update.effective_user
+        if user is not None and user.id in self._loaded:
+            self._seen(user.id)
+            self._dirty.add(user.id)
+
+    def _seen(self, user_id: int):
+        self._loaded[user_id] = time.monotonic()
+        self._loaded.move_to_end(user_id)
+
+    # Сколько пользователей ждут проверки при следующей записи
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    # Снимок изменившихся состояний: (user_id, pickle или None для пустого состояния)
+    def _collect(self) -> List[Tuple[int, Optional[bytes]]]:
+        user_data = self.application.user_data
+        dirty, self._dirty = self._dirty, set()
+        changes = []
+        for user_id in dirty:
+            state = user_data.get(user_id)
+            try:
+                data = pickle.dumps(dict(state), pickle.HIGHEST_PROTOCOL) if state else None
+            except Exception as e:
+                logger.error(f"Не удалось сохранить состояние пользователя {user_id}: {e}")
+                continue
+            if data != self._saved.get(user_id):
+                changes.append((user_id, data))
+        return changes
+
+    async def flush(self):
+        if self.application is None:
+            return
+        async with self._lock:
+            changes = self._collect()
+            if changes:
+                try:
+                    await self.save_func(changes)
+                except Exception as e:
+                    logger.error(f"Ошибка записи состояний пользователей ({len(changes)} записей): {e}")
+                    self._dirty.update(user_id for user_id, _ in changes)
+                    return
+
+                for user_id, data in changes:
+                    if data is None:
+                        self._saved.pop(user_id, None)
+                    else:
+                        self._saved[user_id] = data
+            self._evict()
+
+    # Выгрузка давно неактивных пользователей сверх max_users. Их состояние уже записано;
+    # недавно активных не трогаем - их обработчик ещё может работать с user_data.
+    def _evict(self):
+        idle_since = time.monotonic() - self.idle_timeout
+        while len(self._loaded) > self.max_users:
+            user_id, seen = next(iter(self._loaded.items()))
+            if seen > idle_since or user_id in self._dirty:
+                break
+            del self._loaded[user_id]
+            self._saved.pop(user_id, None)
+            self.application.drop_user_data(user_id)
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
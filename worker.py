@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from repository import Shard
+
+logger = logging.getLogger(__name__)
+
+# Отдельные процессы отправки напоминаний (DELIVERY_MODE=workers у процесса бота).
+# Каждый процесс отвечает за свою часть пользователей: user_id % shards == shard.
+# Напоминания захватываются в БД атомарно, поэтому пересекающиеся процессы
+# (например, старая и новая реплика во время выкладки) не отправят одно напоминание дважды.
+#   python worker.py --shards 4             - 4 процесса на этой машине
+#   python worker.py --shard 1 --shards 4   - один процесс, например отдельная реплика
+
+DELIVERY_SHARDS = int(os.environ.get('DELIVERY_SHARDS', 1))
+
+# Как часто (в секундах) проверять, не изменил ли расписание процесс бота
+CHANGE_POLL_INTERVAL = float(os.environ.get('CHANGE_POLL_INTERVAL', 1))
+
+
+# Один процесс отправки: работает до SIGINT/SIGTERM
+async def run_worker(shard: Shard):
+    from telegram import Bot
+    from bot import BOT_API_BASE_URL, BOT_API_FILE_URL, BOT_TOKEN, async_reminder_checker, storage
+    from metrics import monitor_loop_lag
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await storage.initialize()
+    async with Bot(token=BOT_TOKEN, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_FILE_URL) as bot:
+        tasks = [
+            asyncio.create_task(async_reminder_checker(BOT_TOKEN, bot, shard, CHANGE_POLL_INTERVAL)),
+            asyncio.create_task(monitor_loop_lag()),
+        ]
+        logger.info(f"Воркер отправки {shard[0] + 1} из {shard[1]} запущен (pid {os.getpid()})")
+        stopping = asyncio.create_task(stop_event.wait())
+        await asyncio.wait([stopping, *tasks], return_when=asyncio.FIRST_COMPLETED)
+
+        stopping.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await storage.close()
+    logger.info(f"Воркер отправки {shard[0] + 1} из {shard[1]} остановлен")
+
+
+def _run_shard(shard: Shard):
+    asyncio.run(run_worker(shard))
+
+
+# Запуск процессов для всех частей и их остановка по SIGINT/SIGTERM
+def run_all(shards: int):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_run_shard, args=((index, shards),), name=f"worker-{index}")
+                 for index in range(shards)]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for process in processes:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Процессы отправки напоминаний')
+    parser.add_argument('--shards', type=int, default=DELIVERY_SHARDS, help='сколько частей пользователей всего')
+    parser.add_argument('--shard', type=int, default=None, help='номер части для одного процесса')
+    args = parser.parse_args()
+
+    if args.shard is None:
+        run_all(args.shards)
+    else:
+        if not 0 <= args.shard < args.shards:
+            parser.error('--shard должен быть от 0 до --shards - 1')
+        _run_shard((args.shard, args.shards))
+
+
+if __name__ == '__main__':
+    main()